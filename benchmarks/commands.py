@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Kitt commands engine API benchmark
+
+Runs kitt commands (`build`, non-interactive `run`, `list`, `inspect`,
+`pull`, `push` and `prune`) against a fake container engine seeded with
+local images (see benchmarks/engine.py), and reports wall time, engine API
+round-trips and bytes sent (requests and build context) for each of them.
+
+Round-trips and bytes are deterministic, so they are checked against
+budgets : exit code is 1 if any command goes over, which catches an extra
+API call per image or a bloated build context before it ships.
+
+Usage:
+    python benchmarks/commands.py [-n RUNS] [--images N] [--latency MS] [--backend async]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.engine import FakeEngine
+
+# Local kitt images, and unrelated ones, on benchmark engine
+IMAGES = 50
+OTHERS = 100
+
+# Per command budget : round-trips and bytes sent, as fixed part and part per local kitt image
+BUDGETS = {
+    'build': (10, 0, 32 * 1024, 0),
+    'run': (9, 0, 4 * 1024, 0),
+    'list': (4, 0, 1024, 0),
+    'inspect': (4, 0, 1024, 0),
+    'pull': (9, 0, 2 * 1024, 0),
+    'push': (8, 0, 2 * 1024, 0),
+    'prune': (12, 2, 2 * 1024, 512),
+}
+
+CONFIG = os.path.join(ROOT, 'examples', 'devops.toml')
+REGISTRY = 'registry.local/kitt'
+
+
+def _detached_start(client, container):
+    # Non-interactive run : container is started and waited, no TTY attached
+    client.start(container)
+    client.wait(container)
+
+
+def commands() -> list:
+    """Benchmarked commands, in run order
+
+    Returns:
+        list: command name and function of KittClient pairs
+    """
+    return [
+        ('build', lambda client: client.build('bench', CONFIG)),
+        ('run', lambda client: client.run('image0')),
+        ('list', lambda client: client.list()),
+        ('inspect', lambda client: client.inspect('image1')),
+        ('pull', lambda client: client.pull(REGISTRY, 'pulled')),
+        ('push', lambda client: client.push(REGISTRY, 'image2')),
+        ('prune', lambda client: client.prune()),
+    ]
+
+
+def measure(images: int = IMAGES, latency: float = 0, backend: str = 'docker') -> dict:
+    """Run all commands once, against a freshly seeded engine
+
+    Each command gets its own client (so its own engine connection),
+    as a CLI invocation would. User cache and data directories are
+    temporary, so nothing is shared with a real kitt setup.
+
+    Args:
+        images (int, optional): local kitt images. Defaults to IMAGES.
+        latency (float, optional): engine latency per request (s). Defaults to 0.
+        backend (str, optional): kitt engine backend. Defaults to 'docker'.
+
+    Returns:
+        dict: per command `time` (s), `requests`, `sent` and `context` (bytes) and `error`
+    """
+    import dockerpty
+    from kitt.client import KittClient
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, contextlib.ExitStack() as stack:
+        engine = stack.enter_context(FakeEngine(os.path.join(workdir, 'docker.sock'), latency))
+        engine.seed(images, others=OTHERS)
+
+        env = {
+            'DOCKER_HOST': engine.url,
+            'XDG_CACHE_HOME': os.path.join(workdir, 'cache'),
+            'XDG_DATA_HOME': os.path.join(workdir, 'data'),
+        }
+        saved = {k: os.environ.get(k) for k in env}
+        stack.callback(_restore, saved)
+        os.environ.update(env)
+
+        stack.callback(setattr, dockerpty, 'start', dockerpty.start)
+        dockerpty.start = _detached_start
+
+        for name, command in commands():
+            engine.reset()
+            error = None
+            start = time.perf_counter()
+            try:
+                with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                        contextlib.redirect_stdout(devnull):
+                    command(KittClient(backend))
+            except SystemExit as exited:
+                error = exited.code or 'exit'
+            elapsed = time.perf_counter() - start
+
+            results[name] = {
+                'time': elapsed,
+                'requests': len(engine.requests),
+                'sent': sum(x.size for x in engine.requests),
+                'context': sum(x.size for x in engine.requests if x.path == '/build'),
+                'error': error,
+            }
+
+    return results
+
+
+def over_budget(name: str, result: dict, images: int = IMAGES) -> list:
+    """Check command result against its budget
+
+    Args:
+        name (str): command name
+        result (dict): command result, from measure
+        images (int, optional): local kitt images. Defaults to IMAGES.
+
+    Returns:
+        list: budget violations, empty if within budget
+    """
+    requests, requests_per_image, sent, sent_per_image = BUDGETS[name]
+    errors = []
+    if result['error'] is not None:
+        errors.append(f'failed ({ result["error"] })')
+    if result['requests'] > (limit := requests + requests_per_image * images):
+        errors.append(f'{ result["requests"] } round-trips > { limit }')
+    if result['sent'] > (limit := sent + sent_per_image * images):
+        errors.append(f'{ result["sent"] } bytes sent > { limit }')
+    return errors
+
+
+def _restore(environ: dict):
+    for key, value in environ.items():
+        if value is None:
+            os.environ.pop(key, None)
+        else:
+            os.environ[key] = value
+
+
+def main():
+    """Benchmark entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5, help='runs per command')
+    parser.add_argument('--images', type=int, default=IMAGES, help='local kitt images')
+    parser.add_argument('--latency', type=float, default=0, help='engine latency per request (ms)')
+    parser.add_argument('--backend', choices=['docker', 'async'], default='docker', help='kitt engine backend')
+    options = parser.parse_args()
+
+    runs = [measure(options.images, options.latency / 1000, options.backend) for _ in range(options.runs)]
+
+    print(f'{"COMMAND":<10} {"TIME":>10} {"ROUND-TRIPS":>12} {"SENT":>10} {"CONTEXT":>10}  STATUS')
+    failures = 0
+    for name, _ in commands():
+        result = runs[-1][name]
+        median = statistics.median(x[name]['time'] for x in runs) * 1000
+        errors = over_budget(name, result, options.images)
+        failures += bool(errors)
+        print(f'{name:<10} {median:8.1f}ms {result["requests"]:>12} {result["sent"]:>10} '
+              f'{result["context"]:>10}  {"; ".join(errors) or "ok"}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
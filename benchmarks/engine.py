@@ -0,0 +1,596 @@
+"""Fake container engine, serving a subset of Docker Engine API
+
+Local stand-in for docker daemon, over a Unix socket : images, containers
+and registry transfers only live in memory. Every request is recorded
+(method, path, bytes sent by client), so that benchmarks and tests can
+count API round-trips and uploaded context size of kitt commands. A fixed
+latency can be added to each request, to mimic a remote or loaded engine.
+
+Usage:
+    engine = FakeEngine(socket_path, latency=0.005)
+    engine.seed(images=50)
+    engine.start()
+    os.environ['DOCKER_HOST'] = engine.url
+"""
+
+import io
+import os
+import json
+import time
+import fnmatch
+import hashlib
+import tarfile
+import threading
+import socketserver
+
+from urllib.parse import parse_qs, unquote, urlsplit
+from http.server import BaseHTTPRequestHandler
+
+API_VERSION = '1.43'
+
+# Layers sent by fake registry on pull / push, as (id, size)
+LAYERS = [('a1b2c3d4e5f6', 3 * 2 ** 20), ('b2c3d4e5f6a1', 28 * 2 ** 20), ('c3d4e5f6a1b2', 512)]
+
+# Local images layers, as (diff id, size) : base image ones, then ones shared by kitt images
+BASE_LAYERS = [('sha256:' + hashlib.sha256(b'ubuntu').hexdigest(), 78 * 2 ** 20)]
+KITT_LAYERS = [
+    ('sha256:' + hashlib.sha256(b'prebuild').hexdigest(), 12 * 2 ** 20),
+    ('sha256:' + hashlib.sha256(b'nix').hexdigest(), 420 * 2 ** 20),
+]
+
+# Dockerfile instructions, build steps are counted from them
+INSTRUCTIONS = ('FROM', 'RUN', 'COPY', 'ADD', 'ENV', 'ARG', 'USER', 'WORKDIR', 'LABEL',
+                'ENTRYPOINT', 'CMD', 'SHELL', 'EXPOSE', 'VOLUME')
+
+
+class Request:
+    """Recorded API request"""
+
+    def __init__(self, method: str, path: str, size: int):
+        self.method = method
+        self.path = path
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f'{ self.method } { self.path } ({ self.size } bytes)'
+
+
+class FakeEngine:
+    """In-memory container engine, serving Engine API on a Unix socket"""
+
+    def __init__(self, path: str, latency: float = 0):
+        """Init
+
+        Args:
+            path (str): Unix socket path
+            latency (float, optional): delay added to each request (s). Defaults to 0.
+        """
+        self.path = path
+        self.latency = latency
+        self.requests = []
+        self.images = {}
+        self.containers = {}
+        self.layers = {}
+        self.events = []
+        self.lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        """Engine address, as expected in DOCKER_HOST"""
+        return f'unix://{ self.path }'
+
+    def seed(self, images: int = 20, repository: str = 'kitt', others: int = 0):
+        """Add local images
+
+        Args:
+            images (int, optional): kitt images count. Defaults to 20.
+            repository (str, optional): kitt images repository. Defaults to 'kitt'.
+            others (int, optional): unrelated images count. Defaults to 0.
+        """
+        config = json.dumps({'user': 'user', 'hostname': 'kitt', 'shell': 'bash', 'vault': ''})
+        self.add_image('ubuntu:22.04', {}, BASE_LAYERS)
+        for index in range(images):
+            self.add_image(f'{ repository }:image{ index }', {'kitt-config': config})
+        for index in range(others):
+            self.add_image(f'library/other{ index }:latest', {}, [(_digest(f'other{ index }'), 64 * 2 ** 20)])
+
+    def add_image(self, reference: str, labels: dict, layers: list = None) -> str:
+        """Add local image, moving tag if it exists
+
+        Args:
+            reference (str): image name and tag
+            labels (dict): image labels
+            layers (list, optional): diff id and size pairs. Defaults to a kitt image ones.
+
+        Returns:
+            str: image id
+        """
+        with self.lock:
+            return self.store(reference, labels, layers)
+
+    def store(self, reference: str, labels: dict, layers: list = None) -> str:
+        """Add local image, engine lock must be held
+
+        Args:
+            reference (str): image name and tag
+            labels (dict): image labels
+            layers (list, optional): diff id and size pairs. Defaults to a kitt image ones,
+                                     with a layer of its own.
+
+        Returns:
+            str: image id
+        """
+        own = _digest(f'{ reference }{ json.dumps(labels, sort_keys=True) }')
+        layers = layers or BASE_LAYERS + KITT_LAYERS + [(own, 40 * 2 ** 20)]
+        image = _digest(f'{ own }{ layers }')
+
+        self._untag(reference)
+        self.layers.update(layers)
+        self.images.setdefault(image, {
+            'Id': image,
+            'RepoTags': [],
+            'RepoDigests': [],
+            'Labels': labels,
+            'Layers': [x for x, _ in layers],
+            'Size': sum(x for _, x in layers),
+            'Created': int(time.time()),
+        })['RepoTags'].append(reference)
+        self.emit('image', 'tag', image)
+        return image
+
+    def reset(self):
+        """Forget recorded requests"""
+        with self.lock:
+            self.requests = []
+
+    def start(self):
+        """Serve API in a background thread"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        handler = type('Handler', (_Handler,), {'engine': self})
+        self._server = _Server(self.path, handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stop serving, remove socket"""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def resolve(self, name: str) -> dict:
+        """Find local image by id, short id or reference
+
+        Args:
+            name (str): image id or reference (tag defaults to latest)
+
+        Returns:
+            dict: image, None if not found
+        """
+        if name in self.images:
+            return self.images[name]
+        if ':' not in name.rsplit('/', 1)[-1]:
+            name += ':latest'
+        for image in self.images.values():
+            if name in image['RepoTags'] or image['Id'].startswith(f'sha256:{ name }'):
+                return image
+        return None
+
+    def emit(self, kind: str, action: str, actor: str):
+        """Record engine event, reported by events endpoint
+
+        Args:
+            kind (str): event type (`image`, `container`)
+            action (str): event action (ex. `tag`, `delete`)
+            actor (str): image or container id
+        """
+        self.events.append({'Type': kind, 'Action': action, 'Actor': {'ID': actor},
+                            'time': int(time.time())})
+
+    def _untag(self, reference: str):
+        for image in self.images.values():
+            if reference in image['RepoTags']:
+                image['RepoTags'].remove(reference)
+                self.emit('image', 'untag', image['Id'])
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Concurrent clients open many connections at once, as engines allow
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Engine API routes, kept to what docker client sends for kitt commands"""
+
+    engine = None
+    protocol_version = 'HTTP/1.1'
+
+    ROUTES = [
+        ('GET', '/_ping', '_ping'),
+        ('HEAD', '/_ping', '_ping'),
+        ('GET', '/version', '_version'),
+        ('GET', '/info', '_info'),
+        ('GET', '/events', '_events'),
+        ('GET', '/images/json', '_images'),
+        ('POST', '/images/prune', '_images_prune'),
+        ('GET', '/system/df', '_system_df'),
+        ('GET', '/images/*/history', '_image_history'),
+        ('POST', '/images/create', '_images_create'),
+        ('GET', '/images/*/json', '_image_inspect'),
+        ('POST', '/images/*/tag', '_image_tag'),
+        ('POST', '/images/*/push', '_image_push'),
+        ('DELETE', '/images/*', '_image_delete'),
+        ('GET', '/distribution/*/json', '_distribution'),
+        ('POST', '/build', '_build'),
+        ('POST', '/commit', '_commit'),
+        ('GET', '/containers/json', '_containers'),
+        ('POST', '/containers/create', '_container_create'),
+        ('GET', '/containers/*/json', '_container_inspect'),
+        ('POST', '/containers/*/start', '_container_start'),
+        ('POST', '/containers/*/wait', '_container_wait'),
+        ('POST', '/containers/*/stop', '_container_stop'),
+        ('DELETE', '/containers/*', '_container_delete'),
+    ]
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_HEAD(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_DELETE(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path)
+        # Versioned API prefix (/v1.43/...) is optional
+        if path.startswith('/v') and path.count('/') > 1:
+            path = '/' + path.split('/', 2)[2]
+        self.query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        self.body = self._read_body()
+
+        size = len(self.raw_requestline) + len(bytes(self.headers)) + len(self.body)
+        with self.engine.lock:
+            self.engine.requests.append(Request(self.command, path, size))
+        if self.engine.latency:
+            time.sleep(self.engine.latency)
+
+        for method, pattern, route in self.ROUTES:
+            if method == self.command and fnmatch.fnmatchcase(path, pattern):
+                # Image references hold slashes, route argument is everything in between
+                prefix, _, suffix = pattern.partition('*')
+                arg = path[len(prefix):len(path) - len(suffix)] if _ else None
+                with self.engine.lock:
+                    getattr(self, route)(*([arg] if _ else []))
+                return
+        self._json(404, {'message': f'page not found : { self.command } { path }'})
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = io.BytesIO()
+            while size := int(self.rfile.readline().split(b';')[0], 16):
+                body.write(self.rfile.read(size))
+                self.rfile.readline()
+            self.rfile.readline()
+            return body.getvalue()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _json(self, status: int, data=None):
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _stream(self, events: list):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for event in events:
+            data = json.dumps(event).encode() + b'\r\n'
+            self.wfile.write(f'{ len(data) :x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _not_found(self, name: str):
+        self._json(404, {'message': f'No such image: { name }'})
+
+    # System
+
+    def _ping(self):
+        self.send_response(200)
+        self.send_header('Api-Version', API_VERSION)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(b'OK')
+
+    def _version(self):
+        self._json(200, {'Version': '24.0.0', 'ApiVersion': API_VERSION, 'MinAPIVersion': '1.12',
+                         'Os': 'linux', 'Arch': 'amd64'})
+
+    def _info(self):
+        self._json(200, {'ExperimentalBuild': True, 'Images': len(self.engine.images),
+                         'Containers': len(self.engine.containers)})
+
+    def _events(self):
+        since = int(self.query.get('since') or 0)
+        until = int(self.query.get('until') or time.time())
+        self._stream([x for x in self.engine.events if since <= x['time'] <= until])
+
+    # Images
+
+    def _images(self):
+        filters = json.loads(self.query.get('filters', '{}'))
+        references = filters.get('reference', [])
+        labels = filters.get('label', [])
+        references = [references] if isinstance(references, str) else list(references)
+        labels = [labels] if isinstance(labels, str) else list(labels)
+
+        def matches(image):
+            if references and not any(
+                fnmatch.fnmatchcase(tag, ref if ':' in ref else f'{ ref }:*')
+                for tag in image['RepoTags'] for ref in references
+            ):
+                return False
+            for label in labels:
+                key, _, value = label.partition('=')
+                if key not in image['Labels'] or (_ and image['Labels'][key] != value):
+                    return False
+            return True
+
+        self._json(200, [
+            {**image, 'RepoTags': list(image['RepoTags']), 'RepoDigests': list(image['RepoDigests']),
+             'ParentId': '', 'Containers': -1}
+            for image in self.engine.images.values() if matches(image)
+        ])
+
+    def _image_inspect(self, name: str):
+        if not (image := self.engine.resolve(name)):
+            return self._not_found(name)
+        self._json(200, {
+            'Id': image['Id'],
+            'RepoTags': list(image['RepoTags']),
+            'Size': image['Size'],
+            'Created': image['Created'],
+            'Config': {'Labels': image['Labels']},
+            'RootFS': {'Type': 'layers', 'Layers': list(image['Layers'])},
+        })
+
+    def _image_history(self, name: str):
+        if not (image := self.engine.resolve(name)):
+            return self._not_found(name)
+        history = [{'Id': '<missing>', 'CreatedBy': 'ENV HOME=/home/user', 'Size': 0}]
+        for index, layer in reversed(list(enumerate(image['Layers']))):
+            history.append({'Id': '<missing>', 'CreatedBy': f'RUN step { index }',
+                            'Size': self.engine.layers[layer]})
+        self._json(200, history)
+
+    def _system_df(self):
+        users = {}
+        for image in self.engine.images.values():
+            for layer in image['Layers']:
+                users[layer] = users.get(layer, 0) + 1
+        containers = list(self.engine.containers.values())
+
+        self._json(200, {
+            'LayersSize': sum(self.engine.layers[x] for x in users),
+            'Images': [
+                {
+                    'Id': image['Id'],
+                    'RepoTags': list(image['RepoTags']),
+                    'Labels': image['Labels'],
+                    'Size': image['Size'],
+                    'SharedSize': sum(self.engine.layers[x] for x in image['Layers'] if users[x] > 1),
+                    'Containers': sum(x['ImageID'] == image['Id'] for x in containers),
+                    'Created': image['Created'],
+                }
+                for image in self.engine.images.values()
+            ],
+            'Containers': [{'Id': x['Id'], 'ImageID': x['ImageID']} for x in containers],
+            'Volumes': [],
+            'BuildCache': [],
+        })
+
+    def _image_tag(self, name: str):
+        if not (image := self.engine.resolve(name)):
+            return self._not_found(name)
+        reference = f'{ self.query["repo"] }:{ self.query.get("tag") or "latest" }'
+        self.engine._untag(reference)
+        image['RepoTags'].append(reference)
+        self.engine.emit('image', 'tag', image['Id'])
+        self._json(201)
+
+    def _image_delete(self, name: str):
+        if not (image := self.engine.resolve(name)):
+            return self._not_found(name)
+        if name in image['RepoTags'] or f'{ name }:latest' in image['RepoTags']:
+            image['RepoTags'].remove(name if name in image['RepoTags'] else f'{ name }:latest')
+            deleted = [{'Untagged': name}]
+        else:
+            image['RepoTags'] = []
+            deleted = []
+        if not image['RepoTags']:
+            del self.engine.images[image['Id']]
+            self.engine.emit('image', 'delete', image['Id'])
+            deleted.append({'Deleted': image['Id']})
+        self._json(200, deleted)
+
+    def _images_prune(self):
+        dangling = [x for x in self.engine.images.values() if not x['RepoTags']]
+        for image in dangling:
+            del self.engine.images[image['Id']]
+            self.engine.emit('image', 'delete', image['Id'])
+        self._json(200, {
+            'ImagesDeleted': [{'Deleted': x['Id']} for x in dangling],
+            'SpaceReclaimed': sum(x['Size'] for x in dangling),
+        })
+
+    def _distribution(self, name: str):
+        digest = 'sha256:' + hashlib.sha256(name.encode()).hexdigest()
+        self._json(200, {
+            'Descriptor': {'mediaType': 'application/vnd.oci.image.index.v1+json',
+                           'digest': digest, 'size': 1024},
+            'Platforms': [{'architecture': 'amd64', 'os': 'linux'}],
+        })
+
+    def _images_create(self):
+        reference = f'{ self.query["fromImage"] }:{ self.query.get("tag") or "latest" }'
+        labels = {'kitt-config': json.dumps({'user': 'user', 'hostname': 'kitt', 'vault': ''})}
+        image = self.engine.store(reference, labels, [(_digest(x), size) for x, size in LAYERS])
+        # Manifest digest, as reported by distribution endpoint
+        self.engine.images[image]['RepoDigests'] = [f'{ self.query["fromImage"] }@{ _digest(reference) }']
+        self._stream(_transfer('Pull complete', 'Downloading', f'Pulling from { reference }'))
+
+    def _image_push(self, name: str):
+        reference = f'{ name }:{ self.query.get("tag") or "latest" }'
+        if not (image := self.engine.resolve(reference)):
+            return self._not_found(reference)
+        if (digest := f'{ name }@{ _digest(reference) }') not in image['RepoDigests']:
+            image['RepoDigests'].append(digest)
+        self._stream(_transfer('Pushed', 'Pushing', f'The push refers to repository [{ name }]'))
+
+    def _build(self):
+        dockerfile = ''
+        with tarfile.open(fileobj=io.BytesIO(self.body)) as tar:
+            if member := tar.extractfile(self.query.get('dockerfile', 'Dockerfile')):
+                dockerfile = member.read().decode()
+        steps = [x.strip() for x in dockerfile.splitlines() if x.split(' ', 1)[0] in INSTRUCTIONS]
+
+        tag = self.query.get('t', 'latest')
+        labels = json.loads(self.query.get('labels', '{}'))
+        layers = None
+        # Config only build (ex. labels patch) keeps base image layers and labels
+        if len(steps) == 1 and (base := self.engine.resolve(steps[0].split()[-1])):
+            layers = [(x, self.engine.layers[x]) for x in base['Layers']]
+            labels = {**base['Labels'], **labels}
+        image = self.engine.images[self.engine.store(tag, labels, layers)]
+
+        events = []
+        for index, step in enumerate(steps):
+            events.append({'stream': f'Step { index + 1 }/{ len(steps) } : { step }\n'})
+            events.append({'stream': f' ---> { image["Id"][7:19] }\n'})
+        events.append({'aux': {'ID': image['Id']}})
+        events.append({'stream': f'Successfully built { image["Id"][7:19] }\n'})
+        self._stream(events)
+
+    def _commit(self):
+        container = self.engine.containers.get(self.query.get('container'))
+        if not container:
+            return self._json(404, {'message': 'No such container'})
+        base = self.engine.resolve(container['ImageID'])
+        config = json.loads(self.body or b'{}')
+        labels = {**base['Labels'], **(config.get('Labels') or {})}
+        reference = f'{ self.query["repo"] }:{ self.query.get("tag") or "latest" }'
+        # Commit adds an empty layer on top of image ones
+        layers = [(x, self.engine.layers[x]) for x in base['Layers']] + [(_digest(reference), 0)]
+        self._json(201, {'Id': self.engine.store(reference, labels, layers)})
+
+    # Containers
+
+    def _containers(self):
+        filters = json.loads(self.query.get('filters', '{}'))
+        labels = filters.get('label', [])
+        labels = [labels] if isinstance(labels, str) else list(labels)
+
+        def matches(container):
+            for label in labels:
+                key, _, value = label.partition('=')
+                if key not in container['Labels'] or (_ and container['Labels'][key] != value):
+                    return False
+            return container['Running']
+
+        self._json(200, [
+            {'Id': x['Id'], 'ImageID': x['ImageID'], 'Labels': x['Labels'], 'Names': [x['Name']]}
+            for x in self.engine.containers.values() if matches(x)
+        ])
+
+    def _container_create(self):
+        config = json.loads(self.body or b'{}')
+        if not (image := self.engine.resolve(config.get('Image', ''))):
+            return self._not_found(config.get('Image'))
+        container = hashlib.sha256(f'{ len(self.engine.requests) }'.encode()).hexdigest()
+        self.engine.containers[container] = {
+            'Id': container,
+            'Name': '/' + self.query.get('name', container[:12]),
+            'Image': config['Image'],
+            'ImageID': image['Id'],
+            'Labels': config.get('Labels') or {},
+            'AutoRemove': (config.get('HostConfig') or {}).get('AutoRemove', False),
+            'Running': False,
+        }
+        self.engine.emit('container', 'create', container)
+        self._json(201, {'Id': container, 'Warnings': []})
+
+    def _container_inspect(self, container: str):
+        if not (info := self.engine.containers.get(container)):
+            return self._json(404, {'message': f'No such container: { container }'})
+        self._json(200, {
+            'Id': info['Id'], 'Name': info['Name'], 'Image': info['ImageID'],
+            'Config': {'Image': info['Image'], 'Labels': info['Labels']},
+            'State': {'Running': info['Running']},
+        })
+
+    def _container_start(self, container: str):
+        if not (info := self.engine.containers.get(container)):
+            return self._json(404, {'message': f'No such container: { container }'})
+        info['Running'] = True
+        self.engine.emit('container', 'start', container)
+        self._json(204)
+
+    def _container_wait(self, container: str):
+        # Containers exit as soon as they are waited for
+        self._container_exit(container)
+        self._json(200, {'StatusCode': 0})
+
+    def _container_stop(self, container: str):
+        self._container_exit(container)
+        self._json(204)
+
+    def _container_exit(self, container: str):
+        if (info := self.engine.containers.get(container)) and info['Running']:
+            info['Running'] = False
+            self.engine.emit('container', 'die', container)
+            if info['AutoRemove']:
+                del self.engine.containers[container]
+
+    def _container_delete(self, container: str):
+        if self.engine.containers.pop(container, None) is None:
+            return self._json(404, {'message': f'No such container: { container }'})
+        self._json(204)
+
+
+def _digest(value: str) -> str:
+    return 'sha256:' + hashlib.sha256(value.encode()).hexdigest()
+
+
+def _transfer(done: str, progress: str, header: str) -> list:
+    """Registry transfer stream events, as reported by engine"""
+    events = [{'status': header}]
+    for layer, size in LAYERS:
+        events.append({'status': progress, 'id': layer,
+                       'progressDetail': {'current': size // 2, 'total': size}})
+        events.append({'status': progress, 'id': layer,
+                       'progressDetail': {'current': size, 'total': size}})
+        events.append({'status': done, 'id': layer, 'progressDetail': {}})
+    return events
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Kitt CLI startup time benchmark
+
+Spawns a fresh interpreter for every kitt subcommand that can run without
+side effects (`version`, `completion` and each `--help`) and reports the
+median wall time, along with heavy backend modules that got imported.
+
+Docker daemon is pointed to a missing socket, so any command that tries
+to connect shows up as a failure instead of silently paying a round-trip.
+
+Usage:
+    python benchmarks/startup.py [-n RUNS]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = [
+    'docker',
+    'dockerpty',
+    'jinja2',
+    'rich',
+    'toml',
+    'cryptography',
+]
+
+COMMANDS = [
+    ['--help'],
+    ['version'],
+    ['completion', 'bash'],
+    ['agent', '--help'],
+    ['agent', 'lock', '--help'],
+    ['agent', 'stop', '--help'],
+    ['attach', '--help'],
+    ['build', '--help'],
+    ['completion', '--help'],
+    ['inspect', '--help'],
+    ['list', '--help'],
+    ['patch', '--help'],
+    ['prune', '--help'],
+    ['pull', '--help'],
+    ['push', '--help'],
+    ['refresh', '--help'],
+    ['remove', '--help'],
+    ['run', '--help'],
+    ['stop', '--help'],
+    ['version', '--help'],
+    ['warm', '--help'],
+]
+
+# Runs kitt entrypoint, then reports which heavy modules were loaded
+PROBE = f'''
+import sys, json, atexit
+atexit.register(lambda: sys.__stderr__.write(
+    "\\nKITT_MODULES=" + json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)) + "\\n"))
+import kitt
+kitt.main()
+'''
+
+
+def probe(args: list) -> tuple:
+    """Run kitt once in a fresh interpreter
+
+    Args:
+        args (list): kitt command line arguments
+
+    Returns:
+        tuple: wall time (s), exit code, imported heavy modules
+    """
+    env = {**os.environ, 'DOCKER_HOST': 'unix:///nonexistent/docker.sock'}
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-c', PROBE, *args],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+    elapsed = time.perf_counter() - start
+
+    modules = []
+    for line in proc.stderr.decode('utf-8', 'replace').splitlines():
+        if line.startswith('KITT_MODULES='):
+            modules = json.loads(line[len('KITT_MODULES='):])
+
+    return elapsed, proc.returncode, modules
+
+
+def probe_python() -> float:
+    """Bare interpreter startup time, as a reference
+
+    Returns:
+        float: wall time (s)
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    """Benchmark entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=10, help='runs per command')
+    options = parser.parse_args()
+
+    baseline = statistics.median(
+        probe_python() for _ in range(options.runs))
+    print(f'{"python -c pass":<24} {baseline * 1000:8.1f} ms')
+
+    failures = 0
+    for args in COMMANDS:
+        times, code, modules = [], 0, []
+        for _ in range(options.runs):
+            elapsed, code, modules = probe(args)
+            times.append(elapsed)
+        failures += code != 0
+        median = statistics.median(times) * 1000
+        status = 'ok' if code == 0 else f'exit {code}'
+        print(f'{"kitt " + " ".join(args):<24} {median:8.1f} ms  {status:<7} '
+              f'{", ".join(modules) or "-"}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
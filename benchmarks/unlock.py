@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Kitt vault unlock latency benchmark
+
+Measures key derivation time for each scrypt cost setting, then the full
+unlock (key derivation and decryption of a vault holding a secret file of
+given size) with parameters calibrated for the budget, which is what a
+`kitt run` pays on top of container startup (without unlock agent).
+
+Usage:
+    python benchmarks/unlock.py [-n RUNS] [--size MB] [--budget SECONDS]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import statistics
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from kitt.crypto import SCRYPT_MAX_N, SCRYPT_MIN_N, SCRYPT_R, calibrate_kdf, derive_key
+from kitt.vault import VaultFS, dump_vault, read_vault
+
+PASSWORD = 'kitt benchmark password'
+
+
+def measure(func, runs: int) -> float:
+    """Median wall time of func
+
+    Args:
+        func (Callable): function to time
+        runs (int): number of runs
+
+    Returns:
+        float: median wall time (s)
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def unlock(vault: bytes):
+    """Unlock vault once, as `kitt run` does
+
+    Args:
+        vault (bytes): encrypted vault
+    """
+    vault_fs = VaultFS()
+    try:
+        if read_vault(io.BytesIO(vault), PASSWORD, vault_fs) is None:
+            raise RuntimeError('Could not unlock benchmark vault')
+    finally:
+        vault_fs.close()
+
+
+def main():
+    """Benchmark entrypoint"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=5, help='runs per setting')
+    parser.add_argument('--size', type=float, default=1, help='secret file size (MB)')
+    parser.add_argument('--budget', type=float, default=0.5, help='unlock budget (s)')
+    options = parser.parse_args()
+
+    n = SCRYPT_MIN_N
+    while n <= SCRYPT_MAX_N:
+        kdf = {'name': 'scrypt', 'salt': 'AAAAAAAAAAAAAAAAAAAAAA==', 'n': n, 'r': SCRYPT_R, 'p': 1}
+        elapsed = measure(lambda kdf=kdf: derive_key(PASSWORD, kdf), options.runs)
+        memory = 128 * SCRYPT_R * n // (1024 * 1024)
+        print(f'scrypt n=2**{ n.bit_length() - 1 :<3} {memory:5d} MiB {elapsed * 1000:9.1f} ms  '
+              f'{"ok" if elapsed <= options.budget else "over budget"}')
+        n *= 2
+
+    with tempfile.NamedTemporaryFile() as secret:
+        secret.write(os.urandom(int(options.size * 1000 * 1000)))
+        secret.flush()
+
+        kdf = calibrate_kdf(options.budget)
+        output = io.BytesIO()
+        config = {'files': [{'src': secret.name, 'dest': '/secret'}]}
+        dump_vault(config, PASSWORD, output, kdf)
+
+    elapsed = measure(lambda: unlock(output.getvalue()), options.runs)
+    print(f'unlock {options.size:g} MB (n=2**{ kdf["n"].bit_length() - 1 }, p={ kdf["p"] })'
+          f'{elapsed * 1000:9.1f} ms  budget {options.budget * 1000:.0f} ms')
+
+    # Calibration aims at budget, some slack is left for decryption
+    sys.exit(0 if elapsed <= options.budget * 1.5 else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Kitt vault unlock agent
+
+Per-user daemon (ssh-agent like) caching vault keys, so that successive
+`kitt run` of a vaulted image neither prompt for password nor derive key
+again. Only derived keys are cached (never passwords nor secrets), for a
+limited time, in memory locked out of swap.
+
+Clients talk JSON lines over a Unix socket, in a private directory,
+and peer user is checked on each connection.
+"""
+
+import os
+import json
+import time
+import ctypes
+import socket
+import struct
+import base64
+import tempfile
+import socketserver
+
+from kitt.logger import success, info, warning, panic
+from kitt.profiler import traced
+
+# Cached keys lifetime, in seconds
+DEFAULT_TTL = 3600
+
+# Client side, an agent not answering in time is ignored
+TIMEOUT = 2.0
+
+
+def socket_path() -> str:
+    """Agent socket path, in user runtime directory
+
+    Returns:
+        str: Unix socket path
+    """
+    if runtime := os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(runtime, 'kitt', 'agent.sock')
+    return os.path.join(tempfile.gettempdir(), f'kitt-{ os.getuid() }', 'agent.sock')
+
+
+def get_key(vault_id: str) -> bytes:
+    """Get cached vault key
+
+    Args:
+        vault_id (str): vault identifier
+
+    Returns:
+        bytes: vault key, None if not cached or no agent running
+    """
+    response = request({'op': 'get', 'id': vault_id}) or {}
+    if key := response.get('key'):
+        return base64.b64decode(key)
+    return None
+
+
+def put_key(vault_id: str, key: bytes):
+    """Cache vault key, if an agent is running
+
+    Args:
+        vault_id (str): vault identifier
+        key (bytes): vault key
+    """
+    request({'op': 'put', 'id': vault_id, 'key': base64.b64encode(key).decode('utf-8')})
+
+
+@traced('agent.request')
+def request(message: dict) -> dict:
+    """Send request to agent
+
+    Args:
+        message (dict): request, with its `op`
+
+    Returns:
+        dict: agent response, None if no agent is running
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(socket_path())
+            sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as stream:
+                return json.loads(stream.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def start(ttl: int = DEFAULT_TTL, foreground: bool = False):
+    """Start agent, detached from terminal unless foreground
+
+    Args:
+        ttl (int, optional): cached keys lifetime (s). Defaults to DEFAULT_TTL.
+        foreground (bool, optional): do not detach. Defaults to False.
+    """
+    if request({'op': 'ping'}) is not None:
+        info('Agent already running')
+        return
+
+    path = socket_path()
+    try:
+        _private_dir(os.path.dirname(path))
+        if os.path.exists(path):
+            os.unlink(path)
+        server = AgentServer(path, ttl)
+    except OSError as error:
+        panic(f'Could not start agent : { error }')
+
+    if not foreground:
+        if os.fork():
+            success(f'Agent started (keys kept { ttl }s)')
+            return
+        os.setsid()
+        with open(os.devnull, 'rb+') as devnull:
+            for stream in (0, 1, 2):
+                os.dup2(devnull.fileno(), stream)
+
+    _harden()
+    try:
+        server.serve()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    if not foreground:
+        os._exit(0)
+
+
+def lock():
+    """Drop all cached keys"""
+    if request({'op': 'lock'}) is None:
+        warning('No agent running')
+        return
+    success('Agent locked !')
+
+
+def stop():
+    """Stop agent (cached keys are dropped)"""
+    if request({'op': 'stop'}) is None:
+        warning('No agent running')
+        return
+    success('Agent stopped !')
+
+
+class AgentServer(socketserver.UnixStreamServer):
+    """Agent Unix socket server, serves one short request at a time"""
+
+    # Expired keys are purged at least this often (s)
+    timeout = 1.0
+
+    def __init__(self, path: str, ttl: int = DEFAULT_TTL):
+        self.ttl = ttl
+        self.keys = {}
+        self.stopped = False
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+    def serve(self):
+        """Handle requests until stopped"""
+        while not self.stopped:
+            self.handle_request()
+            self.purge()
+
+    def dispatch(self, message: dict) -> dict:
+        """Handle one request
+
+        Args:
+            message (dict): request
+
+        Returns:
+            dict: response
+        """
+        self.purge()
+        operation = message['op']
+
+        if operation == 'ping':
+            return {}
+
+        if operation == 'get':
+            if entry := self.keys.get(message['id']):
+                return {'key': base64.b64encode(entry[0]).decode('utf-8')}
+            return {}
+
+        if operation == 'put':
+            self.forget(message['id'])
+            key = bytearray(base64.b64decode(message['key']))
+            _mlock(key)
+            self.keys[message['id']] = (key, time.monotonic() + self.ttl)
+            return {}
+
+        if operation in ('lock', 'stop'):
+            for vault_id in list(self.keys):
+                self.forget(vault_id)
+            self.stopped = operation == 'stop'
+            return {}
+
+        raise ValueError(f'Unknown operation { operation }')
+
+    def purge(self):
+        """Drop expired keys"""
+        now = time.monotonic()
+        for vault_id, (_, expires) in list(self.keys.items()):
+            if expires <= now:
+                self.forget(vault_id)
+
+    def forget(self, vault_id: str):
+        """Wipe cached key
+
+        Args:
+            vault_id (str): vault identifier
+        """
+        if entry := self.keys.pop(vault_id, None):
+            key = entry[0]
+            key[:] = bytes(len(key))
+            _mlock(key, lock=False)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    # A stalled client must not hang the agent
+    timeout = TIMEOUT
+
+    def handle(self):
+        if not _same_user(self.request):
+            return
+
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except (ValueError, KeyError, TypeError) as error:
+                response = {'error': str(error)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def _same_user(sock: socket.socket) -> bool:
+    # Socket directory is private, peer credentials are checked on top when available
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+
+def _private_dir(path: str):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    stat = os.lstat(path)
+    if not os.path.isdir(path) or os.path.islink(path) or stat.st_uid != os.getuid():
+        raise PermissionError(f'{ path } is not a directory owned by current user')
+    if stat.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def _libc():
+    try:
+        return ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+
+
+def _harden():
+    # Best effort : keys must neither end up in core dumps nor be readable
+    # by other processes of the same user (ptrace)
+    PR_SET_DUMPABLE = 4
+    if (libc := _libc()) and hasattr(libc, 'prctl'):
+        libc.prctl(PR_SET_DUMPABLE, 0, 0, 0, 0)
+
+
+def _mlock(buffer: bytearray, lock: bool = True):
+    # Best effort, memory locking is subject to RLIMIT_MEMLOCK
+    if not buffer or not (libc := _libc()):
+        return
+    address = ctypes.addressof((ctypes.c_char * len(buffer)).from_buffer(buffer))
+    func = libc.mlock if lock else libc.munlock
+    func(ctypes.c_void_p(address), ctypes.c_size_t(len(buffer)))
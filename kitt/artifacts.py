@@ -0,0 +1,164 @@
+"""Local content-addressed cache of plugins artifacts
+
+Artifacts pinned by content (downloads with a `sha256`, git repositories
+with a `rev`) are fetched on host once, then copied from build context, so
+that later builds neither hit the network nor invalidate docker layer cache.
+"""
+
+import os
+import hashlib
+import tarfile
+import tempfile
+import subprocess
+import urllib.request
+
+from kitt.config import ConfigUtils
+
+# Network operations give up after this delay (s)
+TIMEOUT = 30
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class ArtifactError(Exception):
+    """Artifact could not be fetched or does not match its pin"""
+
+
+class ArtifactCache:
+    """On-disk artifacts cache
+
+    Layout:
+        sha256/<hex>    files, named after their content digest
+        git/<hex>.git   bare mirrors, named after their URL digest
+        git/<commit>    checkouts, named after their commit id
+    """
+
+    DIR = 'artifacts'
+
+    def __init__(self, path: str = None):
+        self.path = path or ConfigUtils.cachepath(self.DIR)
+
+    def fetch(self, url: str, sha256: str) -> str:
+        """Get file by its content digest, downloaded only if not cached yet
+
+        Args:
+            url (str): file URL
+            sha256 (str): expected content digest (hex)
+
+        Raises:
+            ArtifactError: download failed or content does not match digest
+
+        Returns:
+            str: cached file path
+        """
+        sha256 = sha256.lower()
+        if sha256.startswith('sha256:'):
+            sha256 = sha256[len('sha256:'):]
+        path = os.path.join(self.path, 'sha256', sha256)
+        if os.path.isfile(path):
+            return path
+
+        try:
+            with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+                return self._store(path, iter(lambda: response.read(_CHUNK_SIZE), b''), sha256)
+        except OSError as error:
+            raise ArtifactError(f'Cannot download { url } : { error }') from error
+
+    def store(self, data: bytes) -> str:
+        """Add content to cache
+
+        Args:
+            data (bytes): file content
+
+        Returns:
+            str: cached file path
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.path, 'sha256', sha256)
+        if os.path.isfile(path):
+            return path
+        return self._store(path, [data], sha256)
+
+    def checkout(self, url: str, rev: str) -> str:
+        """Get repository tree at given revision (without history), cloned only if not cached yet
+
+        Args:
+            url (str): repository URL
+            rev (str): commit id, tag or branch
+
+        Raises:
+            ArtifactError: git failed or revision does not exist
+
+        Returns:
+            str: cached checkout directory
+        """
+        root = os.path.join(self.path, 'git')
+        if _is_commit(rev) and os.path.isdir(path := os.path.join(root, rev.lower())):
+            return path
+
+        mirror = os.path.join(root, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.git')
+        if os.path.isdir(mirror):
+            _git('fetch', '--quiet', '--prune', 'origin', cwd=mirror)
+        else:
+            os.makedirs(root, exist_ok=True)
+            _git('clone', '--quiet', '--mirror', url, mirror)
+
+        commit = _git('rev-parse', '--verify', f'{ rev }^{{commit}}', cwd=mirror)
+        path = os.path.join(root, commit)
+        if os.path.isdir(path):
+            return path
+
+        # Only tree is exported, repository history is never copied in image
+        tmp = tempfile.mkdtemp(dir=root, prefix='.checkout-')
+        archive = f'{ tmp }.tar'
+        try:
+            _git('archive', '--format=tar', f'--output={ archive }', commit, cwd=mirror)
+            with tarfile.open(archive) as tar:
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extractall(tmp, filter='data')
+                else:
+                    tar.extractall(tmp)
+        finally:
+            if os.path.exists(archive):
+                os.remove(archive)
+        os.rename(tmp, path)
+        return path
+
+    @staticmethod
+    def _store(path: str, chunks, sha256: str) -> str:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        hasher = hashlib.sha256()
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with open(fd, 'wb') as file:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    file.write(chunk)
+            if hasher.hexdigest() != sha256:
+                raise ArtifactError(f'Checksum mismatch, got sha256:{ hasher.hexdigest() }')
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+        return path
+
+
+def _is_commit(rev: str) -> bool:
+    return len(rev) == 40 and all(c in '0123456789abcdef' for c in rev.lower())
+
+
+def _git(*args: str, cwd: str = None) -> str:
+    try:
+        result = subprocess.run(
+            ['git', *args], cwd=cwd, capture_output=True, check=True,
+            text=True, timeout=TIMEOUT * 10)
+    except FileNotFoundError as error:
+        raise ArtifactError('git is required on host to pin repositories') from error
+    except subprocess.CalledProcessError as error:
+        raise ArtifactError(f'git { args[0] } failed : { error.stderr.strip() }') from error
+    except subprocess.TimeoutExpired as error:
+        raise ArtifactError(f'git { args[0] } timed out') from error
+    return result.stdout.strip()
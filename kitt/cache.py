@@ -0,0 +1,78 @@
+"""Content-addressed build cache helpers"""
+
+import os
+import json
+import hashlib
+
+from kitt.profiler import traced
+
+DIGEST_LABEL = 'kitt-digest'
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+@traced('build.digest')
+def build_digest(dockerfile: str, config: dict, sources: list = None) -> str:
+    """Digest of everything a kitt build depends on.
+
+    Args:
+        dockerfile (str): rendered Dockerfile (includes plugins output)
+        config (dict): image runtime config (kitt-config label, without vault)
+        sources (list, optional): local paths copied inside image. Defaults to None.
+
+    Returns:
+        str: build digest, as `sha256:<hex>`
+    """
+    hasher = hashlib.sha256()
+    _update(hasher, b'dockerfile', dockerfile.encode('utf-8'))
+    _update(hasher, b'config', json.dumps(config, sort_keys=True).encode('utf-8'))
+
+    for source in sources or []:
+        _update(hasher, b'source', source.encode('utf-8'))
+        hash_path(source, hasher)
+
+    return 'sha256:' + hasher.hexdigest()
+
+
+def hash_path(path: str, hasher: 'hashlib._Hash'):
+    """Feed file or directory tree (names, modes and content) to hasher.
+
+    Directory entries are walked in sorted order so digest does not
+    depend on filesystem listing order.
+
+    Args:
+        path (str): file or directory path
+        hasher (hashlib._Hash): hash object to update
+    """
+    if os.path.islink(path):
+        _update(hasher, b'link', os.readlink(path).encode('utf-8'))
+        return
+
+    if os.path.isfile(path):
+        _update(hasher, b'mode', oct(os.stat(path).st_mode & 0o777).encode())
+        _hash_file(path, hasher)
+        return
+
+    if not os.path.isdir(path):
+        _update(hasher, b'missing', path.encode('utf-8'))
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files + [d for d in dirs if os.path.islink(os.path.join(root, d))]):
+            fpath = os.path.join(root, name)
+            _update(hasher, b'entry', os.path.relpath(fpath, path).encode('utf-8'))
+            hash_path(fpath, hasher)
+
+
+def _hash_file(path: str, hasher: 'hashlib._Hash'):
+    size = os.path.getsize(path)
+    hasher.update(b'file:%d:' % size)
+    with open(path, 'rb') as file:
+        while chunk := file.read(_CHUNK_SIZE):
+            hasher.update(chunk)
+
+
+def _update(hasher: 'hashlib._Hash', kind: bytes, data: bytes):
+    # Length prefixed records, so that no two inputs collide once concatenated
+    hasher.update(kind + b':%d:' % len(data) + data)
@@ -3,17 +3,14 @@
 import os
 import grp
 import json
+import time
 import tempfile
 import subprocess
 
 from typing import Tuple
 from pwd import getpwnam
 
-from kitt import plugins
 from kitt.__version__ import __version__
-from kitt.config import ConfigUtils
-from kitt.images import DockerImageManager, Composer
-from kitt.vault import create_vault, load_vault, VaultFS
 from kitt import logger
 from kitt.logger import (
     success,
@@ -22,36 +19,210 @@ from kitt.logger import (
     waiter,
     panic,
 )
+from kitt.profiler import traced
+
+# Container engine backends : docker-py, or asyncio Engine API client (Docker or Podman socket)
+BACKENDS = ['docker', 'async']
+
+# Nix store layering modes: one layer for the whole closure,
+# or one layer per tool closure (shared across images)
+NIX_LAYERS = ['single', 'tools']
+
+# Keep clear of overlayfs max layer depth (127)
+MAX_TOOL_LAYERS = 100
+
+# Registry each pulled image comes from, used by refresh
+ORIGINS = 'origins.json'
+
+# Pinned Nix packages set, so that tools only change with the pin
+NIXPKGS = 'https://github.com/NixOS/nixpkgs/archive/refs/tags/22.11.tar.gz'
+
+# Local image keeping Nix store (and nixpkgs tarball) across builds
+NIX_CACHE = ('kitt-cache', 'nix')
+NIX_CACHE_LABEL = 'kitt-nix-cache'
 
 
 class KittClient:
-    """Kitt Client"""
+    """Kitt Client
+
+    Image composer and image manager are created on first use, so that
+    each command only imports (and connects to) the backends it needs.
+    """
 
-    def __init__(self):
-        template = ConfigUtils.mkpath('static/Dockerfile.j2')
-        self.image_composer = Composer(template)
-        self.image_manager = DockerImageManager(logger)
+    def __init__(self, backend: str = 'docker'):
+        """Init
+
+        Args:
+            backend (str, optional): container engine backend, one of BACKENDS. Defaults to 'docker'.
+        """
+        self.backend = backend
+        self._image_composer = None
+        self._image_manager = None
+        self._index = None
+
+    @property
+    def image_composer(self):
+        """Dockerfile composer, only required by build"""
+        if self._image_composer is None:
+            from kitt.config import ConfigUtils
+            from kitt.images import Composer
+
+            template = ConfigUtils.mkpath('static/Dockerfile.j2')
+            self._image_composer = Composer(template)
+        return self._image_composer
+
+    @property
+    def image_manager(self):
+        """Container engine image manager"""
+        if self._image_manager is None:
+            from kitt.images import AsyncImageManager, DockerImageManager
+
+            manager = AsyncImageManager if self.backend == 'async' else DockerImageManager
+            self._image_manager = manager(logger)
+        return self._image_manager
+
+    @property
+    def index(self):
+        """Local kitt images metadata index, synced on first use"""
+        if self._index is None:
+            from kitt.index import ImageIndex
+
+            self._index = ImageIndex('kitt')
+            self._index.sync(self.image_manager)
+        return self._index
 
     def run(self, name: str, extras: dict = None):
         """Run kitt shell
 
+        If a session of this image is running, shell is spawned inside it,
+        which skips vault unlock and container startup. With `keep` extra,
+        a session is started and left running after shell exits.
+
         Args:
             name (str): kitt image specifier
             extras (dict, optional): extras runtime configurations. Defaults to None.
         """
-        if not self.image_manager.stat('kitt', name):
+        if not self.index.lookup(name):
+            panic(f'Image { name } not found. Use `pull` command first.')
+
+        extras = extras or {}
+        config = self._config(name) or {}
+
+        if session := self.image_manager.session(name):
+            if any(extras.get(x) for x in ('volumes', 'run_as', 'dind', 'secrets')):
+                warning('Session already running, runtime options are ignored')
+            self._attach(name, session, config)
+            return
+
+        keep = extras.get('keep', False)
+        options, vault_fs = self._prepare(name, config, extras, keep)
+
+        if keep:
+            session = self.image_manager.spawn(
+                'kitt', name, vault=vault_fs and vault_fs.fs_root, **options)
+            self._attach(name, session, config)
+            return
+
+        self.index.touch(name)
+        self.image_manager.run(
+            name='kitt',
+            tag=name,
+            command=config.get('command', 'bash'),
+            **options,
+        )
+
+        if vault_fs:
+            vault_fs.close()
+
+    def attach(self, name: str):
+        """Spawn shell in running kitt session
+
+        Args:
+            name (str): kitt image specifier
+        """
+        if not (session := self.image_manager.session(name)):
+            panic(f'No running session for { name }. Use `run --keep` or `warm` command first.')
+
+        self._attach(name, session, self._config(name) or {})
+
+    def warm(self, name: str, extras: dict = None):
+        """Start kitt session in background, for later shells to start instantly
+
+        Args:
+            name (str): kitt image specifier
+            extras (dict, optional): extras runtime configurations. Defaults to None.
+        """
+        if not self.index.lookup(name):
             panic(f'Image { name } not found. Use `pull` command first.')
 
+        if self.image_manager.session(name):
+            info(f'Session { name } already running')
+            return
+
+        config = self._config(name) or {}
+        options, vault_fs = self._prepare(name, config, extras or {}, keep=True)
+
+        with waiter(f'Starting session "{ name }"'):
+            self.image_manager.spawn(
+                'kitt', name, vault=vault_fs and vault_fs.fs_root, **options)
+
+        success(f'Session { name } ready !')
+
+    def stop(self, name: str):
+        """Stop running kitt session
+
+        Args:
+            name (str): kitt image specifier
+        """
+        from kitt.vault import VaultFS
+
+        if not (session := self.image_manager.session(name)):
+            panic(f'No running session for { name }')
+
+        with waiter(f'Stopping session "{ name }"'):
+            self.image_manager.stop(session)
+
+        if session['vault']:
+            VaultFS.discard(session['vault'])
+
+        success('Done !')
+
+    def _attach(self, name: str, session: dict, config: dict):
+        """Spawn shell in session container
+
+        Args:
+            name (str): kitt image specifier
+            session (dict): running session
+            config (dict): image config metadata
+        """
+        image = self.index.lookup(name)
+        if image and image['id'] != session['image']:
+            warning(f'Session runs a previous { name } image, use `stop` command to restart it')
+
+        self.index.touch(name)
+        self.image_manager.attach(session, config.get('command', 'bash'))
+
+    @traced('run.prepare')
+    def _prepare(self, name: str, config: dict, extras: dict, keep: bool = False) -> tuple:
+        """Container runtime options (user, volumes, environment, vault)
+
+        Args:
+            name (str): kitt image specifier
+            config (dict): image config metadata
+            extras (dict): extras runtime configurations
+            keep (bool, optional): vault files outlive kitt process. Defaults to False.
+
+        Returns:
+            tuple: container create options, vault filesystem (or None)
+        """
         envs = {}
         volumes = {}
         groups = []
 
         user_uid = os.getuid()
-        user_gid = os.getuid()
+        user_gid = os.getgid()
         user_home = os.environ.get('HOME')
 
-        extras = extras or {}
-
         if username := extras.get('run_as'):
             try:
                 user = getpwnam(username)
@@ -60,7 +231,6 @@ class KittClient:
             except KeyError:
                 panic(f'Could not get "{ username }" user infos')
 
-        config = self._config(name)
         hostname = config.get('hostname', 'kitt')
 
         if config.get('dind') or extras.get('dind'):
@@ -81,17 +251,25 @@ class KittClient:
             volumes[host] = {'bind': bind, 'mode': mode}
 
         vault_fs = None
-        while str_vault := config.get('vault'):
-            vault = load_vault(str_vault)
-            if not vault:
+        secrets = extras.get('secrets')
+        if vault := config.get('vault'):
+            from kitt.vault import load_vault, VaultFS
+
+            # Legacy images embed vault in label, others only reference it
+            if isinstance(vault, dict):
+                vault = self._vault(name, vault)
+
+            vault_fs = VaultFS(persistent=keep)
+            if not vault or (vault_envs := load_vault(vault, vault_fs, secrets)) is None:
                 warning('Invalid password or corrupted vault')
-                break
-            envs = {**envs, **vault.get('envs', {})}
-            if files := vault.get('files'):
-                vault_fs = VaultFS()
-                volumes_fs = vault_fs.load(files)
-                volumes = {**volumes, **volumes_fs}
-            break
+                vault_envs, vault_fs.volumes = {}, {}
+            envs = {**envs, **vault_envs}
+            volumes = {**volumes, **vault_fs.volumes}
+            # Nothing to mount, drop (possibly partially written) files
+            if not vault_fs.volumes:
+                vault_fs.close()
+                VaultFS.discard(vault_fs.fs_root)
+                vault_fs = None
 
         # As container network is in host mode, will exploit Xorg
         # abstract socket instead of /tmp/.X11-unix socket
@@ -105,46 +283,237 @@ class KittClient:
                     stderr=subprocess.STDOUT
                 )
 
-        self.image_manager.run(
-            name='kitt',
-            tag=name,
-            hostname=hostname,
-            volumes=volumes,
-            environment=envs,
-            cap_add=['CAP_NET_RAW', 'CAP_NET_ADMIN', 'CAP_IPC_LOCK'],
-            extra_hosts={hostname: '127.0.0.1'},
-            command=config.get('command', 'bash'),
-            group_add=groups,
-            user=f'{ user_uid }:{ user_gid }',
-        )
+        options = {
+            'hostname': hostname,
+            'volumes': volumes,
+            'environment': envs,
+            'cap_add': ['CAP_NET_RAW', 'CAP_NET_ADMIN', 'CAP_IPC_LOCK'],
+            'extra_hosts': {hostname: '127.0.0.1'},
+            'group_add': groups,
+            'user': f'{ user_uid }:{ user_gid }',
+        }
 
-        if vault_fs:
-            vault_fs.close()
+        return options, vault_fs
 
-    def build(self, name: str, config_file: str):
+    def build(self, name: str, config_file: str, nocache: bool = False, explain: bool = False,
+              builder: str = None, cache_dir: str = None):
         """Build kitt image using provided config file
 
+        Build inputs (Dockerfile, runtime config and copied files) are hashed
+        and stored as image label. If an image with the same digest already
+        exists, it is reused instead of rebuilt. Images with secrets are always
+        rebuilt, as vault is encrypted again (docker layer cache still applies).
+
         Args:
             name (str): kitt image name
             config_file (str): config file path
-            catalog (str): custom catalog file
+            nocache (bool, optional): ignore build and layer cache. Defaults to False.
+            explain (bool, optional): only show plugins layer plan. Defaults to False.
+            builder (str, optional): image builder, overrides config. Defaults to None.
+            cache_dir (str, optional): BuildKit local cache directory. Defaults to None.
         """
+        if not (job := self._plan(name, config_file, nocache, explain, builder, cache_dir)):
+            return
+
+        if job['cached']:
+            success('Image is up to date, build skipped !')
+            return
+
+        if job['builder'] == 'legacy' and job['squash'] and not self.image_manager.experimental:
+            warning(
+                'Docker is not in experimental mode, which is required to squash layers.')
+            warning(
+                'To significantly reduce image size, please consider enabling it (or use BuildKit builder).')
+
+        # Vault file stays in build context until nix cache is updated
+        try:
+            with waiter('Building image'):
+                stats = self._build(job) or {}
+
+            if job['nix_cache'] is not None and job['tools'] \
+                    and not set(job['tools']) <= set(job['nix_cache']['tools']):
+                with waiter('Updating nix cache'):
+                    self._update_nix_cache(job)
+        finally:
+            self._close_vault(job)
+
+        success(f'Build success ! ({ job["builder"] }, { _cache_rate(stats) } cached)')
+
+    def batch(self, images: list, jobs: int = 4, nocache: bool = False, explain: bool = False,
+              builder: str = None, cache_dir: str = None):
+        """Build many kitt images concurrently
+
+        Images are prepared one after another (vault passwords are prompted
+        in order), stages shared by all images are built once per builder,
+        then images are built concurrently, reusing them even without cache.
+        Nix cache is updated last, once per image.
+
+        Args:
+            images (list): kitt image name and config file path pairs
+            jobs (int, optional): concurrent image builds. Defaults to 4.
+            nocache (bool, optional): ignore build and layer cache. Defaults to False.
+            explain (bool, optional): only show plugins layer plan. Defaults to False.
+            builder (str, optional): image builder, overrides config. Defaults to None.
+            cache_dir (str, optional): BuildKit local cache directory. Defaults to None.
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        names = [name for name, _ in images]
+        if len(set(names)) != len(names):
+            panic('Image names must be unique')
+
+        planned, results = [], {}
+        for name, config_file in images:
+            started = time.monotonic()
+            if explain:
+                info(f'➜ { name }')
+            if not (job := self._plan(name, config_file, nocache, explain, builder, cache_dir)):
+                continue
+            if job['cached']:
+                results[name] = {'status': 'up to date', 'time': time.monotonic() - started,
+                                 'builder': '-', **job['cached']}
+            else:
+                planned.append(job)
+
+        if explain:
+            return
+
+        # Vault files stay in build contexts until nix cache is updated
+        try:
+            if planned:
+                # Shared stage would otherwise be built by every concurrent build, once per
+                # builder. Container builder (with a cache directory) does not reuse built
+                # image, but its own layer cache.
+                with waiter('Building shared stages'):
+                    for job in {(job['builder'], job['cache_dir']): job for job in planned}.values():
+                        self.image_manager.build(
+                            NIX_CACHE[0], job['template'], 'prebuild', pull=False,
+                            nocache=nocache, target='prebuild', builder=job['builder'],
+                            cache_dir=job['cache_dir'])
+
+            # Without cache, images stages are still rebuilt (cache is busted by
+            # build arg) but shared stage just built is reused
+            rebuild = {'KITT_REBUILD': str(time.time_ns())} if nocache else {}
+            for job in planned:
+                job.update(nocache=False, buildargs={**job['buildargs'], **rebuild})
+
+            with waiter(f'Building { len(planned) } image(s)'), ThreadPoolExecutor(jobs) as pool:
+                futures = {pool.submit(self._timed_build, job): job for job in planned}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    results[job['name']] = result = future.result()
+                    if result['status'] == 'failed':
+                        warning(f'{ job["name"] } build failed')
+                    else:
+                        info(f'✓ { job["name"] } built in { result["time"] :.1f}s')
+
+            built = [job for job in planned if results[job['name']]['status'] == 'built']
+            # Nix cache is only used (and updated) by builds which see local images
+            if updates := [job for job in built if job['nix_cache'] is not None
+                           and not set(job['tools']) <= set(job['nix_cache']['tools'])]:
+                with waiter('Updating nix cache'):
+                    for job in updates:
+                        # Previous updates moved cache, so that tools add up
+                        job.update(self._nix_base(job['nixpkgs']))
+                        job['buildargs'].update(rebuild)
+                        if not set(job['tools']) <= set(job['nix_cache']['tools']):
+                            self._update_nix_cache(job)
+        finally:
+            for job in planned:
+                self._close_vault(job)
+
+        info(f'{ "IMAGE" :<20} { "STATUS" :<11} { "BUILDER" :<9} { "TIME" :>7} { "SIZE" :>9} { "CACHE" :>6}')
+        for name, _ in images:
+            if not (result := results.get(name)):
+                continue
+            size = _human_size(result['size']) if result.get('size') else '-'
+            info(f'{ name :<20} { result["status"] :<11} { result["builder"] :<9} '
+                 f'{ result["time"] :>6.1f}s { size :>9} { _cache_rate(result) :>6}')
+
+        if any(result['status'] == 'failed' for result in results.values()):
+            panic('Some images could not be built')
+        success('Build success !')
+
+    @traced('build.plan')
+    def _plan(self, name: str, config_file: str, nocache: bool = False, explain: bool = False,
+              builder: str = None, cache_dir: str = None) -> dict:
+        """Prepare kitt image build : Dockerfile, context, labels and vault
+
+        Args:
+            name (str): kitt image name
+            config_file (str): config file path
+            nocache (bool, optional): ignore build and layer cache. Defaults to False.
+            explain (bool, optional): only show plugins layer plan. Defaults to False.
+            builder (str, optional): image builder, overrides config. Defaults to None.
+            cache_dir (str, optional): BuildKit local cache directory. Defaults to None.
+
+        Returns:
+            dict: build job, `cached` is set when an up to date image was found. None if explained.
+        """
+        from kitt import dockerfile, plugins
+        from kitt.cache import DIGEST_LABEL, build_digest
+        from kitt.config import ConfigUtils
+        from kitt.images import BUILDERS, BuildContext
+        from kitt.vault import VAULT_PATH, create_vault
 
         config = ConfigUtils.load(config_file)
         workspace = config.get('workspace')
         options = config.get('options')
 
+        if (builder := builder or options.get('builder', 'legacy')) not in BUILDERS:
+            warning(f'Unknown builder "{ builder }", using "legacy"')
+            builder = 'legacy'
+
+        if cache_dir and builder != 'buildkit':
+            warning('Build cache directory requires BuildKit builder, ignored')
+            cache_dir = None
+
+        tools = workspace.get('tools', [])
+        nix_layers = options.get('nix_layers', 'single')
+
+        if nix_layers not in NIX_LAYERS:
+            warning(f'Unknown nix_layers mode "{ nix_layers }", using "single"')
+            nix_layers = 'single'
+
+        if nix_layers == 'tools' and len(tools) > MAX_TOOL_LAYERS:
+            warning(f'Too many tools for one layer each (max { MAX_TOOL_LAYERS }), using "single"')
+            nix_layers = 'single'
+
         context = {
             'user': workspace.get('user', 'user'),
             'shell': workspace.get('default_shell', 'bash'),
-            'tools': workspace.get('tools', []),
+            'tools': tools,
+            'nix_layers': nix_layers,
+            'nixpkgs': workspace.get('nixpkgs', NIXPKGS),
             'envs': workspace.get('envs', []),
             'paths': workspace.get('paths', []),
             'image': workspace.get('image', 'ubuntu:22.04'),
-            'plugins': [plugins.compose(n, c) for n, c in config.get('plugins', {}).items()],
+            'plugins': [],
         }
 
-        template = self.image_composer.compose(context)
+        build_context = BuildContext()
+        for plugin, plugin_config in config.get('plugins', {}).items():
+            plugin_config = plugins.prepare(plugin, plugin_config, build_context)
+            plugin_config = {'buildkit': builder == 'buildkit', **plugin_config}
+            context['plugins'].append((plugin, plugins.compose(plugin, plugin_config)))
+
+        if explain:
+            self._compose(context, options)
+            for line in dockerfile.explain(self.image_composer.plan):
+                info(line)
+            return None
+
+        sources = [path for path, _ in build_context.sources]
+        secrets = config.get('secrets', {})
+
+        # Vault is copied in last layer, label only references it
+        vault, vault_file = '', None
+        if secrets:
+            vault_file = tempfile.NamedTemporaryFile(prefix='kitt-vault-')
+            vault = {'path': VAULT_PATH, 'digest': create_vault(secrets, vault_file, options.get('vault_unlock_time', 0.5))}
+            context['vault'] = {'source': build_context.add(vault_file.name), **vault}
+
+        template = self._compose(context, options)
         volumes = {}
 
         if options.get('docker_in_docker'):
@@ -162,9 +531,6 @@ class KittClient:
 
             volumes[host] = {'bind': bind, 'mode': mode}
 
-        secrets = config.get('secrets', {})
-        str_vault = create_vault(secrets) if secrets else ''
-
         bind_config = {
             'entrypoint':    "fixuid -q",
             'bind_volumes':  volumes,
@@ -173,28 +539,132 @@ class KittClient:
             'hostname':      workspace.get('hostname'),
             'command':       workspace.get('default_shell'),
             'user':          workspace.get('user'),
-            'vault':         str_vault,
+            'vault':         bool(secrets),
             'version':       'v' + __version__,
         }
 
-        if not self.image_manager.experimental:
-            warning(
-                'Docker is not in experimental mode, which is required to squash layers.')
-            warning(
-                'To significantly reduce image size, please consider enabling it.')
+        digest = build_digest(template, bind_config, sources)
+        job = {'name': name, 'cached': None}
+
+        if not nocache and not secrets:
+            if cached := self.image_manager.find({DIGEST_LABEL: digest}):
+                if f'kitt:{ name }' not in cached['tags']:
+                    self.image_manager.tag(cached['id'], 'kitt', name)
+                job['cached'] = {'size': cached.get('size', 0)}
+                return job
+
+        bind_config['vault'] = vault
+
+        return {
+            **job,
+            'template': template,
+            'context': build_context,
+            'labels': {
+                'kitt-config': json.dumps(bind_config),
+                DIGEST_LABEL: digest,
+            },
+            'nocache': nocache,
+            # Squashing would merge tools store layers back into one
+            'squash': nix_layers != 'tools',
+            'builder': builder,
+            'cache_dir': cache_dir,
+            'tools': tools,
+            'nixpkgs': context['nixpkgs'],
+            'vault_file': vault_file,
+            **self._nix_base(context['nixpkgs'], nocache, cache_dir),
+        }
 
-        with waiter('Building image'):
-            labels = {'kitt-config': json.dumps(bind_config)}
+    def _nix_base(self, nixpkgs: str, nocache: bool = False, cache_dir: str = None) -> dict:
+        """Nix builder stage base image
 
-            self.image_manager.build(
-                'kitt', template, name, labels=labels, pull=False)
+        Nix builder stage starts from previous builds store, when it is built
+        from same nixpkgs (template only differs by build arg).
 
-        success('Build success !')
+        Args:
+            nixpkgs (str): pinned nix packages
+            nocache (bool, optional): ignore nix cache. Defaults to False.
+            cache_dir (str, optional): BuildKit local cache directory. Defaults to None.
+
+        Returns:
+            dict: job `buildargs` and `nix_cache` (its tools, empty if not used,
+                  None if it can not be used nor updated)
+        """
+        # Container builder (required by cache directory) can not see local images
+        if cache_dir:
+            return {'buildargs': {}, 'nix_cache': None}
+        nix_cache = None if nocache else self._nix_cache()
+        if nix_cache and nix_cache.get('nixpkgs') == nixpkgs:
+            return {'buildargs': {'NIX_IMAGE': ':'.join(NIX_CACHE)}, 'nix_cache': nix_cache}
+        return {'buildargs': {}, 'nix_cache': {'tools': []}}
+
+    def _build(self, job: dict) -> dict:
+        """Build planned kitt image
+
+        Args:
+            job (dict): build job
+
+        Returns:
+            dict: built image stats
+        """
+        return self.image_manager.build(
+            'kitt', job['template'], job['name'], labels=job['labels'], pull=False,
+            nocache=job['nocache'], squash=job['squash'], context=job['context'], target='runtime',
+            buildargs=job['buildargs'], builder=job['builder'], cache_dir=job['cache_dir'])
+
+    def _close_vault(self, job: dict):
+        """Delete build job vault temporary file, once image and nix cache are built
+
+        Args:
+            job (dict): build job
+        """
+        if job['vault_file']:
+            job['vault_file'].close()
+            job['vault_file'] = None
+
+    def _timed_build(self, job: dict) -> dict:
+        """Build planned kitt image, engine errors are reported instead of exiting
+
+        Args:
+            job (dict): build job
+
+        Returns:
+            dict: build `status`, wall `time` and image stats
+        """
+        started = time.monotonic()
+        try:
+            stats = self._build(job) or {}
+            status = 'built'
+        except SystemExit:
+            stats, status = {}, 'failed'
+        return {'status': status, 'time': time.monotonic() - started, 'builder': job['builder'], **stats}
+
+    def _update_nix_cache(self, job: dict):
+        """Store built image tools in nix cache image
+
+        Args:
+            job (dict): build job
+        """
+        cached_tools = set(job['nix_cache']['tools'])
+        labels = {
+            NIX_CACHE_LABEL: json.dumps({
+                'nixpkgs': job['nixpkgs'],
+                'tools': sorted(cached_tools | set(job['tools'])),
+            }),
+        }
+
+        self.image_manager.build(
+            NIX_CACHE[0], job['template'], NIX_CACHE[1], labels=labels, pull=False,
+            context=job['context'], target='nixcache', buildargs=job['buildargs'],
+            builder=job['builder'], cache_dir=job['cache_dir'])
 
     def list(self):
         """List local kitt images
         """
-        self.image_manager.list(repository='kitt')
+        for tag in self.index.tags():
+            image = self.index.lookup(tag)
+            last_run = _human_time(image['last_run']) if image['last_run'] else 'never'
+            info(f'➜ { tag :<20} { _human_size(image["size"]) :>9}   '
+                 f'built { _human_time(image["created"]) }, last run { last_run }')
 
     def remove(self, name: str):
         """Remove local kitt image
@@ -203,19 +673,89 @@ class KittClient:
             name (str): image name
         """
         self.image_manager.remove('kitt', name)
+        self._forget_origin(name)
         success('Done !')
 
-    def prune(self):
-        """Prune force all kitt images
+    def prune(self, dry_run: bool = False, jobs: int = 8):
+        """Remove all local kitt images, nix cache and previous (untagged) builds
+
+        Removal plan (images, layers kept as shared with other images, and
+        reclaimable space) is computed first, then images are removed
+        concurrently. Other images, and kitt images used by a container,
+        are left untouched.
+
+        Args:
+            dry_run (bool, optional): only show plan. Defaults to False.
+            jobs (int, optional): concurrent removals. Defaults to 8.
         """
+        with waiter('Planning prune'):
+            plan = self.image_manager.plan_prune(['kitt', NIX_CACHE[0]], ['kitt-config', NIX_CACHE_LABEL])
+
+        for image in plan['in_use']:
+            warning(f'{ ", ".join(image["tags"]) or image["id"][7:19] } is used by a container, kept')
+
+        if not plan['images'] and not plan['untag']:
+            info('Nothing to prune')
+            return
+
+        if dry_run:
+            for image in plan['images']:
+                name = ', '.join(image['tags']) or f'{ image["id"][7:19] } (previous build)'
+                info(f'➜ { name :<40} { _human_size(image["size"]) :>9}')
+            for tag in plan['untag']:
+                info(f'➜ { tag :<40} { "untag" :>9}')
+
+        info(f'{ len(plan["images"]) } image(s) to remove, { len(plan["untag"]) } to untag, '
+             f'{ plan["shared"] } shared layer(s) kept, { _human_size(plan["reclaimable"]) } reclaimable')
+        if dry_run:
+            return
+
         with waiter('Removing local images'):
-            self.image_manager.prune('kitt')
+            result = self.image_manager.prune(plan, jobs)
+
+        failed = set(result['failed'])
+        tags = [x for image in plan['images'] if image['id'] not in failed for x in image['tags']]
+        tags += [x for x in plan['untag'] if x not in failed]
+        self._forget_origin(*(x[len('kitt:'):] for x in tags if x.startswith('kitt:')))
+        if failed:
+            warning(f'{ len(failed) } removal(s) failed (--debug)')
+
+        removed = sum(x['id'] not in failed for x in plan['images'])
+        success(f'{ removed } image(s) removed, { _human_size(result["reclaimed"]) } reclaimed')
 
-    def refresh(self):
+    def refresh(self, jobs: int = 4):
         """Pull latest version of local kitt images
+
+        Only images with a known origin registry whose remote digest changed
+        are pulled again. Origin is recorded by `kitt pull`, otherwise it
+        comes from image registry digest (images pulled by older kitt
+        versions, or pushed ones).
+
+        Args:
+            jobs (int, optional): concurrent image updates. Defaults to 4.
         """
-        with waiter('Updating local images'):
-            self.image_manager.refresh('kitt')
+        from kitt.config import ConfigUtils
+
+        origins, skipped = ConfigUtils.load_data(ORIGINS), []
+        for image in self.image_manager.list('kitt'):
+            for name in (x[len('kitt:'):] for x in image['tags'] if x.startswith('kitt:')):
+                if name in origins:
+                    continue
+                if origin := _digest_origin(image):
+                    origins[name] = origin
+                else:
+                    skipped.append(name)
+
+        if skipped:
+            info(f'No known registry for { ", ".join(sorted(skipped)) }, skipped (push or pull it first)')
+        if not origins:
+            info('No pulled image to refresh')
+            return
+
+        updated = self.image_manager.refresh('kitt', origins, jobs)
+        ConfigUtils.save_data(ORIGINS, {**origins, **updated})
+
+        success(f'{ len(updated) } image(s) updated !')
 
     def pull(self, repository: str, tag: str):
         """Pull remote kitt image from repository
@@ -229,16 +769,25 @@ class KittClient:
             warning('Tag "latest" is deprecated.')
             warning('Use kitt image descriptor instead (Ex. "devops").')
 
-        with waiter(f'Pulling image { tag } from registry'):
-            self.image_manager.pull(repository, tag, 'kitt')
+        from kitt.config import ConfigUtils
+
+        pulled = self.image_manager.pull(repository, tag, 'kitt')
 
         self.image_manager.remove(repository, tag)
 
+        origins = ConfigUtils.load_data(ORIGINS)
+        origins[tag] = {
+            'repository': repository,
+            'digest': pulled['digest'],
+            'image': pulled['id'],
+        }
+        ConfigUtils.save_data(ORIGINS, origins)
+
         labels = self.image_manager.labels('kitt', tag)
         if 'kitt-config' not in labels:
             warning('Image does not look like a kitt image')
 
-        success('Pull done !')
+        success(f'Pull done !{ _transfer_rate(pulled) }')
 
     def push(self, repository: str, name: str):
         """Push local kitt image to remote repository
@@ -250,10 +799,9 @@ class KittClient:
         if not self.image_manager.stat('kitt', name):
             panic(f'Image { name } not found')
 
-        with waiter(f'Pushing image { name }'):
-            self.image_manager.push(repository, 'kitt', name)
+        pushed = self.image_manager.push(repository, 'kitt', name)
 
-        success('Push done !')
+        success(f'Push done !{ _transfer_rate(pushed) }')
 
     def inspect(self, name: str):
         """Show image runtime configuration metadata
@@ -271,17 +819,24 @@ class KittClient:
     def patch(self, name: str):
         """Quick patch runtime kitt configuration (avoid rebuild)
 
+        Only image config is rewritten, all layers are shared with original
+        image, which tag is replaced. Vault is kept out of the editor and
+        always preserved.
+
         Args:
             name (str): image name
         """
+        from kitt.cache import DIGEST_LABEL
+
         if not (config := self._config(name)):
             panic('Could not load image config metadata')
 
-        config = json.dumps(config, indent=4)
+        vault = config.pop('vault', '')
+        original = config
 
         fd, fname = tempfile.mkstemp()
         with open(fd, 'w', encoding='utf-8') as tmpfile:
-            tmpfile.write(config)
+            json.dump(config, tmpfile, indent=4)
 
         editor = os.environ.get('EDITOR', 'vi')
         subprocess.call(
@@ -289,23 +844,95 @@ class KittClient:
             shell=True
         )
 
-        with open(fname, 'r', encoding='utf-8') as tmpfile:
-            config = json.dumps(json.load(tmpfile))
+        try:
+            with open(fname, 'r', encoding='utf-8') as tmpfile:
+                config = json.load(tmpfile)
+        except json.decoder.JSONDecodeError:
+            panic('Invalid JSON config, image left untouched')
+        finally:
+            os.unlink(fname)
 
-        # !! Make sure kitt-vault is preserved
-        # !! Image dockerfile better generation
-        with waiter(f'Building patched image "{ name }-patch"'):
-            self.image_manager.build(
+        if config == original:
+            info('Nothing to patch')
+            return
+
+        config['vault'] = vault
+
+        with waiter(f'Patching image "{ name }"'):
+            self.image_manager.relabel(
                 name='kitt',
-                template=f'FROM kitt:{ name }',
-                tag=f'{ name }-patch',
-                labels={'kitt-config': config},
-                squash=False,
+                tag=name,
+                # Patched image must not be mistaken for a build cache hit
+                labels={'kitt-config': json.dumps(config), DIGEST_LABEL: ''},
             )
 
-        os.unlink(fname)
         success('Patch success !')
 
+    def _vault(self, name: str, reference: dict):
+        """Fetch vault file from image
+
+        Args:
+            name (str): kitt image specifier
+            reference (dict): vault `path` and `digest`
+
+        Returns:
+            IO[bytes]: vault file, None if it does not match digest
+        """
+        from kitt.vault import vault_digest
+
+        fileobj = self.image_manager.read_file('kitt', name, reference['path'])
+        if vault_digest(fileobj) != reference.get('digest'):
+            return None
+
+        fileobj.seek(0)
+        return fileobj
+
+    def _forget_origin(self, *names: str):
+        """Drop registry origin of removed image(s)
+
+        Args:
+            *names (str): image names.
+        """
+        from kitt.config import ConfigUtils
+
+        origins = ConfigUtils.load_data(ORIGINS)
+        if not [origins.pop(name) for name in names if name in origins]:
+            return
+
+        ConfigUtils.save_data(ORIGINS, origins)
+
+    def _compose(self, context: dict, options: dict) -> str:
+        """Render image Dockerfile
+
+        Args:
+            context (dict): templating values
+            options (dict): config options
+
+        Returns:
+            str: Dockerfile
+        """
+        from kitt.templates import TemplateError
+
+        try:
+            return self.image_composer.compose(context, options.get('optimize_layers', True))
+        except TemplateError as error:
+            panic(f'Cannot render Dockerfile : { error }')
+
+    def _nix_cache(self) -> dict:
+        """Local nix cache image metadata
+
+        Returns:
+            dict: cached `nixpkgs` and `tools`, None if there is no cache image
+        """
+        tag = ':'.join(NIX_CACHE)
+        for image in self.image_manager.list(NIX_CACHE[0]):
+            if tag in image['tags']:
+                try:
+                    return json.loads(image['labels'][NIX_CACHE_LABEL])
+                except (KeyError, json.decoder.JSONDecodeError):
+                    return None
+        return None
+
     def _config(self, name: str) -> dict:
         """Kitt image config metadata
 
@@ -315,17 +942,39 @@ class KittClient:
         Returns:
             dict: JSON loaded config
         """
+        if not (image := self.index.lookup(name)):
+            panic(f'Image { name } not found')
 
-        labels = self.image_manager.labels('kitt', name)
-        if 'kitt-config' not in labels:
-            return None
+        return image['config']
 
-        labels = labels.get('kitt-config')
 
-        try:
-            return json.loads(labels)
-        except json.decoder.JSONDecodeError:
-            return None
+def load_manifest(path: str) -> list:
+    """Load batch build manifest
+
+    Manifest lists `[[images]]` tables with image `name` and `config` file
+    path, relative to manifest directory.
+
+    Args:
+        path (str): manifest file path (toml)
+
+    Returns:
+        list: kitt image name and config file path pairs
+    """
+    import toml
+
+    try:
+        manifest = toml.load(path)
+    except (OSError, toml.TomlDecodeError) as error:
+        panic(f'Could not load manifest : { error }')
+
+    images = []
+    for image in manifest.get('images', []):
+        if not image.get('name') or not image.get('config'):
+            panic(f'Bad manifest image entry : "{ image }"')
+        config = os.path.join(os.path.dirname(os.path.abspath(path)), image['config'])
+        images.append((image['name'], config))
+
+    return images
 
 
 # Where should I put you ??
@@ -355,4 +1004,44 @@ def unpack_volume(volume: str) -> Tuple[str, str, str]:
     return host, bind, mode
 
 
-client = KittClient()
+def _cache_rate(stats: dict) -> str:
+    """Build steps cache hit rate
+
+    Args:
+        stats (dict): build `steps` and `cached` steps count
+
+    Returns:
+        str: percentage, `-` if unknown
+    """
+    if not (steps := stats.get('steps')):
+        return '-'
+    return f'{ 100 * stats.get("cached", 0) // steps }%'
+
+
+def _human_size(size: int) -> str:
+    """Byte count with decimal unit, ex. 12.3 MB"""
+    for unit in ['B', 'kB', 'MB', 'GB']:
+        if size < 1000:
+            break
+        size /= 1000
+    return f'{ size :.1f} { unit }'
+
+
+def _transfer_rate(transfer: dict) -> str:
+    """Pulled or pushed size and rate, empty if nothing was transferred"""
+    if not (transfer or {}).get('size'):
+        return ''
+    return f' ({ _human_size(transfer["size"]) } at { _human_size(transfer["rate"]) }/s)'
+
+
+def _digest_origin(image: dict) -> dict:
+    """Image origin from its registry digest, None if it was never pulled nor pushed"""
+    if not (digests := sorted(x for x in image.get('digests', []) if '@' in x)):
+        return None
+    repository, _, digest = digests[0].partition('@')
+    return {'repository': repository, 'digest': digest, 'image': image['id']}
+
+
+def _human_time(timestamp: int) -> str:
+    """Local date and time of a unix timestamp, to the minute"""
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
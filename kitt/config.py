@@ -2,9 +2,10 @@
 
 import os
 import json
-import toml
+import tempfile
 
 from kitt.logger import panic, debug
+from kitt.profiler import traced
 
 
 class ConfigUtils:
@@ -26,7 +27,92 @@ class ConfigUtils:
         local = os.path.dirname(__file__)
         return os.path.join(local, relative)
 
+    @staticmethod
+    def datapath(name: str) -> str:
+        """Create absolute path to kitt persistent data file.
+
+        Args:
+            name (str): data file name
+
+        Returns:
+            str: path inside user data directory ($XDG_DATA_HOME/kitt)
+        """
+        root = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+        return os.path.join(root, 'kitt', name)
+
+    @staticmethod
+    def cachepath(name: str) -> str:
+        """Create absolute path to kitt cache file or directory.
+
+        Args:
+            name (str): cache file name
+
+        Returns:
+            str: path inside user cache directory ($XDG_CACHE_HOME/kitt)
+        """
+        root = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(root, 'kitt', name)
+
+    @classmethod
+    def load_data(cls, name: str) -> dict:
+        """Load kitt persistent data file
+
+        Args:
+            name (str): data file name
+
+        Returns:
+            dict: loaded data, empty if missing or corrupted
+        """
+        return cls.read_json(cls.datapath(name))
+
     @classmethod
+    def save_data(cls, name: str, data: dict):
+        """Atomically write kitt persistent data file
+
+        Args:
+            name (str): data file name
+            data (dict): JSON serializable data
+        """
+        cls.write_json(cls.datapath(name), data)
+
+    @staticmethod
+    def read_json(path: str) -> dict:
+        """Load JSON object file
+
+        Args:
+            path (str): file path
+
+        Returns:
+            dict: loaded data, empty if missing or corrupted
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            debug(error)
+            return {}
+
+        return data if isinstance(data, dict) else {}
+
+    @staticmethod
+    def write_json(path: str, data: dict):
+        """Atomically write JSON file, only readable by current user
+
+        Args:
+            path (str): file path
+            data (dict): JSON serializable data
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with open(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp, path)
+
+    @classmethod
+    @traced('config.load')
     def load(cls, config_file: str = None) -> dict:
         """Load config from file, override default config
 
@@ -36,6 +122,8 @@ class ConfigUtils:
         Returns:
             dict: loaded configuration
         """
+        import toml
+
         custom = {}
         default = None
         default_config_path = cls.mkpath('static/default.toml')
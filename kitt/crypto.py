@@ -1,10 +1,33 @@
 """Handles basic crypto and kitt vault managment"""
 
+import os
 import json
+import time
+import struct
 import base64
 import getpass
-from hashlib import sha256
+from typing import IO, Iterator
+from hashlib import scrypt, sha256
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from kitt.profiler import traced
+
+# Default vault unlock (key derivation) target time, in seconds
+UNLOCK_TIME = 0.5
+
+# scrypt cost : n = 2**14 is the interactive login baseline, memory is
+# 128 * r * n bytes so n is capped (256 MiB), higher cost comes from p
+SCRYPT_MIN_N = 2 ** 14
+SCRYPT_MAX_N = 2 ** 18
+SCRYPT_R = 8
+
+# Chunked AEAD stream parameters (AES-256-GCM, 96 bits nonce)
+CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
 
 
 def _forge_key(data: str) -> bytes:
@@ -16,6 +39,148 @@ def _forge_key(data: str) -> bytes:
         return None
 
 
+@traced('vault.derive_key')
+def derive_key(password: str, kdf: dict) -> bytes:
+    """Derive 256 bits encryption key from password
+
+    Args:
+        password (str): user password
+        kdf (dict): key derivation function name and parameters
+
+    Raises:
+        ValueError: unknown key derivation function
+
+    Returns:
+        bytes: raw key
+    """
+    if kdf.get('name') == 'scrypt':
+        n, r, p = kdf['n'], kdf['r'], kdf['p']
+        return scrypt(
+            password.encode('utf8'),
+            salt=base64.b64decode(kdf['salt']),
+            n=n, r=r, p=p,
+            maxmem=2 * 128 * r * (n + p),
+            dklen=32,
+        )
+
+    # Unsalted, only kept to read vaults created before scrypt
+    if kdf.get('name') == 'sha256':
+        return sha256(password.encode('utf8')).digest()
+
+    raise ValueError(f'Unknown key derivation function { kdf.get("name") }')
+
+
+@traced('vault.calibrate')
+def calibrate_kdf(unlock_time: float = UNLOCK_TIME) -> dict:
+    """Salted scrypt parameters, costing about unlock_time on this machine
+
+    Cost grows with `n` (time and memory) up to SCRYPT_MAX_N, then with `p`
+    (time only), by powers of two, without exceeding unlock_time.
+
+    Args:
+        unlock_time (float, optional): target key derivation time (s). Defaults to UNLOCK_TIME.
+
+    Returns:
+        dict: key derivation function name and parameters
+    """
+    kdf = {
+        'name': 'scrypt',
+        'salt': base64.b64encode(os.urandom(16)).decode('utf-8'),
+        'n': SCRYPT_MIN_N,
+        'r': SCRYPT_R,
+        'p': 1,
+    }
+
+    # Cost is about linear in n and p : extrapolate, then check
+    elapsed = _timed(kdf)
+    while 0 < elapsed * 2 <= unlock_time:
+        _double(kdf)
+        elapsed *= 2
+
+    if kdf['n'] > SCRYPT_MIN_N and _timed(kdf) > unlock_time:
+        _double(kdf, -1)
+
+    return kdf
+
+
+def _timed(kdf: dict) -> float:
+    start = time.perf_counter()
+    derive_key('calibration', kdf)
+    return time.perf_counter() - start
+
+
+def _double(kdf: dict, direction: int = 1):
+    if direction > 0:
+        if kdf['n'] < SCRYPT_MAX_N:
+            kdf['n'] *= 2
+        else:
+            kdf['p'] *= 2
+    elif kdf['p'] > 1:
+        kdf['p'] //= 2
+    else:
+        kdf['n'] //= 2
+
+
+def subkey(master: bytes, info: bytes) -> bytes:
+    """Derive independent 256 bits key from master key (HKDF-SHA256)
+
+    Args:
+        master (bytes): master key
+        info (bytes): key purpose, distinct for each derived key
+
+    Returns:
+        bytes: raw key
+    """
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info).derive(master)
+
+
+def seal(key: bytes, data: bytes, aad: bytes = b'') -> bytes:
+    """One-shot AES-GCM encryption, for small payloads
+
+    Args:
+        key (bytes): raw key
+        data (bytes): plaintext
+        aad (bytes, optional): authenticated data. Defaults to b''.
+
+    Returns:
+        bytes: random nonce followed by ciphertext
+    """
+    nonce = os.urandom(12)
+    return nonce + AESGCM(key).encrypt(nonce, data, aad)
+
+
+def unseal(key: bytes, data: bytes, aad: bytes = b'') -> bytes:
+    """Counterpart of `seal`
+
+    Raises `cryptography.exceptions.InvalidTag` on wrong key or tampered data.
+
+    Args:
+        key (bytes): raw key
+        data (bytes): nonce and ciphertext
+        aad (bytes, optional): authenticated data. Defaults to b''.
+
+    Returns:
+        bytes: plaintext
+    """
+    return AESGCM(key).decrypt(data[:12], data[12:], aad)
+
+
+def sealed_size(size: int, chunk_size: int = CHUNK_SIZE) -> int:
+    """Size of `CipherWriter` output for size bytes of plaintext
+
+    Args:
+        size (int): plaintext size
+        chunk_size (int, optional): stream chunk size. Defaults to CHUNK_SIZE.
+
+    Returns:
+        int: ciphertext size
+    """
+    # Last chunk is sealed even if empty, but a full one is never followed by an empty one
+    chunks = max(1, -(-size // chunk_size))
+    return size + chunks * TAG_SIZE
+
+
+@traced('vault.prompt')
 def secure_prompt() -> str:
     """Show secure hidden pasword prompt
 
@@ -140,3 +305,124 @@ def b64d(data: str) -> bytes:
         return base64.b64decode(data.encode('utf-8'))
     except Exception:
         return None
+
+
+class CipherWriter:
+    """Chunked AEAD encryption stream (STREAM construction).
+
+    Plaintext is cut in fixed size chunks, each one sealed with AES-GCM
+    under nonce `prefix | counter | last flag`, so chunks can neither be
+    reordered, dropped nor truncated without failing authentication.
+    At most one chunk is buffered.
+    """
+
+    def __init__(self, output: IO[bytes], key: bytes, prefix: bytes,
+                 aad: bytes = b'', chunk_size: int = CHUNK_SIZE):
+        self.output = output
+        self.aead = AESGCM(key)
+        self.prefix = prefix
+        self.aad = aad
+        self.chunk_size = chunk_size
+        self.counter = 0
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        """Encrypt data (buffered up to a chunk)
+
+        Args:
+            data (bytes): plaintext
+        """
+        self.buffer += data
+        # Keep last chunk buffered, it must be sealed with last flag
+        while len(self.buffer) > self.chunk_size:
+            self._seal(self.buffer[:self.chunk_size], False)
+            del self.buffer[:self.chunk_size]
+
+    def close(self):
+        """Seal last chunk (might be empty)"""
+        self._seal(self.buffer, True)
+        self.buffer = bytearray()
+
+    def _seal(self, chunk: bytearray, last: bool):
+        nonce = _nonce(self.prefix, self.counter, last)
+        self.output.write(self.aead.encrypt(nonce, bytes(chunk), self.aad))
+        self.counter += 1
+
+
+class CipherReader:
+    """Chunked AEAD decryption stream, counterpart of `CipherWriter`.
+
+    Raises `cryptography.exceptions.InvalidTag` on wrong key, tampered
+    or truncated stream. At most one chunk is kept in memory.
+    """
+
+    def __init__(self, source: IO[bytes], key: bytes, prefix: bytes,
+                 aad: bytes = b'', chunk_size: int = CHUNK_SIZE):
+        self.source = source
+        self.aead = AESGCM(key)
+        self.prefix = prefix
+        self.aad = aad
+        self.block_size = chunk_size + TAG_SIZE
+        self.counter = 0
+        self.chunk = b''
+        self.offset = 0
+        self.last = False
+        # One block read ahead, to know which one is the last
+        self.pending = source.read(self.block_size)
+
+    def read(self, size: int) -> bytes:
+        """Read decrypted data
+
+        Args:
+            size (int): bytes to read
+
+        Returns:
+            bytes: plaintext, shorter than size only at end of stream
+        """
+        parts = []
+        while size > 0:
+            if self.offset == len(self.chunk):
+                if self.last:
+                    break
+                self._open()
+                continue
+            part = self.chunk[self.offset:self.offset + size]
+            self.offset += len(part)
+            size -= len(part)
+            parts.append(part)
+        return b''.join(parts)
+
+    def stream(self, size: int) -> Iterator[memoryview]:
+        """Read decrypted data, without copying it out of decrypted chunks
+
+        Args:
+            size (int): bytes to read
+
+        Raises:
+            ValueError: stream ended before size bytes
+
+        Yields:
+            memoryview: plaintext pieces, only valid until next one
+        """
+        while size > 0:
+            if self.offset == len(self.chunk):
+                if self.last:
+                    raise ValueError('Truncated stream')
+                self._open()
+                continue
+            part = memoryview(self.chunk)[self.offset:self.offset + size]
+            self.offset += len(part)
+            size -= len(part)
+            yield part
+
+    def _open(self):
+        block, self.pending = self.pending, self.source.read(self.block_size)
+        self.last = not self.pending
+        nonce = _nonce(self.prefix, self.counter, self.last)
+        self.chunk = self.aead.decrypt(nonce, block, self.aad)
+        self.offset = 0
+        self.counter += 1
+
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack('>I?', counter, last)
@@ -0,0 +1,218 @@
+"""Dockerfile plugins section representation and optimizer
+
+Plugins blocks are parsed into instructions, then:
+
+- blocks without any effect are dropped,
+- blocks are ordered from most stable (rarely changing, ex. shell setup)
+  to most volatile (host files), so that a change only invalidates the
+  layers after it. Blocks with side effects on following instructions
+  (shell commands, ENV, USER, ...) are never moved across, nor are blocks
+  producing files a later block might use (ex. `pip install` of a copied
+  or cloned path),
+- adjacent shell form RUNs of a same block are merged in a single layer,
+  each command in its own subshell, as it was in its own RUN before.
+"""
+
+from typing import List, Tuple
+
+# Lower runs first. Plugins not listed here are barriers, like `sh`.
+STABILITY = {
+    'zsh': 0,
+    'pip': 1,
+    'git': 2,
+    'download': 2,
+    'copy': 3,
+}
+
+# Plugins which blocks might use files produced by other plugins ones,
+# never moved ahead of them
+DEPENDS = {
+    'pip': ('git', 'download', 'copy'),
+}
+
+# Instructions creating a filesystem layer, others only change image config
+LAYERS = ('RUN', 'COPY', 'ADD')
+
+# Instructions changing how following ones run, their block is a barrier
+_SIDE_EFFECTS = ('ARG', 'ENV', 'SHELL', 'USER', 'WORKDIR', 'ONBUILD')
+
+_NOOPS = ('', 'true', ':')
+
+
+class Instruction:
+    """Dockerfile instruction, tagged with the plugin it comes from"""
+
+    def __init__(self, keyword: str, args: str, plugin: str, comments: list = None):
+        self.keyword = keyword.upper()
+        self.args = args
+        self.plugin = plugin
+        self.comments = comments or []
+        self.merged = 1
+        self.moved = False
+
+    @property
+    def shell_run(self) -> bool:
+        """Whether instruction is a plain shell form RUN (no exec form nor flags)"""
+        return self.keyword == 'RUN' and not self.args.startswith(('[', '--'))
+
+    @property
+    def noop(self) -> bool:
+        """Whether instruction has no effect"""
+        return self.shell_run and self.args.strip() in _NOOPS
+
+    def __str__(self) -> str:
+        return '\n'.join(self.comments + [f'{ self.keyword } { self.args }'])
+
+
+def parse(text: str, plugin: str = None) -> List[Instruction]:
+    """Parse Dockerfile text
+
+    Args:
+        text (str): Dockerfile instructions
+        plugin (str, optional): plugin instructions come from. Defaults to None.
+
+    Returns:
+        List[Instruction]: instructions, line continuations kept in arguments
+    """
+    instructions, comments, lines = [], [], []
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not lines:
+            if not stripped:
+                continue
+            if stripped.startswith('#'):
+                comments.append(stripped)
+                continue
+
+        lines.append(line.rstrip())
+        if stripped.endswith('\\'):
+            continue
+
+        keyword, _, args = '\n'.join(lines).strip().partition(' ')
+        instructions.append(Instruction(keyword, args.strip(), plugin, comments))
+        comments, lines = [], []
+
+    if lines:
+        keyword, _, args = '\n'.join(lines).strip().partition(' ')
+        instructions.append(Instruction(keyword, args.rstrip('\\ ').strip(), plugin, comments))
+
+    return instructions
+
+
+def optimize(blocks: List[Tuple[str, str]]) -> List[Instruction]:
+    """Optimize plugins blocks layers
+
+    Args:
+        blocks (List[Tuple[str, str]]): plugin name and rendered block, in config order
+
+    Returns:
+        List[Instruction]: optimized instructions
+    """
+    parsed = []
+    for plugin, text in blocks:
+        instructions = [x for x in parse(text, plugin) if not x.noop]
+        if instructions:
+            parsed.append((plugin, instructions))
+
+    ordered, segment = [], []
+    for plugin, instructions in parsed:
+        if _barrier(plugin, instructions):
+            ordered += _sort(segment) + [(plugin, instructions)]
+            segment = []
+        else:
+            segment.append((plugin, instructions))
+    ordered += _sort(segment)
+
+    result = []
+    for plugin, instructions in ordered:
+        result += _merge(instructions)
+    return result
+
+
+def render(instructions: List[Instruction]) -> str:
+    """Render instructions back to Dockerfile text
+
+    Args:
+        instructions (List[Instruction]): instructions
+
+    Returns:
+        str: Dockerfile text
+    """
+    return '\n'.join(str(x) for x in instructions)
+
+
+def explain(instructions: List[Instruction]) -> List[str]:
+    """Describe layer plan
+
+    Args:
+        instructions (List[Instruction]): optimized instructions
+
+    Returns:
+        List[str]: one line per instruction
+    """
+    lines, layer = [], 0
+    for instruction in instructions:
+        if instruction.keyword in LAYERS:
+            layer += 1
+            head = f'layer { layer :>2}'
+        else:
+            head = 'config  '
+
+        summary = ' '.join(instruction.args.replace('\\\n', ' ').split())
+        if len(summary) > 60:
+            summary = summary[:57] + '...'
+
+        notes = []
+        if instruction.merged > 1:
+            notes.append(f'{ instruction.merged } merged')
+        if instruction.moved:
+            notes.append('moved')
+        notes = f' ({ ", ".join(notes) })' if notes else ''
+
+        lines.append(f'{ head }  { instruction.plugin or "-" :<10} '
+                     f'{ instruction.keyword } { summary }{ notes }')
+    return lines
+
+
+def _barrier(plugin: str, instructions: List[Instruction]) -> bool:
+    return plugin not in STABILITY or any(x.keyword in _SIDE_EFFECTS for x in instructions)
+
+
+def _sort(segment: list) -> list:
+    # Stable insertion sort, a block never goes ahead of a block it depends on
+    ordered = []
+    for block in segment:
+        index = len(ordered)
+        while index and STABILITY[ordered[index - 1][0]] > STABILITY[block[0]] \
+                and ordered[index - 1][0] not in DEPENDS.get(block[0], ()):
+            index -= 1
+        ordered.insert(index, block)
+
+    for block, original in zip(ordered, segment):
+        if block is not original:
+            for instruction in block[1]:
+                instruction.moved = True
+    return ordered
+
+
+def _mergeable(instruction: Instruction) -> bool:
+    # Comments would swallow following commands once lines are joined
+    return instruction.shell_run and '#' not in instruction.args and '<<' not in instruction.args
+
+
+def _merge(instructions: List[Instruction]) -> List[Instruction]:
+    result = []
+    for instruction in instructions:
+        previous = result[-1] if result else None
+        if not previous or not _mergeable(previous) or not _mergeable(instruction) \
+                or instruction.comments:
+            result.append(instruction)
+            continue
+
+        if previous.merged == 1:
+            previous.args = f'( { previous.args } )'
+        previous.args += f' \\\n    && ( { instruction.args } )'
+        previous.merged += 1
+        previous.moved |= instruction.moved
+    return result
@@ -0,0 +1,281 @@
+"""Asyncio container engine API client
+
+Minimal HTTP/1.1 client for Docker Engine API (and Podman compatible API),
+over a pool of keep-alive Unix socket connections, so that many requests
+can be in flight at once without a connection setup each.
+"""
+
+import os
+import json
+import asyncio
+
+from typing import AsyncIterator
+from urllib.parse import quote, urlencode
+
+# Concurrent connections to engine, idle ones are kept open
+POOL_SIZE = 8
+
+# Engine API version requested (Docker 20.10+, Podman 3+ compat API), lowered to engine's
+API_VERSION = '1.41'
+
+# Rootful engines sockets, rootless Podman one is in user runtime directory
+DOCKER_SOCKET = '/var/run/docker.sock'
+PODMAN_SOCKET = '/run/podman/podman.sock'
+
+
+class EngineError(Exception):
+    """Engine API error response, or engine unreachable"""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+def engine_socket() -> str:
+    """Container engine Unix socket path
+
+    `DOCKER_HOST` (or `CONTAINER_HOST`, as set for Podman) wins, otherwise
+    Docker socket is used if it exists, then rootless and rootful Podman
+    ones, so that rootless hosts work without any setting.
+
+    Raises:
+        EngineError: engine address is not a Unix socket
+
+    Returns:
+        str: socket path
+    """
+    if host := os.environ.get('DOCKER_HOST') or os.environ.get('CONTAINER_HOST'):
+        if not host.startswith('unix://'):
+            raise EngineError(f'Unsupported engine address { host }, only unix:// sockets are')
+        return host[len('unix://'):]
+
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or f'/run/user/{ os.getuid() }'
+    for path in (DOCKER_SOCKET, os.path.join(runtime, 'podman', 'podman.sock'), PODMAN_SOCKET):
+        if os.path.exists(path):
+            return path
+    return DOCKER_SOCKET
+
+
+def api_path(template: str, *args: str) -> str:
+    """Engine API path, with quoted arguments
+
+    Args:
+        template (str): path template (ex. `/images/{}/json`)
+        *args (str): path arguments (image references keep their slashes)
+
+    Returns:
+        str: request path
+    """
+    return template.format(*(quote(x, safe='/:@') for x in args))
+
+
+class EngineClient:
+    """Engine API client over pooled Unix socket connections
+
+    All requests must be made from the same event loop.
+    """
+
+    def __init__(self, socket: str, size: int = POOL_SIZE):
+        """Init
+
+        Args:
+            socket (str): engine Unix socket path
+            size (int, optional): max concurrent connections. Defaults to POOL_SIZE.
+        """
+        self.socket = socket
+        self.size = size
+        self.version = None
+        self.podman = False
+        self._idle = []
+        self._slots = None
+        self._connecting = None
+
+    async def connect(self) -> dict:
+        """Negotiate API version, once
+
+        Returns:
+            dict: engine version
+        """
+        response = await self._request('GET', '/version', versioned=False)
+        version = json.loads(await response.read())
+        supported = version.get('ApiVersion', API_VERSION)
+        self.version = min(API_VERSION, supported, key=lambda x: tuple(map(int, x.split('.'))))
+        self.podman = any('podman' in x.get('Name', '').lower()
+                          for x in version.get('Components') or [])
+        return version
+
+    async def request(self, method: str, target: str, params: dict = None, body=None,
+                      headers: dict = None):
+        """Send request, read whole response
+
+        Args:
+            method (str): HTTP method
+            target (str): API path, see `api_path`
+            params (dict, optional): query parameters, dict values sent as JSON. Defaults to None.
+            body (Any, optional): JSON body. Defaults to None.
+            headers (dict, optional): extra headers (ex. registry auth). Defaults to None.
+
+        Raises:
+            EngineError: engine error response
+
+        Returns:
+            Any: decoded JSON response, None if empty
+        """
+        response = await self._request(method, target, params, body, headers)
+        data = await response.read()
+        return json.loads(data) if data else None
+
+    async def stream(self, method: str, target: str, params: dict = None, body=None,
+                     headers: dict = None) -> AsyncIterator[dict]:
+        """Send request, decode response as a stream of JSON objects
+
+        Args:
+            method (str): HTTP method
+            target (str): API path, see `api_path`
+            params (dict, optional): query parameters. Defaults to None.
+            body (Any, optional): JSON body. Defaults to None.
+            headers (dict, optional): extra headers (ex. registry auth). Defaults to None.
+
+        Raises:
+            EngineError: engine error response
+
+        Yields:
+            dict: decoded stream objects (progress, events, ...)
+        """
+        response = await self._request(method, target, params, body, headers)
+        decoder = json.JSONDecoder()
+        pending = ''
+        # Stream left early (ex. error event) drops connection instead of reading it to the end
+        chunks = response.chunks()
+        try:
+            async for chunk in chunks:
+                pending += chunk.decode('utf-8')
+                while pending := pending.lstrip():
+                    try:
+                        item, end = decoder.raw_decode(pending)
+                    except json.JSONDecodeError:
+                        break
+                    pending = pending[end:]
+                    yield item
+        finally:
+            await chunks.aclose()
+
+    async def close(self):
+        """Close idle connections"""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _request(self, method: str, target: str, params: dict = None, body=None,
+                       headers: dict = None, versioned: bool = True) -> '_Response':
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+            self._connecting = asyncio.Lock()
+        if versioned and self.version is None:
+            async with self._connecting:
+                if self.version is None:
+                    await self.connect()
+
+        if versioned:
+            target = f'/v{ self.version }{ target }'
+        if params := {k: json.dumps(v) if isinstance(v, (dict, list)) else v
+                      for k, v in (params or {}).items() if v is not None}:
+            target += '?' + urlencode(params)
+
+        data = json.dumps(body).encode() if body is not None else b''
+        head = f'{ method } { target } HTTP/1.1\r\nHost: localhost\r\n'
+        for key, value in {**(headers or {}), 'Content-Type': 'application/json',
+                           'Content-Length': len(data)}.items():
+            head += f'{ key }: { value }\r\n'
+        head += '\r\n'
+
+        await self._slots.acquire()
+        try:
+            response = await self._exchange(head.encode() + data)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        if response.status >= 400:
+            error = await response.read()
+            try:
+                message = json.loads(error).get('message', '')
+            except (ValueError, AttributeError):
+                message = error.decode('utf-8', 'replace')
+            raise EngineError(f'{ response.status } { message }', response.status)
+        return response
+
+    async def _exchange(self, request: bytes) -> '_Response':
+        # Idle connection might have been closed by engine, retried once on a fresh one
+        while True:
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+            else:
+                try:
+                    reader, writer = await asyncio.open_unix_connection(self.socket)
+                except OSError as error:
+                    raise EngineError(f'Cannot connect to engine on { self.socket } : { error }') from error
+            try:
+                writer.write(request)
+                await writer.drain()
+                status = await reader.readline()
+                if not status:
+                    raise ConnectionResetError('connection closed by engine')
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            return await _Response.open(self, reader, writer, int(status.split()[1]))
+
+    def _release(self, reader, writer, keep: bool):
+        if keep:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        self._slots.release()
+
+
+class _Response:
+    """Engine response, connection goes back to pool once body is read"""
+
+    def __init__(self, client: EngineClient, reader, writer, status: int, headers: dict):
+        self.client = client
+        self.reader = reader
+        self.writer = writer
+        self.status = status
+        self.headers = headers
+
+    @classmethod
+    async def open(cls, client: EngineClient, reader, writer, status: int) -> '_Response':
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return cls(client, reader, writer, status, headers)
+
+    async def read(self) -> bytes:
+        return b''.join([chunk async for chunk in self.chunks()])
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        # Connection is only reusable once body is fully read
+        keep, done = self.headers.get('connection', '').lower() != 'close', False
+        try:
+            if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+                while size := int((await self.reader.readline()).split(b';')[0], 16):
+                    yield await self.reader.readexactly(size)
+                    await self.reader.readexactly(2)
+                await self.reader.readline()
+            elif 'content-length' in self.headers:
+                if size := int(self.headers['content-length']):
+                    yield await self.reader.readexactly(size)
+            elif self.status not in (204, 304):
+                keep = False
+                while chunk := await self.reader.read(2 ** 16):
+                    yield chunk
+            done = True
+        finally:
+            if self.reader is not None:
+                self.client._release(self.reader, self.writer, keep and done)
+                self.reader = None
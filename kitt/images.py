@@ -1,14 +1,39 @@
 """Provides low-level container image abstractions"""
 
 import io
+import os
+import time
+import shutil
+import asyncio
+import tarfile
+import tempfile
+import threading
+import subprocess
 
+from typing import IO, Callable, Iterator
 from abc import ABC as AbstractClass, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import jinja2
 import docker
-import dockerpty
 
-from docker.models.images import Image
+from kitt import prune
+from kitt.engine import EngineClient, EngineError, api_path, engine_socket
+from kitt.profiler import record, span
+from kitt.transfer import Transfer, TransferError
+
+# Attempts on transient registry errors, after the first one
+TRANSFER_RETRIES = 3
+
+# Session containers labels: session name and vault temp filesystem path
+SESSION_LABEL = 'kitt-session'
+VAULT_LABEL = 'kitt-vault'
+
+# Image builders : docker legacy builder (API), or BuildKit (docker buildx CLI)
+BUILDERS = ['legacy', 'buildkit']
+
+# BuildKit builder instance able to export / import local cache
+BUILDX_BUILDER = 'kitt'
+
 
 class Composer:
     """Image text file composer"""
@@ -17,24 +42,101 @@ class Composer:
         """Init
 
         Args:
-            template (str): jinja2 template
+            template (str): jinja2 template path
         """
 
-        with open(template, 'r', encoding='utf-8') as file:
-            self.template = file.read()
+        self.template = template
+        self.plan = []
 
-    def compose(self, values: dict) -> str:
+    def compose(self, values: dict, optimize: bool = True) -> str:
         """Copose file from template
 
+        Plugins blocks (`plugins` value, as plugin name and rendered block
+        pairs) go through Dockerfile optimizer, resulting instructions are
+        kept in `plan`.
+
         Args:
             values (dict): templating values
+            optimize (bool, optional): reorder and merge plugins layers. Defaults to True.
+
+        Raises:
+            TemplateError: template is invalid or failed to render
 
         Returns:
             str: generated templated text file
         """
 
-        template = jinja2.Template(self.template)
-        return template.render(values)
+        from kitt import dockerfile, templates
+
+        blocks = values.get('plugins', [])
+        with span('template.optimize'):
+            if optimize:
+                self.plan = dockerfile.optimize(blocks)
+            else:
+                self.plan = [x for name, block in blocks for x in dockerfile.parse(block, name)]
+        values = {**values, 'plugins': [dockerfile.render(self.plan)] if self.plan else []}
+
+        return templates.render(self.template, values)
+
+
+class BuildContext:
+    """Synthesized image build context
+
+    Only holds the Dockerfile and explicitly added local files, instead of
+    the whole current working directory.
+    """
+
+    # Context archive stays in memory up to this size, then spills to disk
+    SPOOL_SIZE = 64 * 1024 * 1024
+
+    def __init__(self):
+        self.sources = []
+
+    def add(self, path: str) -> str:
+        """Add local file or directory to context
+
+        Args:
+            path (str): host file or directory path
+
+        Returns:
+            str: path inside build context, to use as COPY source
+        """
+        arcname = f'files/{ len(self.sources) }'
+        if not os.path.isdir(path):
+            arcname += '/' + os.path.basename(path)
+
+        self.sources.append((path, arcname))
+        return arcname
+
+    def archive(self, dockerfile: str) -> IO[bytes]:
+        """Build context tar archive
+
+        Args:
+            dockerfile (str): Dockerfile content
+
+        Returns:
+            IO[bytes]: uncompressed tar archive, rewound
+        """
+        fileobj = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+
+        with tarfile.open(fileobj=fileobj, mode='w') as tar:
+            data = dockerfile.encode('utf-8')
+            info = tarfile.TarInfo('Dockerfile')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+            for path, arcname in self.sources:
+                tar.add(path, arcname=arcname, filter=self._normalize)
+
+        fileobj.seek(0)
+        return fileobj
+
+    @staticmethod
+    def _normalize(info: tarfile.TarInfo) -> tarfile.TarInfo:
+        # Host user must not leak into image, nor change layer cache keys
+        info.uid = info.gid = 0
+        info.uname = info.gname = ''
+        return info
 
 
 class ImageManager(AbstractClass):
@@ -55,11 +157,76 @@ class ImageManager(AbstractClass):
         raise NotImplementedError
 
     @abstractmethod
-    def list(self, repository: str = None):
-        """List local images
+    def session(self, name: str) -> dict:
+        """Find running session container
+
+        Args:
+            name (str): session name.
+
+        Returns:
+            dict: session `id`, `image` id and `vault` path, None if not running.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def spawn(self, name: str, tag: str = 'latest', session: str = None,
+              vault: str = None, **kwargs) -> dict:
+        """Create and start detached session container, kept alive until stopped.
+
+        Args:
+            name (str): image to run.
+            tag (str, optional): image tag. Defaults to 'latest'.
+            session (str, optional): session name. Defaults to image tag.
+            vault (str, optional): vault temp filesystem bound in container. Defaults to None.
+            **kwargs (Any): any argument that undelying create method would accept.
+
+        Returns:
+            dict: session, as returned by `session`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def attach(self, session: dict, command: str):
+        """Spawn command in session container and attach to current TTY.
+
+        Args:
+            session (dict): running session.
+            command (str): command to run (shell).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop(self, session: dict):
+        """Stop (and remove) session container.
+
+        Args:
+            session (dict): running session.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self, repository: str = None) -> list:
+        """List local images, in a single engine round-trip
 
         Args:
             repository (str, optional): only for this repository. Defaults to None.
+
+        Returns:
+            list: images `id`, `tags`, registry `digests` (`repository@digest`), `labels`,
+                  `size` and `created` timestamp.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def events(self, since: int, until: int) -> list:
+        """Engine events between two timestamps
+
+        Args:
+            since (int): start unix timestamp.
+            until (int): end unix timestamp.
+
+        Returns:
+            list: events, as reported by engine.
         """
         raise NotImplementedError
 
@@ -74,48 +241,92 @@ class ImageManager(AbstractClass):
         raise NotImplementedError
 
     @abstractmethod
-    def prune(self, repository: str = None):
-        """Prune local images
+    def plan_prune(self, repositories: list, labels: list) -> dict:
+        """Plan removal of local images, without removing anything
 
         Args:
-            repository (str, optional): only for this repository. Defaults to None.
+            repositories (list): pruned repositories.
+            labels (list): labels of untagged images to prune (previous builds).
+
+        Returns:
+            dict: prune plan, see `kitt.prune`.
         """
         raise NotImplementedError
 
     @abstractmethod
-    def refresh(self, repository: str = None):
-        """Pull latest version of local images
+    def prune(self, plan: dict, jobs: int = 8) -> dict:
+        """Remove planned images, concurrently
 
         Args:
-            repository (str, optional): only for this repository. Defaults to None.
+            plan (dict): prune plan, from `plan_prune`.
+            jobs (int, optional): concurrent removals. Defaults to 8.
+
+        Returns:
+            dict: `failed` removals (image ids and tags) and `reclaimed` bytes (layers disk usage drop).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def refresh(self, repository: str, origins: dict, jobs: int = 4) -> dict:
+        """Pull latest version of local images, when remote digest changed
+
+        Args:
+            repository (str): local images repository.
+            origins (dict): per tag `repository`, remote `digest` and local `image` id.
+            jobs (int, optional): concurrent image updates. Defaults to 4.
+
+        Returns:
+            dict: updated origins, for refreshed images only.
         """
         raise NotImplementedError
 
     @abstractmethod
-    def build(self, name: str, template: str, tag: str = 'latest', **kwargs):
+    def build(self, name: str, template: str, tag: str = 'latest',
+              context: BuildContext = None, **kwargs):
         """Build image
 
         Args:
             name (str): image name.
             template (str): text object to build image from (ex. Dockerfile).
             tag (str, optional): image tag. Defaults to 'latest'.
-            **kwargs (Any): any argument that undelying build method would accept.
+            context (BuildContext, optional): files available to build. Defaults to None.
+            **kwargs (Any): any argument that undelying build method would accept,
+                and `builder` (one of BUILDERS) with its `cache_dir` (BuildKit local cache).
+
+        Returns:
+            dict: built image `id` and `size`, build `steps` and `cached` steps count.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def relabel(self, name: str, tag: str, labels: dict):
+        """Replace image labels, sharing all image layers (no layer is added).
+        Tag is atomically moved to patched image.
+
+        Args:
+            name (str): image name.
+            tag (str): image tag.
+            labels (dict): labels to set, others are kept.
         """
         raise NotImplementedError
 
     @abstractmethod
-    def pull(self, repository: str, tag: str = 'latest'):
+    def pull(self, repository: str, tag: str = 'latest', alias: str = None) -> dict:
         """Pull image from registry
 
         Args:
             repository (str): full repository url.
             tag (str, optional): image tag. Defaults to 'latest'.
             alias (str, optional): image name repository alias. Defaults to 'latest'.
+
+        Returns:
+            dict: pulled image `id` and remote `digest`, bytes transferred (`size`)
+                  and average `rate` (bytes per second).
         """
         raise NotImplementedError
 
     @abstractmethod
-    def push(self, repository: str, name: str, tag: str = 'latest', clean: bool = True):
+    def push(self, repository: str, name: str, tag: str = 'latest', clean: bool = True) -> dict:
         """Push image to remote registry
 
         Args:
@@ -123,6 +334,9 @@ class ImageManager(AbstractClass):
             name (str): local image name to push.
             tag (str, optional): image tag. Defaults to 'latest'.
             clean (bool, optional): Remove generated local tag. Defaults to True.
+
+        Returns:
+            dict: bytes transferred (`size`) and average `rate` (bytes per second).
         """
         raise NotImplementedError
 
@@ -136,6 +350,43 @@ class ImageManager(AbstractClass):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def read_file(self, name: str, tag: str, path: str) -> IO[bytes]:
+        """Copy file out of image, without running it
+
+        Args:
+            name (str): image name.
+            tag (str): image tag.
+            path (str): file path inside image.
+
+        Returns:
+            IO[bytes]: file content, rewound.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find(self, labels: dict) -> dict:
+        """Find most recent local image carrying all given labels
+
+        Args:
+            labels (dict): label values to match.
+
+        Returns:
+            dict: image `id`, `tags` and `size`, None if no image matches.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def tag(self, image: str, name: str, tag: str = 'latest'):
+        """Tag local image
+
+        Args:
+            image (str): image id.
+            name (str): new image name.
+            tag (str, optional): new image tag. Defaults to 'latest'.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def labels(self, name: str, tag: str = 'latest') -> dict:
         """Get local image labels
@@ -159,7 +410,8 @@ def docker_error_handler(func):
 
     def _handler(self, *args, **kwargs):
         try:
-            return func(self, *args, **kwargs)
+            with span(f'docker.{ func.__name__ }'):
+                return func(self, *args, **kwargs)
         except docker.errors.BuildError as error:
             self.logger.debug(error)
             self.logger.panic('Docker build error')
@@ -172,6 +424,9 @@ def docker_error_handler(func):
         except docker.errors.DockerException as error:
             self.logger.debug(error)
             self.logger.panic('Problem with docker daemon (--debug)')
+        except TransferError as error:
+            self.logger.debug(error)
+            self.logger.panic(f'Registry transfer failed : { error }')
 
     return _handler
 
@@ -187,23 +442,36 @@ class DockerImageManager(ImageManager):
     def _tag(name, tag):
         return f'{ name }:{ tag }'
 
-    @docker_error_handler
     def __init__(self, logger):
         self.logger = logger
-        self.client = docker.from_env()
-        self.experimental = self.client.info().get('ExperimentalBuild', False)
+        self._client = None
+        self._experimental = None
+
+    @property
+    @docker_error_handler
+    def client(self) -> docker.DockerClient:
+        """Docker client, connected on first use"""
+        if self._client is None:
+            self._client = docker.from_env()
+        return self._client
+
+    @property
+    @docker_error_handler
+    def experimental(self) -> bool:
+        """Whether docker daemon runs in experimental mode (probed once)"""
+        if self._experimental is None:
+            self._experimental = self.client.info().get('ExperimentalBuild', False)
+        return self._experimental
 
     @docker_error_handler
     def _get(self, name: str, tag: str = 'latest'):
         fname = self._tag(name, tag)
         return self.client.images.get(fname)
 
-    @docker_error_handler
-    def _get_all(self, repository: str = None) -> list[Image]:
-        return self.client.images.list(name=repository)
-
     @docker_error_handler
     def run(self, name: str, tag: str = 'latest', **kwargs):
+        import dockerpty
+
         fname = self._tag(name, tag)
         container = self.client.containers.create(
             image=fname,
@@ -217,75 +485,780 @@ class DockerImageManager(ImageManager):
         dockerpty.start(self.client.api, container.id)
 
     @docker_error_handler
-    def list(self, repository: str = None):
-        images = self._get_all(repository)
-        for image in images:
-            basename = [x[len(repository) + 1:]
-                        for x in image.tags if x.startswith(repository)].pop()
-            self.logger.info('➜ ' + basename)
+    def session(self, name: str) -> dict:
+        filters = {'label': f'{ SESSION_LABEL }={ name }'}
+        if not (containers := self.client.api.containers(filters=filters)):
+            return None
+        container = containers[0]
+        return {
+            'id': container['Id'],
+            'image': container['ImageID'],
+            'vault': (container.get('Labels') or {}).get(VAULT_LABEL),
+        }
+
+    @docker_error_handler
+    def spawn(self, name: str, tag: str = 'latest', session: str = None,
+              vault: str = None, **kwargs) -> dict:
+        session = session or tag
+        labels = {SESSION_LABEL: session}
+        if vault:
+            labels[VAULT_LABEL] = vault
+
+        # Init process reaps orphans of attached shells, container is
+        # removed as soon as it is stopped
+        container = self.client.containers.create(
+            image=self._tag(name, tag),
+            name=f'kitt-session-{ session }',
+            command=['sleep', 'infinity'],
+            labels=labels,
+            init=True,
+            auto_remove=True,
+            detach=True,
+            network_mode='host',
+            **kwargs
+        )
+        container.start()
+        return {'id': container.id, 'image': container.attrs['Image'], 'vault': vault}
+
+    @docker_error_handler
+    def attach(self, session: dict, command: str):
+        import dockerpty
+
+        # Exec runs as container user, environment and mounts are shared
+        dockerpty.exec_command(self.client.api, session['id'], command)
+
+    @docker_error_handler
+    def stop(self, session: dict):
+        self.client.api.stop(session['id'])
+
+    @docker_error_handler
+    def list(self, repository: str = None) -> list:
+        return [
+            {
+                'id': image['Id'],
+                'tags': image.get('RepoTags') or [],
+                'digests': image.get('RepoDigests') or [],
+                'labels': image.get('Labels') or {},
+                'size': image.get('Size', 0),
+                'created': image.get('Created', 0),
+            }
+            for image in self.client.api.images(name=repository)
+        ]
+
+    @docker_error_handler
+    def events(self, since: int, until: int) -> list:
+        return list(self.client.events(since=since, until=until, decode=True))
 
     @docker_error_handler
     def remove(self, name: str, tag: str = 'latest'):
         self.client.images.remove(self._tag(name, tag))
 
     @docker_error_handler
-    def prune(self, repository: str = None):
-        self.client.images.prune()
-        if not repository:
-            return
-        for image in self._get_all(repository):
-            for tag in image.tags:
-                if tag.startswith(repository):
-                    self.remove(*tag.split(':'))
+    def plan_prune(self, repositories: list, labels: list) -> dict:
+        plan = prune.select(self.client.api.df(), repositories, labels)
+        layers = {x: self.client.api.inspect_image(x)['RootFS']['Layers'] for x in prune.inspected(plan)}
+        histories = {x: self.client.api.history(x) for x in prune.covering(plan, layers)}
+        return prune.estimate(plan, layers, histories)
 
     @docker_error_handler
-    def refresh(self, repository: str = None):
-        images = self._get_all(repository)
-        map(lambda x: x.reload(), images)
+    def prune(self, plan: dict, jobs: int = 8) -> dict:
+        failed = []
+
+        with ThreadPoolExecutor(jobs) as pool:
+            futures = {
+                pool.submit(self._prune, references): key
+                for key, references in prune.removals(plan)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except docker.errors.APIError as error:
+                    self.logger.debug(error)
+                    failed.append(futures[future])
+
+        usage = self.client.api.df().get('LayersSize', 0)
+        return {'failed': failed, 'reclaimed': max(plan['usage'] - usage, 0)}
+
+    def _prune(self, references: list):
+        # Removing last tag removes image, untagged ones are removed by id
+        for reference in references:
+            self.client.api.remove_image(reference)
 
     @docker_error_handler
-    def build(self, name: str, template: str, tag: str = 'latest', squash = True, **kwargs):
-        # Monkey-patch to address custom build context situation with fileobj
-        # https://github.com/docker/docker-py/issues/2105#issuecomment-613685891
-        import docker.api.build
-        docker.api.build.process_dockerfile = lambda dockerfile, path: ('Dockerfile', dockerfile)
+    def refresh(self, repository: str, origins: dict, jobs: int = 4) -> dict:
+        local = {}
+        for image in self.client.api.images(name=repository):
+            for tag in image.get('RepoTags') or []:
+                if tag.startswith(f'{ repository }:'):
+                    local[tag[len(repository) + 1:]] = image['Id']
+
+        # Images rebuilt or re-tagged locally since pull are left untouched
+        origins = {tag: x for tag, x in origins.items() if local.get(tag) == x.get('image')}
+        updated = {}
 
+        with self.logger.progress() as progress, ThreadPoolExecutor(jobs) as pool:
+            futures = {
+                pool.submit(self._refresh, repository, tag, origin, progress): tag
+                for tag, origin in sorted(origins.items())
+            }
+            for future in as_completed(futures):
+                if origin := future.result():
+                    updated[futures[future]] = origin
+
+        return updated
+
+    def _refresh(self, repository: str, tag: str, origin: dict, progress) -> dict:
+        task = progress.add_task(tag, total=None, status='checking')
+        remote = origin['repository']
+        uri = f'{ remote }:{ tag }'
+
+        try:
+            digest = self.client.images.get_registry_data(uri).id
+            if digest == origin.get('digest'):
+                progress.update(task, total=0, status='[green]up to date')
+                return None
+
+            progress.update(task, status='pulling')
+            transfer = Transfer()
+            stream = lambda: self.client.api.pull(remote, tag, stream=True, decode=True)
+            retry = lambda attempt: progress.update(task, status=f'[yellow]retry { attempt }')
+
+            for _ in self._follow(transfer, stream, retry):
+                progress.update(task, total=transfer.total or None, completed=transfer.current)
+
+            self.client.api.tag(uri, repository, tag)
+            self.client.api.remove_image(uri)
+            image = self.client.api.inspect_image(self._tag(repository, tag))['Id']
+        except (docker.errors.APIError, TransferError) as error:
+            self.logger.debug(error)
+            progress.update(task, status='[red]failed (--debug)')
+            return None
+
+        progress.update(task, status='[green]updated')
+        return {**origin, 'digest': digest, 'image': image}
+
+    @docker_error_handler
+    def build(self, name: str, template: str, tag: str = 'latest', squash = True,
+              nocache: bool = False, context: BuildContext = None, builder: str = 'legacy',
+              cache_dir: str = None, **kwargs):
+        context = context or BuildContext()
         fname = self._tag(name, tag)
-        self.client.images.build(
-            path='.',
-            dockerfile=template,
-            tag=fname,
-            rm=True,
-            nocache=True,
-            squash=squash and self.experimental,
-            **kwargs
-        )
+
+        if builder == 'buildkit':
+            return self._buildx(fname, template, context, nocache, cache_dir, **kwargs)
+
+        with span('build.context'):
+            fileobj = context.archive(template)
+
+        with fileobj:
+            # Build stream is followed as it goes, so that steps can be timed
+            stream = self.client.api.build(
+                fileobj=fileobj,
+                custom_context=True,
+                tag=fname,
+                rm=True,
+                nocache=nocache,
+                squash=squash and self.experimental,
+                decode=True,
+                **kwargs
+            )
+            steps = _BuildSteps()
+            for chunk in stream:
+                if error := chunk.get('error'):
+                    raise docker.errors.BuildError(error, steps.logs)
+                steps.update(chunk)
+            steps.close()
+
+        if not steps.image:
+            raise docker.errors.BuildError('Unknown built image', steps.logs)
+
+        return {
+            'id': steps.image,
+            'size': self.client.api.inspect_image(steps.image).get('Size', 0),
+            'steps': steps.count,
+            'cached': steps.cached,
+        }
+
+    def _buildx(self, fname: str, template: str, context: BuildContext, nocache: bool = False,
+                cache_dir: str = None, labels: dict = None, target: str = None,
+                buildargs: dict = None, pull: bool = False, **kwargs) -> dict:
+        # Independent stages are built concurrently. Layers are kept as built
+        # (no squash), image is loaded in docker once built.
+        with tempfile.TemporaryDirectory(prefix='kitt-buildx-') as tmp:
+            iidfile = os.path.join(tmp, 'iid')
+            command = ['docker', 'buildx', 'build', '-', '--load', '--tag', fname,
+                       '--iidfile', iidfile, '--progress', 'plain']
+            command += ['--no-cache'] if nocache else []
+            command += ['--pull'] if pull else []
+            command += ['--target', target] if target else []
+            for key, value in (labels or {}).items():
+                command += ['--label', f'{ key }={ value }']
+            for key, value in (buildargs or {}).items():
+                command += ['--build-arg', f'{ key }={ value }']
+
+            # Local cache (ex. shared between CI runners) requires a container
+            # builder. Each image exports its own cache, and imports all others.
+            if cache_dir:
+                command += ['--builder', self._buildx_builder()]
+                for entry in sorted(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else []:
+                    if os.path.isfile(os.path.join(cache_dir, entry, 'index.json')):
+                        command += ['--cache-from', f'type=local,src={ os.path.join(cache_dir, entry) }']
+                dest = os.path.join(cache_dir, fname.replace(':', '-').replace('/', '-'))
+                command += ['--cache-to', f'type=local,dest={ dest },mode=max']
+
+            with context.archive(template) as fileobj:
+                # Engine reads context from a real file descriptor
+                fileobj.rollover()
+                started = time.perf_counter()
+                result = self._buildx_run(command, stdin=fileobj)
+
+            with open(iidfile, 'r', encoding='utf-8') as file:
+                image_id = file.read().strip()
+
+        stats = _buildx_stats(result.stderr.splitlines())
+
+        # Plain progress only reports durations : steps are drawn from build start
+        for title, duration, cached in stats.pop('timings'):
+            record('build.step', started, duration, lane='buildkit', step=title, cached=cached)
+
+        return {
+            'id': image_id,
+            'size': self.client.api.inspect_image(image_id).get('Size', 0),
+            **stats,
+        }
+
+    def _buildx_builder(self) -> str:
+        if self._buildx_run(['docker', 'buildx', 'inspect', BUILDX_BUILDER], check=False).returncode:
+            self._buildx_run(['docker', 'buildx', 'create', '--name', BUILDX_BUILDER,
+                              '--driver', 'docker-container'])
+        return BUILDX_BUILDER
+
+    def _buildx_run(self, command: list, check: bool = True, **kwargs) -> subprocess.CompletedProcess:
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=False, **kwargs)
+        except FileNotFoundError:
+            self.logger.panic('BuildKit builder requires docker CLI, with buildx plugin')
+
+        if check and result.returncode:
+            self.logger.debug(result.stderr)
+            self.logger.panic('Docker build error')
+        return result
 
     @docker_error_handler
-    def pull(self, repository: str, tag: str = 'latest', alias: str = None):
+    def relabel(self, name: str, tag: str, labels: dict):
+        # Labels only build : config is image config merged with provided labels,
+        # no layer is added (a commit would stack an empty one on each patch)
+        self.build(name, f'FROM { self._tag(name, tag) }\n', tag, squash=False, labels=labels, pull=False)
+
+    @docker_error_handler
+    def pull(self, repository: str, tag: str = 'latest', alias: str = None) -> dict:
         uri = f'{ repository }:{ tag }'
-        if not (image := self.client.images.pull(uri)):
-            self.logger.panic(f'Nothing to pull at { uri }')
+        try:
+            digest = self.client.images.get_registry_data(uri).id
+        except docker.errors.APIError as error:
+            self.logger.debug(error)
+            digest = None
+
+        transfer = self._transfer(
+            f'Pulling { uri }',
+            lambda: self.client.api.pull(repository, tag, stream=True, decode=True)
+        )
+
+        image = self.client.images.get(uri)
         if alias and isinstance(alias, str):
             image.tag(alias, tag)
 
-    @docker_error_handler
-    def push(self, repository: str, name: str, tag: str = 'latest', clean: bool = True):
-        self.logger.warning('Push status is not perfectly handled yet.')
-        self.logger.warning('To see full push trace, run with --debug option.')
+        return {'id': image.id, 'digest': digest, 'size': transfer.current, 'rate': transfer.rate}
 
+    @docker_error_handler
+    def push(self, repository: str, name: str, tag: str = 'latest', clean: bool = True) -> dict:
         image = self._get(name, tag)
         image.tag(repository, tag)
-        output = self.client.images.push(repository, tag)
-        self.logger.debug(output)
-        if clean:
-            self.remove(repository, tag)
+
+        try:
+            transfer = self._transfer(
+                f'Pushing { repository }:{ tag }',
+                lambda: self.client.api.push(repository, tag, stream=True, decode=True)
+            )
+            return {'size': transfer.current, 'rate': transfer.rate}
+        finally:
+            if clean:
+                self.remove(repository, tag)
+
+    def _transfer(self, description: str, stream: Callable[[], Iterator[dict]]) -> Transfer:
+        """Follow registry transfer stream with per-layer progress bars
+
+        Transient errors are retried with exponential backoff. Engine skips
+        layers completed by previous attempts, so a retry does not start over.
+
+        Args:
+            description (str): transfer description
+            stream (Callable[[], Iterator[dict]]): starts transfer, returns decoded event stream
+
+        Returns:
+            Transfer: completed transfer
+        """
+        transfer = Transfer()
+
+        with self.logger.progress() as progress:
+            overall = progress.add_task(description, total=None, status='')
+            bars = {}
+
+            def _retry(attempt: int):
+                progress.update(overall, status=f'[yellow]retry { attempt }/{ TRANSFER_RETRIES }')
+
+            for layer in self._follow(transfer, stream, _retry):
+                current, total, status = transfer.layers[layer]
+                if layer not in bars:
+                    bars[layer] = progress.add_task(f'  { layer }', total=None, status='')
+                progress.update(bars[layer], completed=current, total=total, status=status)
+                progress.update(overall, completed=transfer.current, total=transfer.total or None)
+
+            progress.update(
+                overall,
+                completed=transfer.current,
+                total=transfer.total,
+                status=f'[green]{ len(transfer.existing) } layer(s) already present',
+            )
+
+        return transfer
+
+    def _follow(self, transfer: Transfer, stream: Callable[[], Iterator[dict]],
+                on_retry: Callable[[int], None]) -> Iterator[str]:
+        """Feed transfer with engine stream, restarting it on transient errors
+
+        Args:
+            transfer (Transfer): transfer to update
+            stream (Callable[[], Iterator[dict]]): starts transfer, returns decoded event stream
+            on_retry (Callable[[int], None]): called with attempt number before each retry
+
+        Yields:
+            str: id of updated layer
+        """
+        for attempt in range(TRANSFER_RETRIES + 1):
+            try:
+                for event in stream():
+                    if layer := transfer.update(event):
+                        yield layer
+                return
+            except TransferError as error:
+                if attempt == TRANSFER_RETRIES or not error.transient:
+                    raise
+                self.logger.debug(error)
+                on_retry(attempt + 1)
+                time.sleep(2 ** attempt)
 
     @docker_error_handler
     def stat(self, name: str, tag: str = 'latest') -> bool:
         return self._get(name, tag)
 
+    @docker_error_handler
+    def read_file(self, name: str, tag: str, path: str) -> IO[bytes]:
+        container = self.client.api.create_container(self._tag(name, tag))
+        try:
+            stream, _ = self.client.api.get_archive(container['Id'], path)
+            fileobj = tempfile.SpooledTemporaryFile(max_size=BuildContext.SPOOL_SIZE)
+            with tarfile.open(fileobj=_ChunksReader(stream), mode='r|') as tar:
+                member = tar.next()
+                if not member or not member.isfile():
+                    raise docker.errors.NotFound(f'{ path } is not a file')
+                shutil.copyfileobj(tar.extractfile(member), fileobj)
+            fileobj.seek(0)
+            return fileobj
+        finally:
+            self.client.api.remove_container(container['Id'], force=True)
+
+    @docker_error_handler
+    def find(self, labels: dict) -> dict:
+        filters = {'label': [f'{ k }={ v }' for k, v in labels.items()]}
+        images = self.client.api.images(filters=filters)
+        if not images:
+            return None
+        image = max(images, key=lambda x: x.get('Created', 0))
+        return {'id': image['Id'], 'tags': image.get('RepoTags') or [], 'size': image.get('Size', 0)}
+
+    @docker_error_handler
+    def tag(self, image: str, name: str, tag: str = 'latest'):
+        self.client.api.tag(image, name, tag)
+
     @docker_error_handler
     def labels(self, name: str, tag: str = 'latest') -> dict:
         image = self._get(name, tag)
         return image.labels if image else {}
+
+
+# ---------------+
+#   Engine API   |
+# ---------------+
+
+
+def engine_error_handler(func):
+    """Engine API Error Generic Handler
+
+    Args:
+        func (types.FunctionType): image manager method
+    """
+
+    def _handler(self, *args, **kwargs):
+        try:
+            with span(f'engine.{ func.__name__ }'):
+                return func(self, *args, **kwargs)
+        except EngineError as error:
+            self.logger.debug(error)
+            if error.status is None:
+                self.logger.panic('Problem with container engine (--debug)')
+            if error.status == 404:
+                self.logger.panic('Local image not found')
+            self.logger.panic('Engine API error')
+        except OSError as error:
+            self.logger.debug(error)
+            self.logger.panic('Problem with container engine (--debug)')
+        except TransferError as error:
+            self.logger.debug(error)
+            self.logger.panic(f'Registry transfer failed : { error }')
+
+    return _handler
+
+
+class AsyncImageManager(DockerImageManager):
+    """Engine API image manager, over pooled asyncio connections
+
+    Talks to Docker or Podman (compatible API) socket directly, so that
+    bulk operations (list, prune, refresh) and metadata lookups share
+    keep-alive connections and run concurrently. TTY attach, builds and
+    single image transfers are left to docker-py, on the same socket.
+    """
+
+    def __init__(self, logger):
+        super().__init__(logger)
+        self._engine = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    @engine_error_handler
+    def engine(self) -> EngineClient:
+        """Engine API client, engine socket is detected on first use"""
+        if self._engine is None:
+            self._engine = EngineClient(engine_socket())
+        return self._engine
+
+    @property
+    @docker_error_handler
+    def client(self) -> docker.DockerClient:
+        if self._client is None:
+            self._client = docker.DockerClient(base_url=f'unix://{ self.engine.socket }')
+        return self._client
+
+    @property
+    @engine_error_handler
+    def experimental(self) -> bool:
+        if self._experimental is None:
+            info = self._call(self.engine.request('GET', '/info'))
+            # Podman squashes layers without experimental mode
+            self._experimental = self.engine.podman or info.get('ExperimentalBuild', False)
+        return self._experimental
+
+    def _call(self, coroutine):
+        """Run coroutine on manager event loop (started on first call), from any thread
+
+        Args:
+            coroutine (Coroutine): engine requests
+
+        Returns:
+            Any: coroutine result
+        """
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='kitt-engine', daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _local(self, tag: str) -> str:
+        # Podman qualifies local images names with `localhost/` registry
+        if self.engine.podman and tag.startswith('localhost/'):
+            return tag[len('localhost/'):]
+        return tag
+
+    @staticmethod
+    def _auth(repository: str) -> dict:
+        # Registry credentials from docker config, as docker CLI sends them
+        registry, _ = docker.auth.resolve_repository_name(repository)
+        if not (auth := docker.auth.resolve_authconfig(docker.auth.load_config(), registry)):
+            return {}
+        return {'X-Registry-Auth': docker.auth.encode_header(auth).decode('ascii')}
+
+    @engine_error_handler
+    def session(self, name: str) -> dict:
+        filters = {'label': [f'{ SESSION_LABEL }={ name }']}
+        containers = self._call(self.engine.request('GET', '/containers/json', {'filters': filters}))
+        if not containers:
+            return None
+        container = containers[0]
+        return {
+            'id': container['Id'],
+            'image': container['ImageID'],
+            'vault': (container.get('Labels') or {}).get(VAULT_LABEL),
+        }
+
+    @engine_error_handler
+    def stop(self, session: dict):
+        self._call(self.engine.request('POST', api_path('/containers/{}/stop', session['id'])))
+
+    @engine_error_handler
+    def list(self, repository: str = None) -> list:
+        return self._call(self._list(repository))
+
+    async def _list(self, repository: str = None) -> list:
+        filters = {'reference': [repository]} if repository else None
+        return [
+            {
+                'id': image['Id'],
+                'tags': [self._local(x) for x in image.get('RepoTags') or []],
+                'digests': [self._local(x) for x in image.get('RepoDigests') or []],
+                'labels': image.get('Labels') or {},
+                'size': image.get('Size', 0),
+                'created': image.get('Created', 0),
+            }
+            for image in await self.engine.request('GET', '/images/json', {'filters': filters})
+        ]
+
+    @engine_error_handler
+    def events(self, since: int, until: int) -> list:
+        return self._call(self._events(since, until))
+
+    async def _events(self, since: int, until: int) -> list:
+        params = {'since': since, 'until': until}
+        return [event async for event in self.engine.stream('GET', '/events', params)]
+
+    @engine_error_handler
+    def remove(self, name: str, tag: str = 'latest'):
+        self._call(self.engine.request('DELETE', api_path('/images/{}', self._tag(name, tag))))
+
+    @engine_error_handler
+    def plan_prune(self, repositories: list, labels: list) -> dict:
+        return self._call(self._plan_prune(repositories, labels))
+
+    async def _plan_prune(self, repositories: list, labels: list) -> dict:
+        usage = await self.engine.request('GET', '/system/df')
+        for image in usage.get('Images') or []:
+            image['RepoTags'] = [self._local(x) for x in image.get('RepoTags') or []]
+        plan = prune.select(usage, repositories, labels)
+
+        ids = prune.inspected(plan)
+        images = await asyncio.gather(*(
+            self.engine.request('GET', api_path('/images/{}/json', x)) for x in ids
+        ))
+        layers = {x: image['RootFS']['Layers'] for x, image in zip(ids, images)}
+
+        ids = prune.covering(plan, layers)
+        histories = await asyncio.gather(*(
+            self.engine.request('GET', api_path('/images/{}/history', x)) for x in ids
+        ))
+        return prune.estimate(plan, layers, dict(zip(ids, histories)))
+
+    @engine_error_handler
+    def prune(self, plan: dict, jobs: int = 8) -> dict:
+        return self._call(self._prune(plan, jobs))
+
+    async def _prune(self, plan: dict, jobs: int) -> dict:
+        slots = asyncio.Semaphore(jobs)
+
+        async def _remove(references: list):
+            async with slots:
+                for reference in references:
+                    await self.engine.request('DELETE', api_path('/images/{}', reference))
+
+        removals = prune.removals(plan)
+        results = await asyncio.gather(*(_remove(x) for _, x in removals), return_exceptions=True)
+        failed = []
+        for (key, _), result in zip(removals, results):
+            if isinstance(result, EngineError):
+                self.logger.debug(result)
+                failed.append(key)
+            elif isinstance(result, BaseException):
+                raise result
+
+        usage = await self.engine.request('GET', '/system/df')
+        return {'failed': failed, 'reclaimed': max(plan['usage'] - usage.get('LayersSize', 0), 0)}
+
+    @engine_error_handler
+    def refresh(self, repository: str, origins: dict, jobs: int = 4) -> dict:
+        return self._call(self._refresh_all(repository, origins, jobs))
+
+    async def _refresh_all(self, repository: str, origins: dict, jobs: int) -> dict:
+        local = {}
+        for image in await self._list(repository):
+            for tag in image['tags']:
+                if tag.startswith(f'{ repository }:'):
+                    local[tag[len(repository) + 1:]] = image['id']
+
+        # Images rebuilt or re-tagged locally since pull are left untouched
+        origins = sorted((tag, x) for tag, x in origins.items() if local.get(tag) == x.get('image'))
+        slots = asyncio.Semaphore(jobs)
+
+        with self.logger.progress() as progress:
+            updated = await asyncio.gather(*(
+                self._refresh_tag(repository, tag, origin, progress, slots)
+                for tag, origin in origins
+            ))
+
+        return {tag: origin for (tag, _), origin in zip(origins, updated) if origin}
+
+    async def _refresh_tag(self, repository: str, tag: str, origin: dict, progress,
+                           slots: asyncio.Semaphore) -> dict:
+        task = progress.add_task(tag, total=None, status='checking')
+        remote = origin['repository']
+        uri = f'{ remote }:{ tag }'
+        auth = self._auth(remote)
+
+        try:
+            # Remote digests are all checked at once, only pulls are limited to `jobs`
+            distribution = await self.engine.request(
+                'GET', api_path('/distribution/{}/json', uri), headers=auth)
+            digest = distribution['Descriptor']['digest']
+            if digest == origin.get('digest'):
+                progress.update(task, total=0, status='[green]up to date')
+                return None
+
+            async with slots:
+                progress.update(task, status='pulling')
+                transfer = Transfer()
+                for attempt in range(TRANSFER_RETRIES + 1):
+                    try:
+                        params = {'fromImage': remote, 'tag': tag}
+                        events = self.engine.stream('POST', '/images/create', params, headers=auth)
+                        try:
+                            async for event in events:
+                                if transfer.update(event):
+                                    progress.update(task, total=transfer.total or None,
+                                                    completed=transfer.current)
+                        finally:
+                            await events.aclose()
+                        break
+                    except TransferError as error:
+                        if attempt == TRANSFER_RETRIES or not error.transient:
+                            raise
+                        self.logger.debug(error)
+                        progress.update(task, status=f'[yellow]retry { attempt + 1 }')
+                        await asyncio.sleep(2 ** attempt)
+
+            await self.engine.request(
+                'POST', api_path('/images/{}/tag', uri), {'repo': repository, 'tag': tag})
+            await self.engine.request('DELETE', api_path('/images/{}', uri))
+            image = await self.engine.request('GET', api_path('/images/{}/json', self._tag(repository, tag)))
+        except (EngineError, TransferError) as error:
+            self.logger.debug(error)
+            progress.update(task, status='[red]failed (--debug)')
+            return None
+
+        progress.update(task, status='[green]updated')
+        return {**origin, 'digest': digest, 'image': image['Id']}
+
+    @engine_error_handler
+    def stat(self, name: str, tag: str = 'latest') -> bool:
+        return self._call(self._stat(self._tag(name, tag)))
+
+    async def _stat(self, reference: str) -> bool:
+        try:
+            await self.engine.request('GET', api_path('/images/{}/json', reference))
+        except EngineError as error:
+            if error.status == 404:
+                return False
+            raise
+        return True
+
+    @engine_error_handler
+    def find(self, labels: dict) -> dict:
+        filters = {'label': [f'{ k }={ v }' for k, v in labels.items()]}
+        images = self._call(self.engine.request('GET', '/images/json', {'filters': filters}))
+        if not images:
+            return None
+        image = max(images, key=lambda x: x.get('Created', 0))
+        tags = [self._local(x) for x in image.get('RepoTags') or []]
+        return {'id': image['Id'], 'tags': tags, 'size': image.get('Size', 0)}
+
+    @engine_error_handler
+    def tag(self, image: str, name: str, tag: str = 'latest'):
+        self._call(self.engine.request(
+            'POST', api_path('/images/{}/tag', image), {'repo': name, 'tag': tag}))
+
+    @engine_error_handler
+    def labels(self, name: str, tag: str = 'latest') -> dict:
+        image = self._call(self.engine.request('GET', api_path('/images/{}/json', self._tag(name, tag))))
+        return (image.get('Config') or {}).get('Labels') or {}
+
+
+class _ChunksReader(io.RawIOBase):
+    """Read-only file object over an iterator of bytes chunks"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = iter(chunks)
+        self.pending = b''
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            if (chunk := next(self.chunks, None)) is None:
+                return 0
+            self.pending = memoryview(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+class _BuildSteps:
+    """Legacy builder stream follower : built image, steps count and timing"""
+
+    def __init__(self):
+        self.logs = []
+        self.image = None
+        self.count = 0
+        self.cached = 0
+        self.step = None
+
+    def update(self, chunk: dict):
+        self.logs.append(chunk)
+        if image := (chunk.get('aux') or {}).get('ID'):
+            self.image = image
+
+        line = chunk.get('stream', '').strip()
+        if line.startswith('Step '):
+            self.close()
+            self.count += 1
+            self.step = (line, time.perf_counter(), False)
+        elif line == '---> Using cache' and self.step:
+            self.cached += 1
+            self.step = (*self.step[:2], True)
+
+    def close(self):
+        if self.step:
+            line, start, cached = self.step
+            record('build.step', start, time.perf_counter() - start, step=line, cached=cached)
+        self.step = None
+
+
+def _buildx_stats(lines: list) -> dict:
+    # Plain progress : `#<n> [<stage> <i>/<total>] <instruction>`, then
+    # `#<n> CACHED` for steps reused from cache, or `#<n> DONE <t>s`
+    steps, cached, durations = {}, set(), {}
+    for line in lines:
+        step, _, message = line.partition(' ')
+        if not step.startswith('#'):
+            continue
+        message = message.strip()
+        if message.startswith('[') and not message.startswith('[internal]'):
+            steps.setdefault(step, message)
+        elif message == 'CACHED':
+            cached.add(step)
+        elif message.startswith('DONE ') and message.endswith('s'):
+            try:
+                durations[step] = float(message[len('DONE '):-1])
+            except ValueError:
+                pass
+
+    timings = [(title, durations.get(step, 0.0), step in cached) for step, title in steps.items()]
+    return {'steps': len(steps), 'cached': len(cached & steps.keys()), 'timings': timings}
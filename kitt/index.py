@@ -0,0 +1,121 @@
+"""Local kitt images metadata index"""
+
+import json
+import time
+
+from kitt.config import ConfigUtils
+from kitt.logger import debug
+from kitt.profiler import traced
+
+
+class ImageIndex:
+    """On-disk index of local kitt images metadata, keyed by image id.
+
+    Image id is the digest of the image config, so an entry never goes
+    stale, only tags can move. Tags are synced again only when container
+    engine reported image events since last check, which costs a single
+    API call (or none at all for completion).
+    """
+
+    FILE = 'index.json'
+
+    # Full resync period, in case events were missed (ex. daemon restart)
+    TTL = 3600
+
+    # Docker daemon only keeps this many past events, if reached some were lost
+    EVENTS_BUFFER = 256
+
+    def __init__(self, repository: str = 'kitt', path: str = None):
+        self.repository = repository
+        self.path = path or ConfigUtils.cachepath(self.FILE)
+
+        data = ConfigUtils.read_json(self.path)
+        self.images = data.get('images', {})
+        self.synced = data.get('synced', 0)
+        self.checked = data.get('checked', 0)
+
+    def save(self):
+        """Write index to disk"""
+        data = {
+            'images': self.images,
+            'synced': self.synced,
+            'checked': self.checked,
+        }
+        try:
+            ConfigUtils.write_json(self.path, data)
+        except OSError as error:
+            debug(error)
+
+    @traced('index.sync')
+    def sync(self, manager):
+        """Make sure index reflects local images
+
+        Args:
+            manager (ImageManager): container engine image manager
+        """
+        now = int(time.time())
+
+        if now - self.synced < self.TTL:
+            events = manager.events(self.checked, now)
+            stale = len(events) >= self.EVENTS_BUFFER
+            stale |= any(event.get('Type') == 'image' for event in events)
+            if not stale:
+                self.checked = now
+                self.save()
+                return
+
+        images = {}
+        for image in manager.list(self.repository):
+            prefix = f'{ self.repository }:'
+            entry = self.images.get(image['id'], {})
+            images[image['id']] = {
+                'tags': [x[len(prefix):] for x in image['tags'] if x.startswith(prefix)],
+                'config': self._parse(image['labels']),
+                'size': image['size'],
+                'created': image['created'],
+                'last_run': entry.get('last_run'),
+            }
+
+        self.images = images
+        self.synced = self.checked = now
+        self.save()
+
+    def lookup(self, tag: str) -> dict:
+        """Find image metadata by tag
+
+        Args:
+            tag (str): kitt image name
+
+        Returns:
+            dict: image metadata with its `id`, None if unknown
+        """
+        for image_id, entry in self.images.items():
+            if tag in entry['tags']:
+                return {'id': image_id, **entry}
+        return None
+
+    def tags(self) -> list:
+        """Known kitt image names, without engine round-trip
+
+        Returns:
+            list: image names
+        """
+        return sorted(tag for entry in self.images.values() for tag in entry['tags'])
+
+    def touch(self, tag: str):
+        """Record image run time
+
+        Args:
+            tag (str): kitt image name
+        """
+        for entry in self.images.values():
+            if tag in entry['tags']:
+                entry['last_run'] = int(time.time())
+        self.save()
+
+    @staticmethod
+    def _parse(labels: dict) -> dict:
+        try:
+            return json.loads((labels or {})['kitt-config'])
+        except (KeyError, TypeError, json.decoder.JSONDecodeError):
+            return None
@@ -10,18 +10,66 @@
 import click
 
 from kitt.__version__ import __version__
-from kitt.client import client
 from kitt import logger
 
 
+def client():
+    """Kitt client, imported on demand so that commands which do not
+    talk to the container engine (version, completion, --help) stay
+    free of heavy imports and daemon round-trips.
+
+    Returns:
+        KittClient: kitt client
+    """
+    from kitt.client import KittClient
+
+    context = click.get_current_context(silent=True)
+    backend = context.find_root().params.get('backend') if context else None
+    return KittClient(backend or 'docker')
+
+
+def complete_images(ctx, param, incomplete: str) -> list:
+    """Complete local kitt image names from metadata index (no engine call)
+
+    Returns:
+        list: matching image names
+    """
+    from kitt.index import ImageIndex
+    return [tag for tag in ImageIndex('kitt').tags() if tag.startswith(incomplete)]
+
+
+def split_names(ctx, param, value: str) -> list:
+    """Split comma separated option value
+
+    Returns:
+        list: names, None if option is not set
+    """
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
 @click.group()
 @click.help_option('-h', '--help')
 @click.option('--debug', '-d', is_flag=True, help='Debug mode')
-def main(debug):
+@click.option('--profile', is_flag=True, help='Show phases timing, write trace file')
+@click.option('--trace-file', 'trace_file', type=click.Path(dir_okay=False), default='kitt-trace.json',
+              show_default=True, help='Profile trace file (Chrome trace format)')
+@click.option('--backend', type=click.Choice(['docker', 'async']), default='docker', envvar='KITT_BACKEND',
+              show_default=True, help='Container engine backend (async supports Podman socket)')
+@click.pass_context
+def main(ctx, debug, profile, trace_file, backend):
     """main command group"""
 
     logger.config(debug)
 
+    if profile:
+        from kitt import profiler
+
+        profiler.enable(trace_file)
+        ctx.call_on_close(profiler.finish)
+        ctx.with_resource(profiler.span(f'command.{ ctx.invoked_subcommand }'))
+
 
 @main.command('version')
 def _version():
@@ -35,17 +83,59 @@ def _version():
 @click.option('-v', '--volume', is_flag=False, multiple=True, help='Additional volume in OCI format')
 @click.option('-u', '--user', is_flag=False, help='Run as other host user')
 @click.option('--dind', is_flag=True, help='Enable docker in docker')
-@click.argument('name', type=click.STRING)
-def _run(name, volume, user, dind):
+@click.option('-s', '--secrets', callback=split_names, help='Only load these secrets (comma separated)')
+@click.option('-k', '--keep', is_flag=True, help='Keep session running after exit')
+@click.argument('name', type=click.STRING, shell_complete=complete_images)
+def _run(name, volume, user, dind, secrets, keep):
     """Run kitt shell"""
 
     extras = {
         "volumes": volume,
         "run_as": user,
         "dind": dind,
+        "secrets": secrets,
+        "keep": keep,
+    }
+
+    client().run(name, extras)
+
+
+@main.command('attach')
+@click.help_option('-h', '--help')
+@click.argument('name', type=click.STRING, shell_complete=complete_images)
+def _attach(name):
+    """Open shell in running session"""
+
+    client().attach(name)
+
+
+@main.command('warm')
+@click.help_option('-h', '--help')
+@click.option('-v', '--volume', is_flag=False, multiple=True, help='Additional volume in OCI format')
+@click.option('-u', '--user', is_flag=False, help='Run as other host user')
+@click.option('--dind', is_flag=True, help='Enable docker in docker')
+@click.option('-s', '--secrets', callback=split_names, help='Only load these secrets (comma separated)')
+@click.argument('name', type=click.STRING, shell_complete=complete_images)
+def _warm(name, volume, user, dind, secrets):
+    """Start session in background"""
+
+    extras = {
+        "volumes": volume,
+        "run_as": user,
+        "dind": dind,
+        "secrets": secrets,
     }
 
-    client.run(name, extras)
+    client().warm(name, extras)
+
+
+@main.command('stop')
+@click.help_option('-h', '--help')
+@click.argument('name', type=click.STRING, shell_complete=complete_images)
+def _stop(name):
+    """Stop running session"""
+
+    client().stop(name)
 
 
 @main.command('list')
@@ -53,42 +143,65 @@ def _run(name, volume, user, dind):
 def _list():
     """List local images"""
 
-    client.list()
+    client().list()
 
 
 @main.command('remove')
 @click.help_option('-h', '--help')
-@click.argument("name")
+@click.argument("name", shell_complete=complete_images)
 def _remove(name):
     """Remove local image"""
 
-    client.remove(name)
+    client().remove(name)
 
 
 @main.command('prune')
 @click.help_option('-h', '--help')
-def _prune():
+@click.option('-n', '--dry-run', 'dry_run', is_flag=True, help='Show images and space to reclaim, remove nothing')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=8, help='Concurrent image removals')
+def _prune(dry_run, jobs):
     """Prune local images"""
 
-    client.prune()
+    client().prune(dry_run, jobs)
 
 
 @main.command('refresh')
 @click.help_option('-h', '--help')
-def _refresh():
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=4, help='Concurrent image updates')
+def _refresh(jobs):
     """Pull latest version of local images"""
 
-    client.refresh()
+    client().refresh(jobs)
 
 
 @main.command('build')
 @click.help_option('-h', '--help')
-@click.argument('config', type=click.STRING)
-@click.argument('name', type=click.STRING)
-def _build(config, name):
+@click.option('--no-cache', 'nocache', is_flag=True, help='Rebuild from scratch, ignoring cache')
+@click.option('--explain', is_flag=True, help='Show plugins layer plan, without building')
+@click.option('--batch', 'manifest', type=click.Path(exists=True, dir_okay=False), help='Build images listed in manifest file')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=4, help='Concurrent image builds')
+@click.option('--builder', type=click.Choice(['legacy', 'buildkit']), help='Image builder (overrides config)')
+@click.option('--cache-dir', 'cache_dir', type=click.Path(file_okay=False), help='BuildKit local cache directory')
+@click.argument('pairs', metavar='CONFIG NAME [CONFIG NAME]...', nargs=-1, type=click.STRING)
+def _build(pairs, nocache, explain, manifest, jobs, builder, cache_dir):
     """Build image from source config file"""
 
-    client.build(name, config)
+    if len(pairs) % 2:
+        raise click.UsageError('Expected CONFIG NAME pairs')
+
+    images = [(name, config) for config, name in zip(pairs[::2], pairs[1::2])]
+
+    if manifest:
+        from kitt.client import load_manifest
+        images += load_manifest(manifest)
+    elif len(images) == 1:
+        client().build(images[0][0], images[0][1], nocache, explain, builder, cache_dir)
+        return
+
+    if not images:
+        raise click.UsageError('Expected CONFIG NAME pairs or --batch manifest')
+
+    client().batch(images, jobs, nocache, explain, builder, cache_dir)
 
 
 @main.command('pull')
@@ -98,35 +211,66 @@ def _build(config, name):
 def _pull(registry, name):
     """Pull image and exit"""
 
-    client.pull(registry, name)
+    client().pull(registry, name)
 
 
 @main.command('push')
 @click.help_option('-h', '--help')
 @click.argument('registry', type=click.STRING)
-@click.argument('name', type=click.STRING)
+@click.argument('name', type=click.STRING, shell_complete=complete_images)
 def _push(registry, name):
     """Push kitt image to registry"""
 
-    client.push(registry, name)
+    client().push(registry, name)
 
 
 @main.command('inspect')
 @click.help_option('-h', '--help')
-@click.argument('image', type=click.STRING)
+@click.argument('image', type=click.STRING, shell_complete=complete_images)
 def _inspect(image):
     """Show image metadata"""
 
-    client.inspect(image)
+    client().inspect(image)
 
 
 @main.command('patch')
 @click.help_option('-h', '--help')
-@click.argument('image', type=click.STRING)
+@click.argument('image', type=click.STRING, shell_complete=complete_images)
 def _patch(image):
     """Patch image runtime metadata"""
 
-    client.patch(image)
+    client().patch(image)
+
+
+@main.group('agent', invoke_without_command=True)
+@click.help_option('-h', '--help')
+@click.option('--ttl', type=click.IntRange(min=1), default=3600, help='Cached keys lifetime, in seconds')
+@click.option('-f', '--foreground', is_flag=True, help='Do not detach from terminal')
+@click.pass_context
+def _agent(ctx, ttl, foreground):
+    """Start vault unlock agent"""
+
+    if ctx.invoked_subcommand is None:
+        from kitt import agent
+        agent.start(ttl, foreground)
+
+
+@_agent.command('lock')
+@click.help_option('-h', '--help')
+def _agent_lock():
+    """Drop cached vault keys"""
+
+    from kitt import agent
+    agent.lock()
+
+
+@_agent.command('stop')
+@click.help_option('-h', '--help')
+def _agent_stop():
+    """Stop vault unlock agent"""
+
+    from kitt import agent
+    agent.stop()
 
 
 @main.command('completion')
@@ -4,10 +4,22 @@ import traceback
 
 from typing import Union
 
-from rich.console import Console
+_console = None
+_debug = False
 
-console = Console()
-console.debug = False
+
+def console():
+    """Rich console, created on first use to keep rich out of
+    commands that never print (ex. `--help`).
+
+    Returns:
+        rich.console.Console: shared console
+    """
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
 
 
 def success(msg: str):
@@ -16,7 +28,7 @@ def success(msg: str):
     Args:
         msg (str): success message
     """
-    console.print('[green]✓ ' + msg)
+    console().print('[green]✓ ' + msg)
 
 
 def info(msg: str):
@@ -25,7 +37,7 @@ def info(msg: str):
     Args:
         msg (str): info message
     """
-    console.print('[sky_blue3] ' + msg)
+    console().print('[sky_blue3] ' + msg)
 
 
 def warning(msg: str):
@@ -34,7 +46,7 @@ def warning(msg: str):
     Args:
         msg (str): warning message
     """
-    console.print('[yellow]~ ' + msg)
+    console().print('[yellow]~ ' + msg)
 
 
 def waiter(msg: str):
@@ -43,7 +55,30 @@ def waiter(msg: str):
     Args:
         msg (str): waiter message
     """
-    return console.status('[bold grey]' + msg)
+    return console().status('[bold grey]' + msg)
+
+
+def progress():
+    """Provide transfer progress display
+
+    Tasks expect a `status` field.
+    """
+    from rich.progress import (
+        Progress,
+        TextColumn,
+        BarColumn,
+        DownloadColumn,
+        TransferSpeedColumn,
+    )
+
+    return Progress(
+        TextColumn('[bold grey]{task.description}'),
+        BarColumn(),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TextColumn('{task.fields[status]}'),
+        console=console(),
+    )
 
 
 def debug(msg: Union[str, Exception]):
@@ -52,10 +87,10 @@ def debug(msg: Union[str, Exception]):
     Args:
         msg (Union[str, Exception]): debug data to log
     """
-    if console.debug:
+    if _debug:
         if not isinstance(msg, str):
-            console.log('[grey62]' + str(traceback.format_exc()))
-        console.log('[grey62]' + str(msg))
+            console().log('[grey62]' + str(traceback.format_exc()))
+        console().log('[grey62]' + str(msg))
 
 
 def config(debug_mode: bool = False):
@@ -64,7 +99,8 @@ def config(debug_mode: bool = False):
     Args:
         debug_mode (bool, optional): set debug mode. Defaults to False.
     """
-    console.debug = debug_mode
+    global _debug
+    _debug = debug_mode
 
 
 def panic(msg: str):
@@ -73,5 +109,5 @@ def panic(msg: str):
     Args:
         msg (str): panic message
     """
-    console.print('[red]✗ ' + msg)
+    console().print('[red]✗ ' + msg)
     exit(1)
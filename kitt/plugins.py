@@ -1,9 +1,103 @@
 """Kitt plugins definition and managment"""
 
-import jinja2
+import os
 
-from kitt.config import ConfigUtils
 from kitt.logger import panic
+from kitt.profiler import span
+
+
+def prepare(name: str, config: dict, context) -> dict:
+    """Prepare plugin configuration against build context
+
+    Plugins that need host files register them in build context, and get
+    their configuration rewritten with paths inside the context.
+
+    Args:
+        name (str): plugin name
+        config (dict): plugin configuration
+        context (BuildContext): image build context
+
+    Returns:
+        dict: plugin configuration, ready for compose
+    """
+    if hook := _HOOKS.get(name):
+        with span('plugin.prepare', plugin=name):
+            return hook(config, context)
+    return config
+
+
+def _prepare_copy(config: dict, context) -> dict:
+    files = []
+    for file in config.get('files', []):
+        src = file.get('src', '')
+        if not os.path.exists(src):
+            panic(f'Cannot copy "{ src }" : no such file or directory')
+        files.append({**file, 'src': context.add(src)})
+
+    return {**config, 'files': files}
+
+
+def _prepare_download(config: dict, context) -> dict:
+    from kitt.artifacts import ArtifactCache, ArtifactError
+
+    cache = ArtifactCache()
+    ressources = []
+    for ressource in config.get('ressources', []):
+        if sha256 := ressource.get('sha256'):
+            try:
+                path = cache.fetch(ressource.get('url', ''), sha256)
+            except ArtifactError as error:
+                panic(f'Cannot download "{ ressource.get("url") }" : { error }')
+            ressource = {**ressource, 'src': context.add(path)}
+        ressources.append(ressource)
+
+    return {**config, 'ressources': ressources}
+
+
+def _prepare_git(config: dict, context) -> dict:
+    from kitt.artifacts import ArtifactCache, ArtifactError
+
+    cache = ArtifactCache()
+    repos = []
+    for repo in config.get('repos', []):
+        if rev := repo.get('rev'):
+            try:
+                path = cache.checkout(repo.get('url', ''), rev)
+            except ArtifactError as error:
+                panic(f'Cannot clone "{ repo.get("url") }" at { rev } : { error }')
+            repo = {**repo, 'src': context.add(path)}
+        repos.append(repo)
+
+    return {**config, 'repos': repos}
+
+
+def _prepare_pip(config: dict, context) -> dict:
+    from kitt.artifacts import ArtifactCache
+
+    packages, pinned = [], []
+    for package in config.get('packages', []):
+        if not isinstance(package, dict):
+            packages.append(package)
+            continue
+        hashes = package.get('sha256', [])
+        hashes = [hashes] if isinstance(hashes, str) else hashes
+        pinned.append(' '.join([package.get('name', '')] + [f'--hash=sha256:{ x }' for x in hashes]))
+
+    if not pinned:
+        return config
+
+    # Pinned packages only change with the requirements file (layer cache key)
+    requirements = ArtifactCache().store(('\n'.join(pinned) + '\n').encode('utf-8'))
+    return {**config, 'packages': packages, 'requirements': context.add(requirements)}
+
+
+_HOOKS = {
+    'copy': _prepare_copy,
+    'download': _prepare_download,
+    'git': _prepare_git,
+    'pip': _prepare_pip,
+}
+
 
 def compose(name: str, config: dict) -> str:
     """generic compose method
@@ -15,18 +109,13 @@ def compose(name: str, config: dict) -> str:
     Returns:
        str: dockerfile string block
     """
+    from kitt import templates
 
-    templater = ConfigUtils.mkpath(f'static/plugins/{name}.j2')
-    try:
-        with open(templater, 'r', encoding='utf-8') as file:
-            template = file.read()
-    except OSError:
-        panic(f'Cannot load pluging "{name}" template')
+    if not (path := templates.registry().get(name)):
+        panic(f'Unknown plugin "{ name }"')
 
     try:
-        template = jinja2.Template(template)
-        return template.render(config)
-    except jinja2.TemplateError:
-        panic(f'Cannot render pluging "{name}" : missing or invalid config data provided')
-
-    raise Exception
+        return templates.render(path, config)
+    except templates.TemplateError as error:
+        line = f', line { error.lineno }' if error.lineno else ''
+        panic(f'Cannot render plugin "{ name }"{ line } : { error.message }')
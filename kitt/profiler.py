@@ -0,0 +1,164 @@
+"""Kitt phases profiler
+
+Records timed spans (config load, templating, vault, engine API calls,
+build steps, ...) when enabled with `kitt --profile`, then writes them as
+a Chrome trace (chrome://tracing, https://ui.perfetto.dev) and prints a
+per-phase summary. Disabled, spans cost a single global lookup.
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+
+# Default trace file, in current directory
+TRACE_FILE = 'kitt-trace.json'
+
+# Summary only shows this many phases, by total time
+SUMMARY_SIZE = 15
+
+_profiler = None
+
+
+class Profiler:
+    """Thread-safe trace events recorder"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def record(self, name: str, start: float, duration: float, lane: str = None, **args):
+        """Record complete event
+
+        Args:
+            name (str): phase name
+            start (float): start time (perf_counter)
+            duration (float): duration (s)
+            lane (str, optional): trace lane, defaults to current thread name.
+        """
+        event = {
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': round((start - self.origin) * 1e6),
+            'dur': round(duration * 1e6),
+            'pid': os.getpid(),
+            'tid': lane or threading.current_thread().name,
+            'args': args,
+        }
+        with self.lock:
+            self.events.append(event)
+
+    def summary(self) -> list:
+        """Per-phase totals
+
+        Returns:
+            list: `name`, `count`, `total` and `max` duration (s), by decreasing total
+        """
+        phases = {}
+        for event in self.events:
+            phase = phases.setdefault(event['name'], {'name': event['name'], 'count': 0, 'total': 0, 'max': 0})
+            phase['count'] += 1
+            phase['total'] += event['dur'] / 1e6
+            phase['max'] = max(phase['max'], event['dur'] / 1e6)
+        return sorted(phases.values(), key=lambda x: x['total'], reverse=True)
+
+    def write(self):
+        """Write Chrome trace file"""
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+
+def enable(path: str = TRACE_FILE):
+    """Start recording spans
+
+    Args:
+        path (str, optional): trace file path. Defaults to TRACE_FILE.
+    """
+    global _profiler
+    _profiler = Profiler(path)
+
+
+def enabled() -> bool:
+    """Whether spans are recorded"""
+    return _profiler is not None
+
+
+def span(name: str, **args):
+    """Time a phase
+
+    Args:
+        name (str): phase name, prefixed by its category (ex. `docker.build`)
+        **args (Any): phase details, shown in trace
+
+    Returns:
+        ContextManager: timing context
+    """
+    if _profiler is None:
+        return contextlib.nullcontext()
+    return _span(_profiler, name, args)
+
+
+def record(name: str, start: float, duration: float, lane: str = None, **args):
+    """Record an already timed phase (ex. reported by container engine)
+
+    Args:
+        name (str): phase name
+        start (float): start time (perf_counter)
+        duration (float): duration (s)
+        lane (str, optional): trace lane. Defaults to current thread.
+    """
+    if _profiler is not None:
+        _profiler.record(name, start, duration, lane, **args)
+
+
+def traced(name: str):
+    """Decorator timing each call of function
+
+    Args:
+        name (str): phase name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _span(_profiler, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def finish():
+    """Write trace and print summary, if enabled"""
+    global _profiler
+    if (profiler := _profiler) is None:
+        return
+    _profiler = None
+
+    from kitt.logger import info, warning
+
+    try:
+        profiler.write()
+    except OSError as error:
+        warning(f'Could not write trace : { error }')
+        return
+
+    info(f'{ "PHASE" :<28} { "COUNT" :>5} { "TOTAL" :>9} { "MAX" :>9}')
+    for phase in profiler.summary()[:SUMMARY_SIZE]:
+        info(f'{ phase["name"] :<28} { phase["count"] :>5} '
+             f'{ phase["total"] * 1000 :>7.1f}ms { phase["max"] * 1000 :>7.1f}ms')
+    info(f'Trace written to { profiler.path }')
+
+
+@contextlib.contextmanager
+def _span(profiler: Profiler, name: str, args: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, start, time.perf_counter() - start, **args)
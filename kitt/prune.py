@@ -0,0 +1,197 @@
+"""Kitt-scoped prune planning
+
+Works out which local images a prune removes and how much disk space it
+gives back, before removing anything. Sizes come from engine disk usage
+report (`/system/df`) : bytes only used by one image are known from its
+`Size` and `SharedSize`. Layers shared by several removed images (and no
+kept one) are found from image layers, chained as engine stores them,
+and sized from the history of one image holding them.
+"""
+
+import hashlib
+
+# History steps which never create a layer
+METADATA = (
+    'ARG', 'CMD', 'ENTRYPOINT', 'ENV', 'EXPOSE', 'HEALTHCHECK', 'LABEL', 'MAINTAINER',
+    'ONBUILD', 'SHELL', 'STOPSIGNAL', 'USER', 'VOLUME', 'WORKDIR',
+)
+
+
+def chain_ids(diff_ids: list) -> list:
+    """Layer chain ids, which identify a layer along with all layers below it
+
+    Args:
+        diff_ids (list): image `RootFS.Layers`, bottom layer first
+
+    Returns:
+        list: chain ids, in same order
+    """
+    chain = []
+    for diff in diff_ids:
+        if chain:
+            diff = 'sha256:' + hashlib.sha256(f'{ chain[-1] } { diff }'.encode()).hexdigest()
+        chain.append(diff)
+    return chain
+
+
+def layer_sizes(history: list, count: int) -> list:
+    """Match image history steps to its layers
+
+    Steps with a size always created a layer, metadata ones never did.
+    Squashed images keep build steps history without their layers, so
+    steps without size are only counted when sized ones fall short.
+
+    Args:
+        history (list): image history, as reported by engine (newest step first)
+        count (int): image layers count
+
+    Returns:
+        list: layers size, bottom layer first, None if history does not match layers
+    """
+    steps = list(reversed(history))
+    layers = [x for x in steps if x.get('Size', 0) > 0]
+    if len(layers) != count:
+        layers = [x for x in steps if x.get('Size', 0) > 0 or not _metadata(x)]
+    if len(layers) != count:
+        return None
+    return [x.get('Size', 0) for x in layers]
+
+
+def select(usage: dict, repositories: list, labels: list) -> dict:
+    """Pick images to remove
+
+    Images tagged in one of repositories are removed, along with untagged
+    ones carrying one of labels (previous builds). Images used by a
+    container are kept, and so are images also tagged in other
+    repositories, which are only untagged.
+
+    Args:
+        usage (dict): engine disk usage report
+        repositories (list): pruned repositories
+        labels (list): labels of untagged images to prune
+
+    Returns:
+        dict: plan, with `images` to remove (`id`, `tags`, `size`, `shared`), `untag`,
+              `in_use` and `kept` images, and `usage` (layers disk usage)
+    """
+    prefixes = tuple(f'{ x }:' for x in repositories)
+    in_use = {x.get('ImageID') for x in usage.get('Containers') or []}
+    plan = {'images': [], 'untag': [], 'in_use': [], 'kept': [], 'usage': usage.get('LayersSize', 0)}
+
+    for image in usage.get('Images') or []:
+        tags = [x for x in image.get('RepoTags') or [] if x != '<none>:<none>']
+        ours = [x for x in tags if x.startswith(prefixes)]
+        previous = not tags and any(x in (image.get('Labels') or {}) for x in labels)
+        entry = {
+            'id': image['Id'],
+            'tags': ours,
+            'size': image.get('Size', 0),
+            'shared': image.get('SharedSize', -1),
+        }
+
+        if not ours and not previous:
+            plan['kept'].append(entry)
+        elif image['Id'] in in_use or image.get('Containers', 0) > 0:
+            plan['in_use'].append(entry)
+            plan['kept'].append(entry)
+        elif len(ours) < len(tags):
+            plan['untag'].extend(ours)
+            plan['kept'].append(entry)
+        else:
+            plan['images'].append(entry)
+
+    return plan
+
+
+def inspected(plan: dict) -> list:
+    """Images which layers are needed to find shared ones
+
+    Returns:
+        list: ids of images sharing layers (or with unknown shared size)
+    """
+    return [x['id'] for x in plan['images'] + plan['kept'] if x['shared'] != 0]
+
+
+def covering(plan: dict, layers: dict) -> list:
+    """Removed images which history sizes all layers only shared between removed images
+
+    Args:
+        plan (dict): prune plan
+        layers (dict): per image id, its `RootFS.Layers`
+
+    Returns:
+        list: image ids, deepest images first
+    """
+    shared, _ = _shared(plan, layers)
+    ids = []
+    for image in sorted(plan['images'], key=lambda x: -len(layers.get(x['id'], []))):
+        if chain := set(chain_ids(layers.get(image['id'], []))) & shared:
+            ids.append(image['id'])
+            shared -= chain
+    return ids
+
+
+def estimate(plan: dict, layers: dict, histories: dict) -> dict:
+    """Complete plan with layers kept and bytes reclaimable
+
+    Args:
+        plan (dict): prune plan
+        layers (dict): per image id, its `RootFS.Layers`
+        histories (dict): per image id, its history (images from `covering`)
+
+    Returns:
+        dict: plan, with `shared` (removed images layers kept, as used by other
+              images) and `reclaimable` bytes
+    """
+    shared, kept = _shared(plan, layers)
+
+    sizes = {}
+    for image, history in histories.items():
+        chain = chain_ids(layers[image])
+        for layer, size in zip(chain, layer_sizes(history, len(chain)) or []):
+            sizes[layer] = size
+
+    plan['shared'] = len(kept)
+    plan['reclaimable'] = sum(x['size'] - max(x['shared'], 0) for x in plan['images'])
+    plan['reclaimable'] += sum(sizes.get(x, 0) for x in shared)
+    return plan
+
+
+def removals(plan: dict) -> list:
+    """Engine removals applying plan
+
+    Removing the last tag of an image removes it, images without tags
+    are removed by id.
+
+    Returns:
+        list: image id (or tag, for images only untagged) and references to remove in order
+    """
+    return [(x['id'], x['tags'] or [x['id']]) for x in plan['images']] + [(x, [x]) for x in plan['untag']]
+
+
+def _shared(plan: dict, layers: dict) -> tuple:
+    """Removed images layers used by several images
+
+    Returns:
+        tuple: layers only used by removed images, layers also used by kept ones
+    """
+    users = {}
+    for image in plan['images'] + plan['kept']:
+        for layer in chain_ids(layers.get(image['id'], [])):
+            users.setdefault(layer, set()).add(image['id'])
+
+    removed = {x['id'] for x in plan['images']}
+    shared, kept = set(), set()
+    for layer, images in users.items():
+        if images & removed and len(images) > 1:
+            (shared if images <= removed else kept).add(layer)
+    return shared, kept
+
+
+def _metadata(step: dict) -> bool:
+    command = step.get('CreatedBy', '').strip()
+    for prefix in ('/bin/sh -c ', '#(nop)'):
+        if command.startswith(prefix):
+            command = command[len(prefix):]
+    command = command.strip()
+    return command.split(' ', 1)[0].upper() in METADATA
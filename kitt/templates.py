@@ -0,0 +1,152 @@
+"""Shared jinja2 environment and plugins registry
+
+Templates (Dockerfile and plugins) are loaded by path through a single
+environment, so each one is compiled once per process, and compiled code
+is kept on disk across runs (bytecode cache, checked against source).
+
+Plugins are discovered once, later sources override former ones:
+    - built-in plugins (kitt/static/plugins/<name>.j2)
+    - `kitt.plugins` entry points, named after plugin and loading to a template path
+    - directories listed in KITT_PLUGINS_PATH (`:` separated)
+"""
+
+import os
+import functools
+import traceback
+
+import jinja2
+
+from kitt.config import ConfigUtils
+from kitt.logger import debug, warning
+from kitt.profiler import span
+
+PLUGINS_PATH = 'KITT_PLUGINS_PATH'
+
+ENTRY_POINTS = 'kitt.plugins'
+
+
+class TemplateError(Exception):
+    """Template could not be loaded or rendered, with its location"""
+
+    def __init__(self, message: str, name: str = None, lineno: int = None):
+        location = f'{ name }, line { lineno }' if lineno else name
+        super().__init__(f'{ location } : { message }' if location else message)
+        self.message = message
+        self.lineno = lineno
+
+
+@functools.lru_cache(maxsize=None)
+def environment() -> jinja2.Environment:
+    """Shared templates environment
+
+    Returns:
+        jinja2.Environment: environment, template names are file paths
+    """
+    bytecode_cache = None
+    directory = ConfigUtils.cachepath('templates')
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.access(directory, os.W_OK):
+            bytecode_cache = jinja2.FileSystemBytecodeCache(directory)
+    except OSError as error:
+        debug(error)
+
+    return jinja2.Environment(
+        loader=jinja2.FunctionLoader(_load),
+        bytecode_cache=bytecode_cache,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def registry() -> dict:
+    """Available plugins
+
+    Returns:
+        dict: plugin name to template path
+    """
+    plugins = _scan(ConfigUtils.mkpath('static/plugins'))
+
+    for entry_point in _entry_points():
+        try:
+            plugins[entry_point.name] = os.fspath(entry_point.load())
+        except (ImportError, AttributeError, TypeError) as error:
+            warning(f'Plugin { entry_point.name } not loaded ({ entry_point.value }) : { error }')
+
+    for directory in os.environ.get(PLUGINS_PATH, '').split(os.pathsep):
+        if directory:
+            plugins.update(_scan(directory))
+
+    return plugins
+
+
+def _entry_points() -> list:
+    """Plugins entry points (group selection is only available from Python 3.10)"""
+    from importlib.metadata import entry_points
+    found = entry_points()
+    if hasattr(found, 'select'):
+        return list(found.select(group=ENTRY_POINTS))
+    return list(found.get(ENTRY_POINTS, []))
+
+
+def render(path: str, values: dict) -> str:
+    """Render template file
+
+    Args:
+        path (str): template path
+        values (dict): templating values
+
+    Raises:
+        TemplateError: template is missing, invalid, or failed to render
+
+    Returns:
+        str: rendered text
+    """
+    try:
+        with span('template.load', template=os.path.basename(path)):
+            template = environment().get_template(path)
+    except jinja2.TemplateNotFound as error:
+        raise TemplateError('cannot load template', path) from error
+    except jinja2.TemplateSyntaxError as error:
+        raise TemplateError(error.message, path, error.lineno) from error
+
+    try:
+        with span('template.render', template=os.path.basename(path)):
+            return template.render(values)
+    except jinja2.TemplateError as error:
+        raise TemplateError(error.message or str(error), path, _lineno(error, path)) from error
+
+
+def _scan(directory: str) -> dict:
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return {}
+    return {
+        name[:-len('.j2')]: os.path.join(directory, name)
+        for name in names if name.endswith('.j2')
+    }
+
+
+def _load(path: str) -> tuple:
+    try:
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as file:
+            source = file.read()
+    except OSError:
+        return None
+
+    def uptodate() -> bool:
+        try:
+            return os.path.getmtime(path) == mtime
+        except OSError:
+            return False
+
+    return source, path, uptodate
+
+
+def _lineno(error: Exception, path: str) -> int:
+    # Template code frames are rewritten by jinja2 with template file and line
+    for frame in reversed(traceback.extract_tb(error.__traceback__)):
+        if frame.filename == path:
+            return frame.lineno
+    return None
@@ -0,0 +1,103 @@
+"""Registry transfer (pull / push) progress tracking"""
+
+import time
+
+# Engine error messages worth another attempt (network hiccups, registry overload)
+TRANSIENT_ERRORS = [
+    'timeout',
+    'timed out',
+    'connection reset',
+    'connection refused',
+    'broken pipe',
+    'eof',
+    'tls handshake',
+    'temporary failure',
+    'no such host',
+    'too many requests',
+    '502 bad gateway',
+    '503 service unavailable',
+    '504 gateway timeout',
+]
+
+# Layer statuses meaning layer does not need to be transferred
+EXISTING = ('Already exists', 'Layer already exists')
+
+
+class TransferError(Exception):
+    """Error reported inside engine transfer stream"""
+
+    @property
+    def transient(self) -> bool:
+        """Whether error is likely to go away on retry"""
+        message = str(self).lower()
+        return any(pattern in message for pattern in TRANSIENT_ERRORS)
+
+
+class Transfer:
+    """Tracks engine JSON progress stream of one image transfer.
+
+    Docker (and Podman compat API) report one event per layer update:
+    `{"id": "<layer>", "status": "Downloading", "progressDetail": {"current": x, "total": y}}`
+    """
+
+    def __init__(self):
+        self.layers = {}
+        self.existing = set()
+        self.started = time.monotonic()
+
+    def update(self, event: dict) -> str:
+        """Feed one stream event
+
+        Args:
+            event (dict): decoded JSON event
+
+        Raises:
+            TransferError: engine reported an error
+
+        Returns:
+            str: id of layer being transferred, None if event is not about one
+        """
+        if error := event.get('error'):
+            raise TransferError(error)
+
+        layer = event.get('id')
+        status = event.get('status', '')
+        detail = event.get('progressDetail') or {}
+
+        if not layer:
+            return None
+
+        if status in EXISTING or status.startswith('Mounted from'):
+            self.existing.add(layer)
+            self.layers.pop(layer, None)
+            return None
+
+        # Layers are tracked from their first progress report. Extraction
+        # progress is reported with same fields, it is ignored.
+        if status in ('Downloading', 'Pushing') and detail.get('total'):
+            current, total = detail.get('current', 0), detail['total']
+        elif layer in self.layers:
+            current, total, _ = self.layers[layer]
+            if status in ('Download complete', 'Pull complete', 'Pushed'):
+                current = total
+        else:
+            return None
+
+        self.layers[layer] = (current, total, status)
+        return layer
+
+    @property
+    def current(self) -> int:
+        """Bytes transferred so far"""
+        return sum(current for current, _, _ in self.layers.values())
+
+    @property
+    def total(self) -> int:
+        """Bytes to transfer, as known so far"""
+        return sum(total for _, total, _ in self.layers.values())
+
+    @property
+    def rate(self) -> float:
+        """Average throughput, in bytes per second"""
+        elapsed = time.monotonic() - self.started
+        return self.current / elapsed if elapsed else 0.0
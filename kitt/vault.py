@@ -1,91 +1,536 @@
+"""Kitt vault: encrypted secret files and env variables bundled in image
+
+Vault format v3 is a binary stream :
+
+    magic (`KITT\\x03`) | length | JSON header | length | sealed index | entries
+
+Header holds key derivation (salted scrypt, calibrated at creation) and
+stream cipher parameters, and is authenticated with everything else.
+Each secret (env variable or file) is an entry, encrypted on its own as a
+chunked AEAD stream, under a key derived (HKDF) from the master key.
+Index lists entries (name, size, ...) so that only requested secrets are
+decrypted (concurrently, as each has its own key, nonce and length), and
+files are copied chunk by chunk, never held whole in memory.
+Format v2 (a single stream of records) is still read.
+
+Vault is stored as a file in the last image layer, image label only holds
+its path and digest. Vault format v1 (base64 encoded Fernet token of a JSON
+document with base64 encoded files), stored in image label, is still read.
+"""
+
+import io
 import os
+import re
+import json
 import uuid
+import hashlib
+import shutil
+import struct
+import atexit
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
 
-from fs.tempfs import TempFS, errors as TempFSErrors
+from typing import IO, Union
 
-from kitt.crypto import b64, b64d, cipher_dict, secure_prompt, uncipher_dict
+from cryptography.exceptions import InvalidTag
+
+from kitt.crypto import (
+    CHUNK_SIZE,
+    NONCE_PREFIX_SIZE,
+    UNLOCK_TIME,
+    CipherReader,
+    CipherWriter,
+    b64,
+    b64d,
+    calibrate_kdf,
+    derive_key,
+    seal,
+    sealed_size,
+    secure_prompt,
+    subkey,
+    uncipher_dict,
+    unseal,
+)
+from kitt import agent
 from kitt.logger import warning, info
+from kitt.profiler import traced
+
+VAULT_MAGIC = b'KITT\x03'
+
+# Previous formats, still read
+_MAGICS = (VAULT_MAGIC, b'KITT\x02')
+
+# Vault file location inside image, only read from host side (never mounted)
+VAULT_PATH = '/usr/share/kitt/vault'
+
+RECORD_ENV = b'E'
+RECORD_FILE = b'F'
+
+# Vault entries decrypted concurrently
+DECRYPT_JOBS = 4
+
+_LENGTH = struct.Struct('>I')
+_RECORD = struct.Struct('>cH')
+_RECORD_SIZE = struct.Struct('>Q')
+
 
 class VaultFS:
-    """Vault tmp filesystem to mount secrets
+    """Vault files store, each file is bind mounted in container.
+
+    Files live in a private directory of a memory backed filesystem when
+    available (user runtime directory, then /dev/shm), so that secrets never
+    hit the disk and do not survive a reboot (otherwise system temporary
+    directory is used, with a warning). Directories left behind by a
+    kitt process that did not exit properly are swept on next use.
     """
-    bindfs = None
 
-    def __init__(self):
-        self.bindfs = TempFS()
-        self.fs_root = self.bindfs.getsyspath('/')
+    def __init__(self, persistent: bool = False):
+        # Persistent vault outlives kitt process (session containers),
+        # it is removed with `discard` once container is stopped
+        self.persistent = persistent
+        base = _base_dir()
+        _sweep(base)
 
-    def load(self, files: [str]) -> dict:
-        """Load files in tmpfs
+        prefix = 'kitt-session-' if persistent else f'kitt-vault-{ os.getpid() }-'
+        self.fs_root = tempfile.mkdtemp(prefix=prefix, dir=base)
+        self.volumes = {}
+
+        if not persistent:
+            atexit.register(self.close)
+
+    def open(self, location: str) -> IO[bytes]:
+        """Create file in store, to be mounted at location
 
         Args:
-            files [str]: base64 encoded files
+            location (str): container path
 
         Returns:
-            dict: file mapping list
+            IO[bytes]: file opened for writing
         """
+        fpath = os.path.join(self.fs_root, str(uuid.uuid4()))
+        self.volumes[fpath] = {
+            'bind': location,
+            'mode': 'rw',
+        }
+        fd = os.open(fpath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        return open(fd, 'wb')
 
-        volumes = {}
-
-        for file in files:
-            fname = str(uuid.uuid4())
-            fpath = os.path.join(self.fs_root, fname)
-
-            with open(fpath, 'wb+') as fout:
-                fout.write(b64d(file['file']))
+    def close(self):
+        """Remove store, unless persistent
+        """
+        if not self.persistent:
+            self.discard(self.fs_root)
 
-            volumes[fpath] = {
-                'bind': file['location'],
-                'mode': 'rw',
-            }
-            
-        return volumes
+    @staticmethod
+    def discard(fs_root: str):
+        """Remove vault store
 
-    def close(self):
-        """Close temp filesystem
+        Args:
+            fs_root (str): vault store root path
         """
         try:
-            self.bindfs.close()
-        except AttributeError:
+            shutil.rmtree(fs_root)
+        except FileNotFoundError:
             pass
-        except TempFSErrors.OperationFailed:
-            warning('Could not properly remove local tempfs.')
-            warning('Sensible data might remain on disk.')
+        except OSError:
+            warning('Could not properly remove vault files.')
+            warning(f'Sensible data might remain in { fs_root }.')
+
+
+def _base_dir() -> str:
+    for base in (os.environ.get('XDG_RUNTIME_DIR'), '/dev/shm'):
+        if base and os.path.isdir(base) and os.access(base, os.W_OK | os.X_OK):
+            return base
+
+    base = tempfile.gettempdir()
+    warning('No memory backed directory available (XDG_RUNTIME_DIR, /dev/shm).')
+    warning(f'Vault files are written on disk, in { base }.')
+    return base
+
+
+def _sweep(base: str):
+    # Vault directories are named after their kitt process, and dropped once it is gone
+    for name in os.listdir(base):
+        if not (match := re.match(r'kitt-vault-(\d+)-', name)):
+            continue
+        path = os.path.join(base, name)
+        try:
+            if os.lstat(path).st_uid != os.getuid():
+                continue
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def create_vault(config: dict, output: IO[bytes], unlock_time: float = UNLOCK_TIME) -> str:
+    """Create encrypted vault, to be copied inside image
+
+    Args:
+        config (dict): secrets config (`files` and `envs` entries)
+        output (IO[bytes]): binary output file
+        unlock_time (float, optional): key derivation target time (s). Defaults to UNLOCK_TIME.
 
-def create_vault(config: dict) -> str:
-    """Create base64 encoded encrypted vault to attach
+    Returns:
+        str: vault digest, as `sha256:<hex>`
     """
 
     info('Remember secret strengh is proportional to password strengh.')
     info('Most of the time, a strong password is a long password.')
 
+    kdf = calibrate_kdf(unlock_time)
     password = secure_prompt()
 
-    vault = {
-        'files': [],
-        'envs': {},
+    dump_vault(config, password, output, kdf)
+    output.flush()
+    output.seek(0)
+
+    return vault_digest(output)
+
+
+def vault_digest(source: IO[bytes]) -> str:
+    """Digest of vault file, checked before loading it
+
+    Args:
+        source (IO[bytes]): binary vault stream, read until end
+
+    Returns:
+        str: vault digest, as `sha256:<hex>`
+    """
+    hasher = hashlib.sha256()
+    while chunk := source.read(CHUNK_SIZE):
+        hasher.update(chunk)
+    return 'sha256:' + hasher.hexdigest()
+
+
+@traced('vault.encrypt')
+def dump_vault(config: dict, password: str, output: IO[bytes], kdf: dict = None):
+    """Write encrypted vault (v3) to output stream
+
+    Args:
+        config (dict): secrets config (`files` and `envs` entries)
+        password (str): vault password
+        output (IO[bytes]): binary output stream
+        kdf (dict, optional): key derivation parameters. Defaults to calibrated scrypt.
+    """
+    params = {
+        'cipher': 'aes-256-gcm',
+        'kdf': kdf or calibrate_kdf(),
+        'chunk_size': CHUNK_SIZE,
     }
+    header = json.dumps(params).encode('utf-8')
+    master = derive_key(password, params['kdf'])
+
+    index, payloads = [], []
+
+    for env in config.get('envs', []):
+        value = env['value'].encode('utf-8')
+        index.append({'kind': 'env', 'name': env['name'], 'size': len(value)})
+        payloads.append(value)
 
     for file in config.get('files', []):
         src, dest = file['src'], file['dest']
-        with open(src, 'rb') as raw_file:
-            raw = raw_file.read()
-            raw = b64(raw)
-        vault['files'].append({
-            'location': dest,
-            'file': raw
+        index.append({
+            'kind': 'file',
+            'name': file.get('name') or os.path.basename(dest),
+            'dest': dest,
+            'size': os.path.getsize(src),
         })
+        payloads.append(src)
+
+    # Entries sizes are known beforehand, so index can come first
+    for entry in index:
+        entry['id'] = b64(os.urandom(16))
+        entry['nonce'] = b64(os.urandom(NONCE_PREFIX_SIZE))
+        entry['length'] = sealed_size(entry['size'], CHUNK_SIZE)
+
+    sealed = seal(subkey(master, b'index'), json.dumps(index).encode('utf-8'), header)
+
+    output.write(VAULT_MAGIC + _LENGTH.pack(len(header)) + header)
+    output.write(_LENGTH.pack(len(sealed)) + sealed)
+
+    for entry, payload in zip(index, payloads):
+        writer = CipherWriter(output, _entry_key(master, entry), b64d(entry['nonce']),
+                              _entry_aad(header, entry), CHUNK_SIZE)
+        if isinstance(payload, bytes):
+            writer.write(payload)
+        else:
+            _copy_file(payload, entry['size'], writer)
+        writer.close()
 
-    for env in config.get('envs', []):
-        name, value = env['name'], env['value']
-        vault['envs'][name] = value
 
-    return cipher_dict(password, vault)
+def load_vault(vault: Union[str, IO[bytes]], vault_fs: VaultFS, names: list = None) -> dict:
+    """Load encrypted vault, secret files are written to vault filesystem
 
-def load_vault(str_vault: str) -> dict:
-    """Load base64 encoded encrypted vault
+    Vault key is asked to unlock agent first, password is only prompted
+    if no agent is running or key is not cached (then handed to agent).
+
+    Args:
+        vault (Union[str, IO[bytes]]): base64 encoded vault, or binary stream
+        vault_fs (VaultFS): vault temp filesystem
+        names (list, optional): only load these secrets (env name, file name). Defaults to all.
+
+    Returns:
+        dict: env variables, None if password is invalid or vault corrupted
     """
 
-    password = secure_prompt()
+    if isinstance(vault, str):
+        raw = b64d(vault) or b''
+        if raw[:len(VAULT_MAGIC)] not in _MAGICS:
+            if (password := secure_prompt()) is None:
+                return None
+            return _load_vault_v1(vault, password, vault_fs, names)
+        vault = io.BytesIO(raw)
+
+    try:
+        magic, header = _read_header(vault)
+    except (ValueError, struct.error):
+        return None
+
+    # Header holds random salt (or nonce prefix), so it identifies vault
+    vault_id = 'sha256:' + hashlib.sha256(header).hexdigest()
+    if key := agent.get_key(vault_id):
+        return _read_vault(vault, magic, header, key, vault_fs, names)
+
+    if (password := secure_prompt()) is None:
+        return None
+
+    try:
+        key = _derive(header, password)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    if (envs := _read_vault(vault, magic, header, key, vault_fs, names)) is not None:
+        agent.put_key(vault_id, key)
+
+    return envs
+
+
+def read_vault(source: IO[bytes], password: str, vault_fs: VaultFS, names: list = None) -> dict:
+    """Decrypt vault (v2 or v3) stream
+
+    Args:
+        source (IO[bytes]): binary vault stream
+        password (str): vault password
+        vault_fs (VaultFS): vault temp filesystem
+        names (list, optional): only load these secrets (env name, file name). Defaults to all.
+
+    Returns:
+        dict: env variables, None if password is invalid or vault corrupted
+    """
+    try:
+        magic, header = _read_header(source)
+        key = _derive(header, password)
+    except (ValueError, KeyError, TypeError, struct.error):
+        return None
+
+    return _read_vault(source, magic, header, key, vault_fs, names)
+
+
+def _read_header(source: IO[bytes]) -> tuple:
+    if (magic := source.read(len(VAULT_MAGIC))) not in _MAGICS:
+        raise ValueError('Unknown vault format')
+    length, = _LENGTH.unpack(source.read(_LENGTH.size))
+    return magic, source.read(length)
+
+
+def _derive(header: bytes, password: str) -> bytes:
+    return derive_key(password, json.loads(header)['kdf'])
+
+
+@traced('vault.decrypt')
+def _read_vault(source: IO[bytes], magic: bytes, header: bytes, key: bytes,
+                vault_fs: VaultFS, names: list = None) -> dict:
+    try:
+        params = json.loads(header)
+        if params.get('cipher') != 'aes-256-gcm':
+            raise ValueError(f'Unknown vault cipher { params.get("cipher") }')
+        if magic == VAULT_MAGIC:
+            return _read_entries(source, params, header, key, vault_fs, names)
+        return _read_records(source, params, header, key, vault_fs, names)
+    except (InvalidTag, ValueError, KeyError, TypeError, struct.error, UnicodeDecodeError):
+        return None
+
+
+def _read_entries(source: IO[bytes], params: dict, header: bytes, master: bytes,
+                  vault_fs: VaultFS, names: list = None) -> dict:
+    length, = _LENGTH.unpack(source.read(_LENGTH.size))
+    index = json.loads(unseal(subkey(master, b'index'), source.read(length), header))
+    _check_names(names, [entry['name'] for entry in index])
+
+    # Secrets which are not asked for are neither decrypted nor read if possible
+    wanted = [entry for entry in index if _wanted(names, entry['name'])]
+
+    if not _seekable(source):
+        values = []
+        for entry in index:
+            if _wanted(names, entry['name']):
+                values.append(_read_entry(entry, _Slice(source, entry['length']), params, header, master, vault_fs))
+            else:
+                _skip(source, entry['length'])
+    else:
+        # Each entry has its own key, nonce and length : entries are decrypted
+        # concurrently, each reading its own window of source
+        lock, offset, jobs = threading.Lock(), source.tell(), []
+        for entry in index:
+            if _wanted(names, entry['name']):
+                jobs.append((entry, _Window(source, offset, entry['length'], lock)))
+            offset += entry['length']
+        with ThreadPoolExecutor(DECRYPT_JOBS) as pool:
+            values = list(pool.map(lambda job: _read_entry(*job, params, header, master, vault_fs), jobs))
+        source.seek(offset)
+
+    return {entry['name']: value for entry, value in zip(wanted, values) if entry['kind'] == 'env'}
+
+
+def _read_entry(entry: dict, source, params: dict, header: bytes, master: bytes,
+                vault_fs: VaultFS) -> str:
+    # Env variable value is returned, file is written to vault filesystem
+    reader = CipherReader(source, _entry_key(master, entry), b64d(entry['nonce']),
+                          _entry_aad(header, entry), params['chunk_size'])
+    value = None
+    if entry['kind'] == 'env':
+        value = _read_exactly(reader, entry['size']).decode('utf-8')
+    elif entry['kind'] == 'file':
+        with vault_fs.open(entry['dest']) as fout:
+            for piece in reader.stream(entry['size']):
+                fout.write(piece)
+    else:
+        raise ValueError(f'Unknown vault entry { entry["kind"] }')
+
+    # Authenticates end of entry (last chunk flag)
+    if reader.read(1):
+        raise ValueError('Vault entry is longer than expected')
+    return value
+
+
+def _read_records(source: IO[bytes], params: dict, header: bytes, key: bytes,
+                  vault_fs: VaultFS, names: list = None) -> dict:
+    # Vault v2 : one stream of records, decrypted whole
+    reader = CipherReader(source, key, b64d(params['nonce']), header, params['chunk_size'])
+
+    envs, found = {}, []
+    while kind := reader.read(1):
+        location, size = _read_record(reader, kind)
+        name = location if kind == RECORD_ENV else os.path.basename(location)
+        found.append(name)
+        if not _wanted(names, name):
+            for _ in reader.stream(size):
+                pass
+        elif kind == RECORD_ENV:
+            envs[name] = _read_exactly(reader, size).decode('utf-8')
+        elif kind == RECORD_FILE:
+            with vault_fs.open(location) as fout:
+                for piece in reader.stream(size):
+                    fout.write(piece)
+        else:
+            raise ValueError(f'Unknown vault record { kind }')
+
+    _check_names(names, found)
+    return envs
+
+
+class _Slice:
+    """Read-only view of the next size bytes of a stream"""
+
+    def __init__(self, source: IO[bytes], size: int):
+        self.source = source
+        self.remaining = size
+
+    def read(self, size: int) -> bytes:
+        data = self.source.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+
+class _Window:
+    """Read-only view of size bytes of a seekable stream from offset, shared between threads"""
+
+    def __init__(self, source: IO[bytes], offset: int, size: int, lock: threading.Lock):
+        self.source = source
+        self.offset = offset
+        self.remaining = size
+        self.lock = lock
+
+    def read(self, size: int) -> bytes:
+        with self.lock:
+            self.source.seek(self.offset)
+            data = self.source.read(min(size, self.remaining))
+        self.offset += len(data)
+        self.remaining -= len(data)
+        return data
+
+
+def _seekable(source: IO[bytes]) -> bool:
+    try:
+        return source.seekable()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _skip(source: IO[bytes], size: int):
+    try:
+        source.seek(size, io.SEEK_CUR)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        _Slice(source, size).read(size)
+
+
+def _entry_key(master: bytes, entry: dict) -> bytes:
+    return subkey(master, b'entry:' + b64d(entry['id']))
+
+
+def _entry_aad(header: bytes, entry: dict) -> bytes:
+    return header + b64d(entry['id'])
+
+
+def _wanted(names: list, name: str) -> bool:
+    return names is None or name in names
+
+
+def _check_names(names: list, available: list):
+    if unknown := sorted(set(names or []) - set(available)):
+        warning(f'Unknown secret(s) : { ", ".join(unknown) }')
+
+
+def _copy_file(src: str, size: int, writer: CipherWriter):
+    with open(src, 'rb') as raw_file:
+        while size:
+            if not (chunk := raw_file.read(min(size, CHUNK_SIZE))):
+                raise ValueError(f'File { src } changed while read')
+            writer.write(chunk)
+            size -= len(chunk)
+        if raw_file.read(1):
+            raise ValueError(f'File { src } changed while read')
+
+
+def _read_record(reader: CipherReader, kind: bytes) -> tuple:
+    _, length = _RECORD.unpack(kind + _read_exactly(reader, _RECORD.size - 1))
+    name = _read_exactly(reader, length).decode('utf-8')
+    size, = _RECORD_SIZE.unpack(_read_exactly(reader, _RECORD_SIZE.size))
+    return name, size
+
+
+def _read_exactly(reader: CipherReader, size: int) -> bytes:
+    data = reader.read(size)
+    if len(data) != size:
+        raise ValueError('Truncated vault')
+    return data
+
+
+def _load_vault_v1(vault: str, password: str, vault_fs: VaultFS, names: list = None) -> dict:
+    if not (content := uncipher_dict(password, vault)):
+        return None
+
+    files = content.get('files', [])
+    envs = content.get('envs', {})
+    _check_names(names, list(envs) + [os.path.basename(f['location']) for f in files])
+
+    for file in files:
+        if _wanted(names, os.path.basename(file['location'])):
+            with vault_fs.open(file['location']) as fout:
+                fout.write(b64d(file['file']))
 
-    return uncipher_dict(password, str_vault)
\ No newline at end of file
+    return {name: value for name, value in envs.items() if _wanted(names, name)}
@@ -0,0 +1,65 @@
+import io
+import os
+import time
+import threading
+
+import pytest
+
+from kitt import agent
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    path = agent.socket_path()
+    agent._private_dir(os.path.dirname(path))
+    server = agent.AgentServer(path, ttl=60)
+    server.timeout = 0.05
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+    yield server
+    agent.request({'op': 'stop'})
+    thread.join()
+    server.server_close()
+
+
+def test_no_agent(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert(agent.request({'op': 'ping'}) is None)
+    assert(agent.get_key('sha256:1234') is None)
+    agent.put_key('sha256:1234', b'key')
+
+
+def test_agent_keys(server):
+    assert(oct(os.stat(agent.socket_path()).st_mode & 0o777) == '0o600')
+    assert(agent.get_key('sha256:1234') is None)
+    agent.put_key('sha256:1234', b'key')
+    assert(agent.get_key('sha256:1234') == b'key')
+    assert(agent.request({'op': 'unknown'}) == {'error': 'Unknown operation unknown'})
+
+    assert(agent.request({'op': 'lock'}) == {})
+    assert(agent.get_key('sha256:1234') is None)
+
+
+def test_agent_ttl(server):
+    server.ttl = 0.1
+    agent.put_key('sha256:1234', b'key')
+    time.sleep(0.2)
+    assert(server.keys == {})
+    assert(agent.get_key('sha256:1234') is None)
+
+
+def test_vault_unlocked_by_agent(server, tmp_path, monkeypatch):
+    import kitt.vault
+    from kitt.crypto import calibrate_kdf
+    from kitt.vault import VaultFS, dump_vault, load_vault
+
+    output = io.BytesIO()
+    dump_vault({'envs': [{'name': 'TOKEN', 'value': 'secret'}]}, 'password', output, calibrate_kdf(0))
+
+    prompts = []
+    monkeypatch.setattr(kitt.vault, 'secure_prompt', lambda: prompts.append(1) or 'password')
+    for _ in range(2):
+        output.seek(0)
+        assert(load_vault(output, VaultFS()) == {'TOKEN': 'secret'})
+    assert(len(prompts) == 1)
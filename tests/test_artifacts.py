@@ -0,0 +1,93 @@
+import os
+import hashlib
+import threading
+import subprocess
+import functools
+import http.server
+
+import pytest
+
+from kitt import plugins
+from kitt.artifacts import ArtifactCache, ArtifactError
+from kitt.images import BuildContext
+
+
+@pytest.fixture
+def server(tmp_path):
+    root = tmp_path / 'www'
+    root.mkdir()
+    hits = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = http.server.ThreadingHTTPServer(
+        ('127.0.0.1', 0), functools.partial(Handler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield root, f'http://127.0.0.1:{ httpd.server_address[1] }', hits
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_cached(tmp_path, server, monkeypatch):
+    root, url, hits = server
+    (root / 'tool.tar.gz').write_bytes(b'tool' * 1024)
+    sha256 = hashlib.sha256(b'tool' * 1024).hexdigest()
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+    config = {'ressources': [
+        {'url': f'{ url }/tool.tar.gz', 'target': '/opt/tool.tar.gz', 'sha256': sha256},
+        {'url': f'{ url }/latest', 'target': '/opt/latest'},
+    ]}
+    for _ in range(2):
+        context = BuildContext()
+        block = plugins.compose('download', plugins.prepare('download', config, context))
+        assert(f'COPY files/0/{ sha256 } /opt/tool.tar.gz' in block)
+        assert(f'RUN curl -sSL { url }/latest' in block)
+    assert(hits == ['/tool.tar.gz'])
+
+    cache = ArtifactCache(str(tmp_path / 'other'))
+    with pytest.raises(ArtifactError):
+        cache.fetch(f'{ url }/tool.tar.gz', '0' * 64)
+    assert(not list((tmp_path / 'other' / 'sha256').iterdir()))
+
+
+def test_git_checkout(tmp_path):
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    git = functools.partial(subprocess.run, cwd=repo, check=True, capture_output=True)
+    git(['git', 'init', '-q'])
+    (repo / 'file.txt').write_text('v1')
+    git(['git', 'add', '.'])
+    git(['git', '-c', 'user.name=kitt', '-c', 'user.email=kitt@localhost', 'commit', '-qm', 'v1'])
+    git(['git', 'tag', 'v1'])
+    commit = git(['git', 'rev-parse', 'HEAD'], text=True).stdout.strip()
+
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    path = cache.checkout(f'file://{ repo }', 'v1')
+    assert(path.endswith(commit))
+    assert(open(f'{ path }/file.txt').read() == 'v1')
+    assert(not os.path.exists(f'{ path }/.git'))
+
+    # Pinned commit is served from cache, even once origin is gone
+    subprocess.run(['rm', '-rf', str(repo)], check=True)
+    assert(cache.checkout(f'file://{ repo }', commit) == path)
+    with pytest.raises(ArtifactError):
+        cache.checkout(f'file://{ repo }', 'v2')
+
+
+def test_pip_pinned(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    config = {'packages': ['rich', {'name': 'toml==0.10.2', 'sha256': 'ab'}], 'extra_indexes': []}
+
+    context = BuildContext()
+    block = plugins.compose('pip', plugins.prepare('pip', config, context))
+    assert('--require-hashes --no-deps -r /tmp/kitt-requirements.txt' in block)
+    assert('--upgrade  rich' in block)
+    assert(open(context.sources[0][0]).read() == 'toml==0.10.2 --hash=sha256:ab\n')
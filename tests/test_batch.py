@@ -0,0 +1,115 @@
+import json
+import threading
+
+import pytest
+
+import kitt.vault
+
+from kitt.client import KittClient, NIX_CACHE_LABEL, load_manifest
+
+
+class Manager:
+    """Records builds, nix cache image is kept in memory"""
+
+    experimental = True
+
+    def __init__(self):
+        self.builds = []
+        self.kwargs = []
+        self.cache = None
+        self.lock = threading.Lock()
+
+    def find(self, labels):
+        return None
+
+    def list(self, repository=None):
+        if not self.cache:
+            return []
+        return [{'id': 'sha256:nix', 'tags': ['kitt-cache:nix'], 'labels': self.cache}]
+
+    def build(self, name, template, tag='latest', **kwargs):
+        if context := kwargs.get('context'):
+            # Context files (ex. vault) must still exist when archived
+            context.archive(template).close()
+        with self.lock:
+            self.builds.append((f'{ name }:{ tag }', kwargs.get('target'), kwargs.get('buildargs')))
+            self.kwargs.append(kwargs)
+        if tag == 'broken':
+            raise SystemExit(1)
+        if kwargs.get('target') == 'nixcache':
+            self.cache = kwargs['labels']
+        return {'id': f'sha256:{ tag }', 'size': 2048, 'steps': 10, 'cached': 4}
+
+
+def test_batch_build(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setattr(kitt.vault, 'secure_prompt', lambda: 'password')
+    for name, tools in (('dev', ['git']), ('ops', ['kubectl']), ('broken', [])):
+        (tmp_path / f'{ name }.toml').write_text(f'[workspace]\ntools = { json.dumps(tools) }\n')
+    # Image with secrets, which vault file is in build context
+    (tmp_path / 'ops.toml').write_text(
+        '[options]\nvault_unlock_time = 0\n[workspace]\ntools = ["kubectl"]\n'
+        '[[secrets.envs]]\nname = "TOKEN"\nvalue = "secret"\n')
+    (tmp_path / 'manifest.toml').write_text(
+        '[[images]]\nname = "dev"\nconfig = "dev.toml"\n'
+        '[[images]]\nname = "ops"\nconfig = "ops.toml"\n')
+
+    images = load_manifest(str(tmp_path / 'manifest.toml'))
+    assert(images == [('dev', str(tmp_path / 'dev.toml')), ('ops', str(tmp_path / 'ops.toml'))])
+
+    client = KittClient()
+    client._image_manager = manager = Manager()
+    with pytest.raises(SystemExit):
+        client.batch(images + [('broken', str(tmp_path / 'broken.toml'))], jobs=2)
+
+    # Shared stage first, then images, then nix cache updates adding up
+    assert(manager.builds[0][:2] == ('kitt-cache:prebuild', 'prebuild'))
+    assert(sorted(x[0] for x in manager.builds[1:4]) == ['kitt:broken', 'kitt:dev', 'kitt:ops'])
+    assert([x[:2] for x in manager.builds[4:]] == [('kitt-cache:nix', 'nixcache')] * 2)
+    assert(manager.builds[4][2] == {} and manager.builds[5][2] == {'NIX_IMAGE': 'kitt-cache:nix'})
+    assert(json.loads(manager.cache[NIX_CACHE_LABEL])['tools'] == ['git', 'kubectl'])
+
+
+def test_batch_build_nocache(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    for name in ('dev', 'ops'):
+        (tmp_path / f'{ name }.toml').write_text('[workspace]\ntools = []\n')
+
+    client = KittClient()
+    client._image_manager = manager = Manager()
+    client.batch([(x, str(tmp_path / f'{ x }.toml')) for x in ('dev', 'ops')], nocache=True)
+
+    # Shared stage is rebuilt once, images reuse it and bust their own stages cache
+    assert(manager.builds[0][:2] == ('kitt-cache:prebuild', 'prebuild') and [x['nocache'] for x in manager.kwargs] == [True, False, False])
+    rebuild = {x[2]['KITT_REBUILD'] for x in manager.builds[1:]}
+    assert(len(rebuild) == 1)
+
+
+def test_build_tools_layers(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    for mode in ('single', 'tools'):
+        (tmp_path / f'{ mode }.toml').write_text(f'[options]\nnix_layers = "{ mode }"\n[workspace]\ntools = ["git"]\n')
+
+    client = KittClient()
+    client._image_manager = manager = Manager()
+    client.build('single', str(tmp_path / 'single.toml'))
+    client.build('tools', str(tmp_path / 'tools.toml'))
+
+    # Tools store layers are not squashed back into one
+    squash = {x[0]: kwargs.get('squash') for x, kwargs in zip(manager.builds, manager.kwargs) if x[1] == 'runtime'}
+    assert(squash == {'kitt:single': True, 'kitt:tools': False})
+
+
+def test_build_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    (tmp_path / 'dev.toml').write_text('[workspace]\ntools = ["git"]\n')
+
+    client = KittClient()
+    client._image_manager = manager = Manager()
+    client.build('dev', str(tmp_path / 'dev.toml'))
+    assert(manager.cache)
+
+    # Container builder can not see local nix cache image, which is neither used nor updated
+    for _ in range(2):
+        client.build('dev', str(tmp_path / 'dev.toml'), builder='buildkit', cache_dir=str(tmp_path))
+    assert([x[1:] for x in manager.builds[2:]] == [('runtime', {}), ('runtime', {})])
@@ -0,0 +1,65 @@
+import subprocess
+
+from kitt import images
+from kitt.images import BuildContext, DockerImageManager
+
+progress = '''#1 [internal] load build definition from Dockerfile
+#1 DONE 0.0s
+#5 [prebuild 1/3] FROM docker.io/library/alpine:3.15
+#6 [nixbuilder 2/4] RUN mkdir -p /output/store
+#6 CACHED
+#7 [runtime 3/9] RUN chmod 4755 /bin/fixuid
+#7 DONE 0.4s
+'''
+
+
+class Logger:
+
+    def debug(self, msg):
+        pass
+
+    def panic(self, msg):
+        raise SystemExit(msg)
+
+
+class API:
+
+    def inspect_image(self, image):
+        return {'Size': 4096}
+
+
+class Client:
+    api = API()
+
+
+def test_buildx(tmp_path, monkeypatch):
+    (tmp_path / 'cache' / 'kitt-other').mkdir(parents=True)
+    (tmp_path / 'cache' / 'kitt-other' / 'index.json').write_text('{}')
+    commands = []
+
+    def run(command, **kwargs):
+        commands.append(command)
+        if 'build' in command:
+            assert(kwargs['stdin'].fileno())
+            iidfile = command[command.index('--iidfile') + 1]
+            with open(iidfile, 'w', encoding='utf-8') as file:
+                file.write('sha256:abc\n')
+        return subprocess.CompletedProcess(command, 0, '', progress)
+
+    monkeypatch.setattr(images.subprocess, 'run', run)
+    manager = DockerImageManager(Logger())
+    manager._client = Client()
+
+    stats = manager.build(
+        'kitt', 'FROM scratch\n', 'devops', context=BuildContext(), builder='buildkit',
+        cache_dir=str(tmp_path / 'cache'), labels={'kitt-digest': 'sha256:0'},
+        target='runtime', buildargs={'NIX_IMAGE': 'kitt-cache:nix'}, pull=False)
+    assert(stats == {'id': 'sha256:abc', 'size': 4096, 'steps': 3, 'cached': 1})
+
+    # Container builder is created once, all local caches are imported
+    assert(commands[0][:3] == ['docker', 'buildx', 'inspect'])
+    build = ' '.join(commands[-1])
+    assert('--builder kitt' in build and '--target runtime' in build)
+    assert('--label kitt-digest=sha256:0 --build-arg NIX_IMAGE=kitt-cache:nix' in build)
+    assert(f'--cache-from type=local,src={ tmp_path }/cache/kitt-other' in build)
+    assert(f'--cache-to type=local,dest={ tmp_path }/cache/kitt-devops,mode=max' in build)
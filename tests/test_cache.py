@@ -0,0 +1,40 @@
+import os
+
+from kitt.cache import build_digest
+
+dockerfile = 'FROM ubuntu:22.04\nRUN echo kitt\n'
+config = {'hostname': 'kitt', 'vault': False}
+
+
+def test_digest_stable():
+    assert(build_digest(dockerfile, config) == build_digest(dockerfile, dict(config)))
+    assert(build_digest(dockerfile, config).startswith('sha256:'))
+
+
+def test_digest_inputs():
+    digest = build_digest(dockerfile, config)
+    assert(digest != build_digest(dockerfile + '\n', config))
+    assert(digest != build_digest(dockerfile, {**config, 'hostname': 'other'}))
+
+
+def test_digest_sources(tmp_path):
+    tree = tmp_path / 'tree'
+    tree.mkdir()
+    (tree / 'a.txt').write_text('a')
+    (tree / 'sub').mkdir()
+    (tree / 'sub' / 'b.txt').write_text('b')
+
+    digest = build_digest(dockerfile, config, [str(tree)])
+    assert(digest == build_digest(dockerfile, config, [str(tree)]))
+
+    (tree / 'sub' / 'b.txt').write_text('B')
+    changed = build_digest(dockerfile, config, [str(tree)])
+    assert(changed != digest)
+
+    os.chmod(tree / 'a.txt', 0o600)
+    assert(build_digest(dockerfile, config, [str(tree)]) != changed)
+
+
+def test_digest_missing_source(tmp_path):
+    missing = str(tmp_path / 'missing')
+    assert(build_digest(dockerfile, config, [missing]) != build_digest(dockerfile, config))
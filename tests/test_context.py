@@ -0,0 +1,92 @@
+import tarfile
+
+from kitt.images import BuildContext
+from kitt import plugins
+
+dockerfile = 'FROM ubuntu:22.04\n'
+
+
+def test_context_only_dockerfile():
+    with BuildContext().archive(dockerfile) as fileobj:
+        with tarfile.open(fileobj=fileobj) as tar:
+            assert(tar.getnames() == ['Dockerfile'])
+            assert(tar.extractfile('Dockerfile').read().decode() == dockerfile)
+
+
+def test_context_sources(tmp_path):
+    (tmp_path / 'config.json').write_text('{}')
+    (tmp_path / 'dir').mkdir()
+    (tmp_path / 'dir' / 'a.txt').write_text('a')
+    (tmp_path / 'ignored.bin').write_bytes(b'0' * 1024)
+
+    context = BuildContext()
+    file = context.add(str(tmp_path / 'config.json'))
+    folder = context.add(str(tmp_path / 'dir'))
+    assert(file == 'files/0/config.json')
+    assert(folder == 'files/1')
+
+    with context.archive(dockerfile) as fileobj:
+        with tarfile.open(fileobj=fileobj) as tar:
+            names = tar.getnames()
+            assert(sorted(names) == ['Dockerfile', 'files/0/config.json', 'files/1', 'files/1/a.txt'])
+            assert(all(m.uid == 0 and m.gid == 0 for m in tar.getmembers()))
+
+
+def test_copy_plugin_rewrite(tmp_path):
+    (tmp_path / 'config.json').write_text('{}')
+    config = {'files': [{'src': str(tmp_path / 'config.json'), 'dest': '/etc/config.json'}]}
+
+    context = BuildContext()
+    prepared = plugins.prepare('copy', config, context)
+    assert(prepared['files'][0]['src'] == 'files/0/config.json')
+    assert(config['files'][0]['src'] == str(tmp_path / 'config.json'))
+
+    block = plugins.compose('copy', prepared)
+    assert('files/0/config.json /etc/config.json' in block)
+
+
+def test_vault_layer(tmp_path):
+    from kitt.config import ConfigUtils
+    from kitt.images import Composer, _ChunksReader
+
+    vault = tmp_path / 'kitt-vault'
+    vault.write_bytes(b'KITT\x02')
+    vault.chmod(0o600)
+
+    context = BuildContext()
+    source = context.add(str(vault))
+    values = {
+        'user': 'user', 'shell': 'bash', 'tools': [], 'nix_layers': 'single',
+        'envs': [], 'paths': [], 'image': 'ubuntu:22.04', 'plugins': [],
+        'vault': {'source': source, 'path': '/usr/share/kitt/vault'},
+    }
+    rendered = Composer(ConfigUtils.mkpath('static/Dockerfile.j2')).compose(values)
+    assert(f'COPY --chown=root:root { source } /usr/share/kitt/vault' in rendered)
+
+    # Archive read back as a chunked stream, as returned by engine
+    with context.archive(rendered) as fileobj:
+        chunks = iter(lambda: fileobj.read(100), b'')
+        with tarfile.open(fileobj=_ChunksReader(chunks), mode='r|') as tar:
+            members = {m.name: m for m in tar}
+    assert(members[source].mode == 0o600)
+
+
+def test_nix_cache_stages():
+    from kitt.config import ConfigUtils
+    from kitt.images import Composer
+
+    values = {
+        'user': 'user', 'shell': 'bash', 'tools': ['curl'], 'nix_layers': 'single',
+        'envs': [], 'paths': [], 'image': 'ubuntu:22.04', 'plugins': [],
+        'nixpkgs': 'https://example.com/nixpkgs.tar.gz',
+    }
+    rendered = Composer(ConfigUtils.mkpath('static/Dockerfile.j2')).compose(values)
+
+    # Cache image is chosen by build arg, rendered template stays the same
+    assert(rendered.startswith('# Nix builder base'))
+    assert('FROM ${NIX_IMAGE} as nixbuilder' in rendered)
+    assert('ENV NIXPKGS=https://example.com/nixpkgs.tar.gz' in rendered)
+    assert('nix-channel' not in rendered)
+
+    stages = [line.split()[-1] for line in rendered.splitlines() if line.startswith('FROM ')]
+    assert(stages == ['prebuild', 'nixbuilder', 'runtime', 'nixcache'])
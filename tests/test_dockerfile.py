@@ -0,0 +1,48 @@
+from kitt import dockerfile
+
+
+def test_parse():
+    text = '# fetch\nRUN curl -o /a \\\n    https://example.com/a\n\nCOPY files/0 /etc/\n'
+    instructions = dockerfile.parse(text, 'download')
+    assert([x.keyword for x in instructions] == ['RUN', 'COPY'])
+    assert(instructions[0].comments == ['# fetch'])
+    assert(instructions[0].args == 'curl -o /a \\\n    https://example.com/a')
+    assert(dockerfile.render(instructions) == text.replace('\n\n', '\n').strip())
+
+
+def test_optimize():
+    blocks = [
+        ('copy', 'COPY files/0/a /a\n'),
+        ('pip', '\n\n'),
+        ('zsh', 'RUN chsh\n'),
+        ('sh', 'RUN cd /opt\nRUN make\nRUN ["ls"]\n'),
+        ('download', 'RUN true\nRUN curl a\n'),
+        ('git', 'RUN git clone b\n'),
+    ]
+    plan = dockerfile.optimize(blocks)
+
+    # Nothing crosses sh barrier, empty and no-op blocks are gone
+    assert([x.plugin for x in plan] == ['zsh', 'copy', 'sh', 'sh', 'download', 'git'])
+    assert(plan[0].moved and plan[1].moved and not plan[4].moved)
+
+    # Each command keeps its own shell, exec form is left alone
+    assert(plan[2].args == '( cd /opt ) \\\n    && ( make )')
+    assert(plan[2].merged == 2 and plan[3].args == '["ls"]')
+
+    lines = dockerfile.explain(plan)
+    assert(lines[2].startswith('layer  3  sh'))
+    assert(lines[2].endswith('RUN ( cd /opt ) && ( make ) (2 merged)'))
+
+
+def test_optimize_dependencies():
+    blocks = [
+        ('git', 'RUN git clone https://example.com/tool /opt/tool\n'),
+        ('pip', 'RUN pip install /opt/tool\n'),
+        ('copy', 'COPY files/0/a /a\n'),
+        ('zsh', 'RUN chsh\n'),
+    ]
+    plan = dockerfile.optimize(blocks)
+
+    # pip block might install cloned files, it stays after git one
+    assert([x.plugin for x in plan] == ['zsh', 'git', 'pip', 'copy'])
+    assert(plan[0].moved)
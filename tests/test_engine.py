@@ -0,0 +1,78 @@
+import pytest
+
+import kitt.client
+
+from benchmarks.commands import BUDGETS, measure, over_budget
+from benchmarks.engine import FakeEngine
+from kitt import logger
+from kitt.client import KittClient
+from kitt.images import AsyncImageManager
+
+
+@pytest.mark.parametrize('backend', ['docker', 'async'])
+def test_commands_budget(backend):
+    results = measure(images=10, backend=backend)
+    assert(set(results) == set(BUDGETS))
+    for name, result in results.items():
+        assert(over_budget(name, result, images=10) == [])
+
+    # Build context is uploaded for runtime image, then for nix cache image
+    assert(0 < results['build']['context'] < results['build']['sent'])
+
+
+def test_async_refresh(tmp_path, monkeypatch):
+    engine = FakeEngine(str(tmp_path / 'docker.sock'))
+    engine.seed(3)
+    images = {tag[len('kitt:'):]: x['Id'] for x in engine.images.values() for tag in x['RepoTags']}
+    monkeypatch.setenv('DOCKER_HOST', engine.url)
+
+    origins = {
+        'image0': {'repository': 'registry.local/kitt', 'digest': 'sha256:old', 'image': images['image0']},
+        'image1': {'repository': 'registry.local/kitt', 'digest': 'sha256:old', 'image': 'sha256:rebuilt'},
+    }
+    with engine:
+        manager = AsyncImageManager(logger)
+        updated = manager.refresh('kitt', origins)
+
+        # Only pulled image is updated, pulled tag is moved to kitt repository
+        assert(list(updated) == ['image0'] and updated['image0']['image'] != images['image0'])
+        assert(manager.stat('kitt', 'image0') and not manager.stat('registry.local/kitt', 'image0'))
+        assert({x['id'] for x in manager.list('kitt')} == {updated['image0']['image'], images['image1'], images['image2']})
+
+
+def test_refresh_unrecorded_origin(tmp_path, monkeypatch):
+    from kitt.config import ConfigUtils
+
+    engine = FakeEngine(str(tmp_path / 'docker.sock'))
+    engine.seed(2)
+    monkeypatch.setenv('DOCKER_HOST', engine.url)
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    messages = []
+    monkeypatch.setattr(kitt.client, 'info', messages.append)
+
+    with engine:
+        KittClient().push('registry.local/kitt', 'image0')
+        KittClient().refresh()
+
+    # Pushed image origin comes from its registry digest, never pushed image is reported
+    origin = ConfigUtils.load_data(kitt.client.ORIGINS)['image0']
+    assert(origin['repository'] == 'registry.local/kitt' and origin['digest'].startswith('sha256:'))
+    assert(messages == ['No known registry for image1, skipped (push or pull it first)'])
+
+
+def test_relabel(tmp_path, monkeypatch):
+    from kitt.images import DockerImageManager
+
+    engine = FakeEngine(str(tmp_path / 'docker.sock'))
+    engine.seed(1)
+    monkeypatch.setenv('DOCKER_HOST', engine.url)
+    layers = engine.resolve('kitt:image0')['Layers']
+
+    with engine:
+        manager = DockerImageManager(logger)
+        for index in range(3):
+            manager.relabel('kitt', 'image0', {'kitt-digest': str(index)})
+
+    # Patched image keeps its layers, none is stacked on each patch
+    image = engine.resolve('kitt:image0')
+    assert(image['Layers'] == layers and image['Labels']['kitt-digest'] == '2' and 'kitt-config' in image['Labels'])
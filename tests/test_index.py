@@ -0,0 +1,61 @@
+import json
+
+from kitt.index import ImageIndex
+
+
+class Manager:
+    """Records engine round-trips"""
+
+    def __init__(self):
+        self.calls = []
+        self.pending = []
+        self.images = [{
+            'id': 'sha256:aaa',
+            'tags': ['kitt:devops', 'other:latest'],
+            'labels': {'kitt-config': json.dumps({'hostname': 'devops'})},
+            'size': 1000,
+            'created': 1,
+        }]
+
+    def list(self, repository=None):
+        self.calls.append('list')
+        return self.images
+
+    def events(self, since, until):
+        self.calls.append('events')
+        events, self.pending = self.pending, []
+        return events
+
+
+def test_index_sync(tmp_path):
+    manager = Manager()
+    index = ImageIndex('kitt', str(tmp_path / 'index.json'))
+    index.sync(manager)
+    assert(manager.calls == ['list'])
+    assert(index.tags() == ['devops'])
+    assert(index.lookup('devops')['config'] == {'hostname': 'devops'})
+    assert(index.lookup('other') is None)
+
+    # Reloaded from disk, validated with a single events call
+    index = ImageIndex('kitt', str(tmp_path / 'index.json'))
+    index.sync(manager)
+    assert(manager.calls == ['list', 'events'])
+    assert(index.lookup('devops')['id'] == 'sha256:aaa')
+
+
+def test_index_events(tmp_path):
+    manager = Manager()
+    index = ImageIndex('kitt', str(tmp_path / 'index.json'))
+    index.sync(manager)
+    index.touch('devops')
+
+    manager.images = [{**manager.images[0], 'tags': ['kitt:devops', 'kitt:ops']}]
+    manager.pending = [{'Type': 'image', 'Action': 'tag'}]
+    index.sync(manager)
+    assert(manager.calls == ['list', 'events', 'list'])
+    assert(index.tags() == ['devops', 'ops'])
+    assert(index.lookup('ops')['last_run'])
+
+    manager.pending = [{'Type': 'container', 'Action': 'start'}]
+    index.sync(manager)
+    assert(manager.calls[-1] == 'events')
@@ -0,0 +1,42 @@
+import json
+import threading
+
+from kitt import profiler
+from kitt.images import _BuildSteps
+
+
+def test_profiler(tmp_path):
+    @profiler.traced('test.traced')
+    def work():
+        with profiler.span('test.inner', detail=1):
+            pass
+
+    # Disabled, nothing is recorded
+    work()
+    assert(not profiler.enabled())
+
+    profiler.enable(str(tmp_path / 'trace.json'))
+    thread = threading.Thread(target=work, name='worker')
+    thread.start()
+    thread.join()
+    work()
+
+    steps = _BuildSteps()
+    for chunk in ({'stream': 'Step 1/2 : FROM alpine'}, {'stream': ' ---> Using cache'},
+                  {'stream': 'Step 2/2 : RUN true'}, {'aux': {'ID': 'sha256:abc'}}):
+        steps.update(chunk)
+    steps.close()
+    assert((steps.image, steps.count, steps.cached) == ('sha256:abc', 2, 1))
+
+    summary = {x['name']: x for x in profiler._profiler.summary()}
+    assert(summary['test.traced']['count'] == 2 and summary['build.step']['count'] == 2)
+    profiler.finish()
+    assert(not profiler.enabled())
+
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert({x['tid'] for x in events} == {'worker', 'MainThread'})
+    assert(all(x['ph'] == 'X' and x['dur'] >= 0 for x in events))
+    inner = next(x for x in events if x['name'] == 'test.inner')
+    assert(inner['cat'] == 'test' and inner['args'] == {'detail': 1})
+    step = next(x for x in events if x['name'] == 'build.step')
+    assert(step['args'] == {'step': 'Step 1/2 : FROM alpine', 'cached': True})
@@ -0,0 +1,69 @@
+import pytest
+
+from benchmarks.engine import FakeEngine
+from kitt import logger, prune
+from kitt.images import AsyncImageManager, DockerImageManager
+
+
+def test_layer_sizes():
+    history = [
+        {'CreatedBy': '/bin/sh -c #(nop)  CMD ["bash"]', 'Size': 0},
+        {'CreatedBy': '/bin/sh -c apt-get install -y curl', 'Size': 30},
+        {'CreatedBy': 'WORKDIR /home/user', 'Size': 0},
+        {'CreatedBy': '/bin/sh -c touch /etc/kitt', 'Size': 0},
+        {'CreatedBy': '/bin/sh -c #(nop) ADD file:1234 in /', 'Size': 70},
+    ]
+    assert(prune.layer_sizes(history, 2) == [70, 30])
+    # Empty layer (ex. file touched) only counted when sized steps fall short
+    assert(prune.layer_sizes(history, 3) == [70, 0, 30])
+    assert(prune.layer_sizes(history, 4) is None)
+
+    # Chain id depends on layers below
+    assert(prune.chain_ids(['a', 'b'])[0] == 'a')
+    assert(prune.chain_ids(['a', 'b'])[1] != prune.chain_ids(['c', 'b'])[1])
+
+
+def test_select():
+    usage = {
+        'LayersSize': 1000,
+        'Images': [
+            {'Id': 'base', 'RepoTags': ['ubuntu:22.04'], 'Size': 100, 'SharedSize': 100},
+            {'Id': 'one', 'RepoTags': ['kitt:one'], 'Size': 300, 'SharedSize': 250},
+            {'Id': 'two', 'RepoTags': ['kitt:two'], 'Size': 300, 'SharedSize': 250},
+            {'Id': 'old', 'RepoTags': ['<none>:<none>'], 'Labels': {'kitt-config': '{}'}, 'Size': 10, 'SharedSize': 0},
+            {'Id': 'pushed', 'RepoTags': ['kitt:pushed', 'registry.local/kitt:pushed'], 'Size': 5, 'SharedSize': 0},
+            {'Id': 'running', 'RepoTags': ['kitt:running'], 'Size': 5, 'SharedSize': 0},
+        ],
+        'Containers': [{'Id': 'c', 'ImageID': 'running'}],
+    }
+    plan = prune.select(usage, ['kitt'], ['kitt-config'])
+    assert([x['id'] for x in plan['images']] == ['one', 'two', 'old'])
+    assert(plan['untag'] == ['kitt:pushed'] and [x['id'] for x in plan['in_use']] == ['running'])
+    assert(prune.inspected(plan) == ['one', 'two', 'base'])
+
+    # `one` and `two` share base layer with ubuntu, and a layer of their own
+    layers = {'base': ['l1'], 'one': ['l1', 'l2', 'l3'], 'two': ['l1', 'l2', 'l4']}
+    assert(prune.covering(plan, layers) == ['one'])
+    history = [{'CreatedBy': 'RUN c', 'Size': 50}, {'CreatedBy': 'RUN b', 'Size': 150}, {'CreatedBy': 'ADD a', 'Size': 100}]
+    plan = prune.estimate(plan, layers, {'one': history})
+    assert(plan['shared'] == 1 and plan['reclaimable'] == 50 + 50 + 10 + 150)
+    assert(prune.removals(plan)[-2:] == [('old', ['old']), ('kitt:pushed', ['kitt:pushed'])])
+
+
+@pytest.mark.parametrize('manager', [DockerImageManager, AsyncImageManager])
+def test_prune(tmp_path, monkeypatch, manager):
+    engine = FakeEngine(str(tmp_path / 'docker.sock'))
+    engine.seed(4, others=2)
+    monkeypatch.setenv('DOCKER_HOST', engine.url)
+
+    with engine:
+        manager = manager(logger)
+        plan = manager.plan_prune(['kitt'], ['kitt-config'])
+        assert(len(plan['images']) == 4 and plan['shared'] == 1)
+        # Planning removes nothing
+        assert(len(engine.images) == 7)
+
+        result = manager.prune(plan, jobs=4)
+        assert(result['failed'] == [] and result['reclaimed'] == plan['reclaimable'] > 0)
+        assert(sorted(t for x in engine.images.values() for t in x['RepoTags'])
+               == ['library/other0:latest', 'library/other1:latest', 'ubuntu:22.04'])
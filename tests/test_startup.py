@@ -0,0 +1,31 @@
+import os
+import sys
+import subprocess
+
+from benchmarks.startup import probe
+
+
+def test_version_is_lightweight():
+    _, code, modules = probe(['version'])
+    assert(code == 0)
+    assert(modules == ['rich'])
+
+
+def test_help_is_lightweight():
+    for args in (['--help'], ['build', '--help'], ['run', '--help'], ['agent', 'lock', '--help']):
+        _, code, modules = probe(args)
+        assert(code == 0)
+        assert(modules == [])
+
+
+def test_completion_is_lightweight():
+    _, code, modules = probe(['completion', 'zsh'])
+    assert(code == 0)
+    assert(modules == [])
+
+
+def test_daemon_not_required():
+    # Client creation must neither import nor reach docker
+    code = 'from kitt.client import KittClient; KittClient(); import sys; assert "docker" not in sys.modules'
+    env = {**os.environ, 'DOCKER_HOST': 'unix:///nonexistent/docker.sock'}
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
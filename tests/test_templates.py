@@ -0,0 +1,64 @@
+import pytest
+
+from kitt import plugins, templates
+
+
+@pytest.fixture
+def plugins_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.setenv(templates.PLUGINS_PATH, str(tmp_path / 'plugins'))
+    (tmp_path / 'plugins').mkdir()
+    templates.environment.cache_clear()
+    templates.registry.cache_clear()
+    yield tmp_path / 'plugins'
+    templates.environment.cache_clear()
+    templates.registry.cache_clear()
+
+
+def test_custom_plugin(plugins_dir, tmp_path):
+    (plugins_dir / 'tmux.j2').write_text('RUN echo {{ data }} >> ${HOME}/.tmux.conf\n')
+    (plugins_dir / 'sh.j2').write_text('RUN echo overridden\n')
+
+    assert(plugins.compose('tmux', {'data': 'set -g mouse on'}).startswith('RUN echo set -g mouse on'))
+    assert(plugins.compose('sh', {}) == 'RUN echo overridden')
+    assert('zsh' in templates.registry())
+
+    # Compiled once, bytecode kept on disk for next runs
+    assert(list((tmp_path / 'cache' / 'kitt' / 'templates').iterdir()))
+
+
+def test_plugin_errors(plugins_dir):
+    (plugins_dir / 'broken.j2').write_text('RUN a\nRUN {{ b }\n')
+    (plugins_dir / 'failing.j2').write_text('RUN a\n\nRUN {{ c.d.e }}\n')
+
+    with pytest.raises(templates.TemplateError) as error:
+        templates.render(templates.registry()['broken'], {})
+    assert(error.value.lineno == 2)
+
+    with pytest.raises(templates.TemplateError) as error:
+        templates.render(templates.registry()['failing'], {})
+    assert(error.value.lineno == 3)
+    assert('failing.j2, line 3' in str(error.value))
+
+    with pytest.raises(SystemExit):
+        plugins.compose('unknown', {})
+
+
+def test_entry_points(plugins_dir, tmp_path, monkeypatch):
+    from importlib.metadata import EntryPoint
+    template = tmp_path / 'tmux.j2'
+    template.write_text('RUN echo tmux\n')
+    (tmp_path / 'kitt_tmux.py').write_text(f'TEMPLATE = { repr(str(template)) }\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(templates, '_entry_points', lambda: [
+        EntryPoint('tmux', 'kitt_tmux:TEMPLATE', templates.ENTRY_POINTS),
+        EntryPoint('missing', 'kitt_missing:TEMPLATE', templates.ENTRY_POINTS),
+        EntryPoint('typo', 'kitt_tmux:TEMPLATES', templates.ENTRY_POINTS),
+    ])
+    warnings = []
+    monkeypatch.setattr(templates, 'warning', warnings.append)
+
+    # Broken entry points are reported by plugin name, others still load
+    assert('tmux' in templates.registry() and 'zsh' in templates.registry())
+    assert('missing' not in templates.registry() and 'typo' not in templates.registry())
+    assert([x.split()[1] for x in warnings] == ['missing', 'typo'])
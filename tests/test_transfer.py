@@ -0,0 +1,41 @@
+import pytest
+
+from kitt.transfer import Transfer, TransferError
+
+pull = [
+    {'status': 'Pulling from senges/kitt', 'id': 'devops'},
+    {'status': 'Already exists', 'id': 'a1'},
+    {'status': 'Pulling fs layer', 'id': 'b2'},
+    {'status': 'Downloading', 'id': 'b2', 'progressDetail': {'current': 5, 'total': 10}},
+    {'status': 'Downloading', 'id': 'c3', 'progressDetail': {'current': 1, 'total': 4}},
+    {'status': 'Download complete', 'id': 'b2'},
+    {'status': 'Extracting', 'id': 'b2', 'progressDetail': {'current': 1, 'total': 10}},
+]
+
+
+def test_transfer_progress():
+    transfer = Transfer()
+    updated = [transfer.update(event) for event in pull]
+    assert(updated == [None, None, None, 'b2', 'c3', 'b2', 'b2'])
+    assert(transfer.current == 11)
+    assert(transfer.total == 14)
+    assert(transfer.existing == {'a1'})
+
+
+def test_transfer_push_existing():
+    transfer = Transfer()
+    transfer.update({'status': 'Layer already exists', 'id': 'a1'})
+    transfer.update({'status': 'Mounted from library/ubuntu', 'id': 'b2'})
+    assert(transfer.existing == {'a1', 'b2'})
+    assert(transfer.total == 0)
+
+
+def test_transfer_error():
+    transfer = Transfer()
+    with pytest.raises(TransferError) as error:
+        transfer.update({'error': 'read tcp 10.0.0.1:443: i/o timeout'})
+    assert(error.value.transient)
+
+    with pytest.raises(TransferError) as error:
+        transfer.update({'error': 'unauthorized: authentication required'})
+    assert(not error.value.transient)
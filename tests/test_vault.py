@@ -1,3 +1,5 @@
+import os
+
 from kitt.crypto import *
 from kitt.crypto import _forge_key
 
@@ -10,6 +12,7 @@ vault = {
     'text': text,
     'base64': base64,
 }
+vault_v2 = 'S0lUVAIAAABieyJjaXBoZXIiOiAiYWVzLTI1Ni1nY20iLCAia2RmIjogeyJuYW1lIjogInNoYTI1NiJ9LCAiY2h1bmtfc2l6ZSI6IDY1NTM2LCAibm9uY2UiOiAiTmI3SjgrNUxUdz09In31UifVfE430/g9FHCXNT6UBUChdRDOK5obIJHZtyTtxZimzCpPAn2pibcQwvViQrEdBI+LBLPSDOVxMKREBy44ejlys4TFSd81Jo1O+BvfsV6AZ7QdyxjDjAYFGA=='
 secret_vault = 'Z0FBQUFBQmk4aXpVMThQRGhwbnFvWVAtZ1hQYmZHXzlGMkZ6c1AxRHpIbmtNOFVLZVdxRjRObVh6Zlk2azFEM1FEaWs5MWlZLWpUOVMzTkhjdzUzcXRXMGdxT3B3SzFzaktfN2JWaDRMRU5vSXl6MXBLQnVmdDh0TEo1SV9FTWllS25ETEpNWXd5N19vNjhsZ3ZzSlN5bUMxWm1SMVVaZk5hbEFvaXBjTk96TWM4eFdEVFlkTFRVPQ=='
 
 def test_forge_key():
@@ -59,3 +62,210 @@ def test_b64d():
     assert(decoded == text)
     none = b64d(text)
     assert(none is None)
+
+
+def test_persistent_vault_fs():
+    import os
+    from kitt.vault import VaultFS
+
+    vault_fs = VaultFS(persistent=True)
+    with vault_fs.open('/secret') as fout:
+        fout.write(text.encode('utf-8'))
+    vault_fs.close()
+    (path, bind), = vault_fs.volumes.items()
+    assert(bind['bind'] == '/secret')
+    assert(open(path).read() == text)
+    VaultFS.discard(vault_fs.fs_root)
+    assert(not os.path.exists(vault_fs.fs_root))
+
+
+def _secrets(tmp_path, size):
+    src = tmp_path / 'keystore'
+    src.write_bytes(os.urandom(size))
+    return src, {
+        'files': [{'src': str(src), 'dest': '/home/user/keystore'}],
+        'envs': [{'name': 'TOKEN', 'value': text}],
+    }
+
+
+def _read(raw, secret, vault_fs, names=None):
+    import io
+    from kitt.vault import read_vault
+
+    return read_vault(io.BytesIO(raw), secret, vault_fs, names)
+
+
+def test_vault_v2(tmp_path):
+    import io
+    from kitt.crypto import CHUNK_SIZE
+    from kitt.vault import VaultFS, dump_vault
+
+    # Not a multiple of chunk size, spans several chunks
+    src, config = _secrets(tmp_path, 3 * CHUNK_SIZE + 123)
+    output = io.BytesIO()
+    dump_vault(config, password, output, calibrate_kdf(0))
+    raw = output.getvalue()
+    # Raw bytes are not base64 encoded anymore
+    assert(len(raw) < src.stat().st_size * 1.01)
+
+    vault_fs = VaultFS()
+    assert(_read(raw, password, vault_fs) == {'TOKEN': text})
+    (path, bind), = vault_fs.volumes.items()
+    assert(bind['bind'] == '/home/user/keystore')
+    assert(open(path, 'rb').read() == src.read_bytes())
+    vault_fs.close()
+
+    assert(_read(raw, 'wrong password', VaultFS()) is None)
+    # Truncated at a chunk boundary, or tampered
+    assert(_read(raw[:-CHUNK_SIZE - 16 - 123], password, VaultFS()) is None)
+    assert(_read(raw[:-1] + bytes([raw[-1] ^ 1]), password, VaultFS()) is None)
+
+
+def test_vault_v1_compat(monkeypatch):
+    import kitt.vault
+    from kitt.vault import VaultFS, load_vault
+
+    legacy = cipher_dict(password, {
+        'files': [{'location': '/secret', 'file': base64}],
+        'envs': {'TOKEN': text},
+    })
+    monkeypatch.setattr(kitt.vault, 'secure_prompt', lambda: password)
+    vault_fs = VaultFS()
+    assert(load_vault(legacy, vault_fs) == {'TOKEN': text})
+    (path, _), = vault_fs.volumes.items()
+    assert(open(path).read() == text)
+    vault_fs.close()
+
+
+def test_vault_fs_store(tmp_path, monkeypatch):
+    import subprocess
+    import sys
+    from kitt.vault import VaultFS
+
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    stale = tmp_path / f'kitt-vault-{ proc.pid }-crashed'
+    stale.mkdir()
+    alive = tmp_path / f'kitt-vault-{ os.getpid() }-other'
+    alive.mkdir()
+
+    vault_fs = VaultFS()
+    assert(not stale.exists())
+    assert(alive.exists())
+    assert(os.path.dirname(vault_fs.fs_root) == str(tmp_path))
+    assert(oct(os.stat(vault_fs.fs_root).st_mode & 0o777) == '0o700')
+
+    with vault_fs.open('/secret') as fout:
+        fout.write(b'secret')
+    (path, _), = vault_fs.volumes.items()
+    assert(oct(os.stat(path).st_mode & 0o777) == '0o600')
+    vault_fs.close()
+    assert(not os.path.exists(vault_fs.fs_root))
+
+
+def test_vault_fs_disk_fallback(tmp_path, monkeypatch):
+    import kitt.vault
+    from kitt.vault import VaultFS
+
+    warnings = []
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    monkeypatch.setattr(os.path, 'isdir', lambda path: False)
+    monkeypatch.setattr(kitt.vault.tempfile, 'tempdir', str(tmp_path))
+    monkeypatch.setattr(kitt.vault, 'warning', warnings.append)
+
+    vault_fs = VaultFS()
+    assert(os.path.dirname(vault_fs.fs_root) == str(tmp_path) and warnings)
+    vault_fs.close()
+
+
+def test_calibrate_kdf(monkeypatch):
+    import kitt.crypto
+    from kitt.crypto import SCRYPT_MAX_N, SCRYPT_MIN_N
+
+    cheap = calibrate_kdf(0)
+    assert(cheap['name'] == 'scrypt' and cheap['n'] == SCRYPT_MIN_N and cheap['p'] == 1)
+
+    # Minimal cost takes 10 ms, budget is 1 s : n up to its max (x16) then p (x4)
+    monkeypatch.setattr(kitt.crypto, '_timed', lambda kdf: 0.01 * (kdf['n'] // SCRYPT_MIN_N) * kdf['p'])
+    costly = calibrate_kdf(1)
+    assert(costly['n'] == SCRYPT_MAX_N and costly['p'] == 4)
+    assert(cheap['salt'] != costly['salt'])
+    assert(derive_key(password, cheap) != derive_key(password, {**cheap, 'salt': costly['salt']}))
+
+
+def test_vault_v2_compat():
+    from kitt.vault import VaultFS
+
+    vault_fs = VaultFS()
+    assert(_read(b64d(vault_v2), password, vault_fs) == {'TOKEN': text})
+    (path, bind), = vault_fs.volumes.items()
+    assert(bind['bind'] == '/home/user/secret')
+    assert(open(path).read() == text)
+    vault_fs.close()
+
+
+def test_vault_selective(tmp_path):
+    import io
+    from kitt.crypto import sealed_size
+    from kitt.vault import VaultFS, dump_vault
+
+    src, config = _secrets(tmp_path, 1000)
+    config['files'].append({'src': str(src), 'dest': '/etc/kube/config', 'name': 'kubeconfig'})
+    config['envs'].append({'name': 'OTHER', 'value': 'other'})
+    output = io.BytesIO()
+    dump_vault(config, password, output, {'name': 'sha256'})
+
+    vault_fs = VaultFS()
+    assert(_read(output.getvalue(), password, vault_fs, ['kubeconfig', 'OTHER']) == {'OTHER': 'other'})
+    assert([bind['bind'] for bind in vault_fs.volumes.values()] == ['/etc/kube/config'])
+    vault_fs.close()
+
+    # Skipped entries are never decrypted, so a corrupted one goes unnoticed
+    raw = bytearray(output.getvalue())
+    raw[-sealed_size(1000) - 10] ^= 1
+    assert(_read(bytes(raw), password, VaultFS(), ['kubeconfig']) == {})
+    assert(_read(bytes(raw), password, VaultFS(), ['keystore']) is None)
+
+    for size in (0, 1, 65536, 65537, 3 * 65536):
+        assert(sealed_size(size) == len(_sealed(size)))
+
+
+def test_vault_entries_concurrent(tmp_path):
+    import io
+    from kitt.crypto import CHUNK_SIZE
+    from kitt.vault import VaultFS, dump_vault, read_vault
+
+    config = {'files': [], 'envs': [{'name': 'TOKEN', 'value': text}]}
+    for index in range(6):
+        src = tmp_path / f'file{ index }'
+        src.write_bytes(os.urandom(index * CHUNK_SIZE + 7))
+        config['files'].append({'src': str(src), 'dest': f'/home/user/file{ index }'})
+    output = io.BytesIO()
+    dump_vault(config, password, output, calibrate_kdf(0))
+
+    class Stream:
+        # Not seekable, entries are decrypted one after another
+        def __init__(self, raw):
+            self.raw = io.BytesIO(raw)
+
+        def read(self, size=-1):
+            return self.raw.read(size)
+
+    for source in (io.BytesIO(output.getvalue()), Stream(output.getvalue())):
+        vault_fs = VaultFS()
+        assert(read_vault(source, password, vault_fs) == {'TOKEN': text})
+        files = {bind['bind']: open(path, 'rb').read() for path, bind in vault_fs.volumes.items()}
+        assert(files == {x['dest']: open(x['src'], 'rb').read() for x in config['files']})
+        vault_fs.close()
+
+
+def _sealed(size):
+    import io
+    from kitt.crypto import CipherWriter
+
+    output = io.BytesIO()
+    writer = CipherWriter(output, os.urandom(32), os.urandom(7))
+    writer.write(b'0' * size)
+    writer.close()
+    return output.getvalue()